@@ -0,0 +1,181 @@
+import os
+import numpy as np
+from pathlib import Path
+from typing import List, Optional
+
+
+class BruteForceBackend:
+    """Exact search over every row; the correctness baseline for other backends."""
+
+    name = 'brute'
+
+    def rebuild(self, matrix: np.ndarray):
+        pass
+
+    def update(self, keep: np.ndarray, new_vectors: np.ndarray, matrix: np.ndarray):
+        pass
+
+    def candidates(self, queries: np.ndarray, probes: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        """Row positions worth scoring for each query; ``None`` means every row."""
+        return [None] * len(queries)
+
+    def save(self, index_dir: Path):
+        pass
+
+    def load(self, index_dir: Path, n_rows: int) -> bool:
+        return True
+
+
+class IVFBackend:
+    """Inverted-file index: rows are bucketed under k-means centroids.
+
+    A query scores only the rows in its ``probes`` nearest buckets, so more
+    probes means higher recall and more work. Inserts are assigned to their
+    nearest existing centroid; the centroids are retrained once the index has
+    doubled since the last training. Below ``min_rows`` rows the backend falls
+    back to exact search, where bucketing buys nothing.
+
+    State is positional: ``assign[i]`` is the bucket of row ``i`` of the
+    section matrix (tombstoned rows included), and is compacted together
+    with the matrix when segments are merged.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, min_rows: int = 20000, default_probes: int = 8, iterations: int = 10, seed: int = 0):
+        self.min_rows = min_rows
+        self.default_probes = default_probes
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.trained_rows = 0
+        self._lists: List[np.ndarray] = []
+
+    def rebuild(self, matrix: np.ndarray):
+        n = len(matrix)
+        if n < self.min_rows:
+            self.centroids = None
+            self.assign = np.empty(0, dtype=np.int32)
+            self.trained_rows = 0
+            self._lists = []
+            return
+        self.centroids = self._train(matrix)
+        self.assign = self._nearest(matrix)
+        self.trained_rows = n
+        self._build_lists()
+
+    def update(self, keep: np.ndarray, new_vectors: np.ndarray, matrix: np.ndarray):
+        n = len(matrix)
+        if self.centroids is None:
+            if n >= self.min_rows:
+                self.rebuild(matrix)
+            return
+        if n >= 2 * self.trained_rows or (len(keep) and keep.max() >= len(self.assign)):
+            self.rebuild(matrix)
+            return
+        parts = [self.assign[keep]]
+        if len(new_vectors):
+            parts.append(self._nearest(new_vectors))
+        self.assign = np.concatenate(parts).astype(np.int32)
+        self._build_lists()
+
+    def candidates(self, queries: np.ndarray, probes: Optional[int] = None) -> List[Optional[np.ndarray]]:
+        if self.centroids is None:
+            return [None] * len(queries)
+        probes = max(1, min(probes or self.default_probes, len(self.centroids)))
+        centroid_scores = queries @ self.centroids.T
+        nearest = np.argpartition(-centroid_scores, probes - 1, axis=1)[:, :probes]
+        return [np.concatenate([self._lists[c] for c in buckets]) for buckets in nearest]
+
+    def save(self, index_dir: Path):
+        centroids_path = index_dir / "ivf_centroids.npy"
+        assign_path = index_dir / "ivf_assign.npy"
+        if self.centroids is None:
+            for path in (centroids_path, assign_path):
+                if path.exists():
+                    path.unlink()
+            return
+        np.save(index_dir / "ivf_centroids.tmp.npy", self.centroids)
+        np.save(index_dir / "ivf_assign.tmp.npy", np.append(self.assign, self.trained_rows).astype(np.int32))
+        os.replace(index_dir / "ivf_centroids.tmp.npy", centroids_path)
+        os.replace(index_dir / "ivf_assign.tmp.npy", assign_path)
+
+    def load(self, index_dir: Path, n_rows: int) -> bool:
+        """Load saved buckets; returns False if they don't match the matrix and need a rebuild."""
+        centroids_path = index_dir / "ivf_centroids.npy"
+        assign_path = index_dir / "ivf_assign.npy"
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self._lists = []
+        if not centroids_path.exists() or not assign_path.exists():
+            return n_rows < self.min_rows
+        try:
+            stored = np.load(assign_path)
+            if len(stored) - 1 != n_rows:
+                return False
+            self.centroids = np.load(centroids_path)
+            self.assign = stored[:-1]
+            self.trained_rows = int(stored[-1])
+            self._build_lists()
+            return True
+        except Exception as e:
+            print(f"Could not load IVF buckets (rebuilding): {e}")
+            self.centroids = None
+            return False
+
+    def _train(self, matrix: np.ndarray) -> np.ndarray:
+        """Spherical k-means on a sample of the rows (only the sample is read into memory)"""
+        rng = np.random.default_rng(self.seed)
+        # 4 * sqrt(n) exceeds n below 16 rows, and each list is seeded from a distinct row
+        n_lists = min(len(matrix), max(1, int(4 * np.sqrt(len(matrix)))))
+        sample_size = min(len(matrix), n_lists * 40)
+        sample = np.asarray(matrix[rng.choice(len(matrix), sample_size, replace=False)], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            if empty.any():
+                # Re-seed buckets that lost all their points
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+                norms[empty] = 1.0
+            centroids = sums / norms
+        return centroids.astype(np.float32)
+
+    def _nearest(self, vectors: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        labels = [np.argmax(np.asarray(vectors[i:i + chunk], dtype=np.float32) @ self.centroids.T, axis=1)
+                  for i in range(0, len(vectors), chunk)]
+        return np.concatenate(labels).astype(np.int32) if labels else np.empty(0, dtype=np.int32)
+
+    def _build_lists(self):
+        order = np.argsort(self.assign, kind='stable')
+        bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+
+def make_backend(name: Optional[str] = None):
+    """Build the ANN backend selected by ``ANN_BACKEND`` (``ivf`` or ``brute``)"""
+    name = (name or os.getenv("ANN_BACKEND", "ivf")).lower()
+    if name == "brute":
+        return BruteForceBackend()
+    if name == "ivf":
+        return IVFBackend(
+            min_rows=int(os.getenv("ANN_MIN_ROWS", "20000")),
+            default_probes=int(os.getenv("ANN_PROBES", "8")),
+        )
+    raise ValueError(f"Unknown ANN_BACKEND: {name}")
+
+
+def recall_at_k(index, query_vectors: np.ndarray, k: int, probes: Optional[int] = None) -> float:
+    """Fraction of the exact top-k rows that the approximate search also returns"""
+    exact = index.search(query_vectors, k, min_score=-np.inf, exact=True)
+    approx = index.search(query_vectors, k, min_score=-np.inf, probes=probes)
+    found = total = 0
+    for exact_hits, approx_hits in zip(exact, approx):
+        expected = {(row['document'], row['position']) for row, _ in exact_hits}
+        found += len(expected & {(row['document'], row['position']) for row, _ in approx_hits})
+        total += len(expected)
+    return found / total if total else 1.0
@@ -0,0 +1,85 @@
+import json
+from typing import List, Dict, Any
+
+# Ratio of medians above which a case counts as slower
+DEFAULT_THRESHOLD = 0.2
+# Differences below this are timer noise, whatever the ratio
+DEFAULT_MIN_DELTA_MS = 0.1
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+            min_delta_ms: float = DEFAULT_MIN_DELTA_MS) -> List[Dict[str, Any]]:
+    """One row per (size, case) in both result files, comparing the p50 timings.
+
+    A row is a ``regression`` when the median grew by more than ``threshold``
+    (a fraction) and by at least ``min_delta_ms``, ``improved`` for the
+    mirror case, and ``ok`` otherwise. Cases only one side has are reported
+    as ``new`` or ``missing`` and never fail a comparison.
+    """
+    rows = []
+    for size, result in current["results"].items():
+        base_cases = baseline["results"].get(size, {}).get("cases", {})
+        cases = result.get("cases", {})
+        for name in sorted(set(cases) | set(base_cases)):
+            row = {"size": size, "case": name, "baseline_ms": None, "current_ms": None, "ratio": None}
+            if name not in base_cases:
+                row.update(current_ms=cases[name]["p50_ms"], status="new")
+            elif name not in cases:
+                row.update(baseline_ms=base_cases[name]["p50_ms"], status="missing")
+            else:
+                old, new = base_cases[name]["p50_ms"], cases[name]["p50_ms"]
+                ratio = new / old if old > 0 else (1.0 if new == 0 else float("inf"))
+                status = "ok"
+                if ratio > 1 + threshold and new - old >= min_delta_ms:
+                    status = "regression"
+                elif ratio < 1 / (1 + threshold) and old - new >= min_delta_ms:
+                    status = "improved"
+                row.update(baseline_ms=old, current_ms=new, ratio=round(ratio, 3), status=status)
+            rows.append(row)
+    return rows
+
+
+def environment_warnings(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Differences between the two runs' environments that make timings incomparable"""
+    warnings = []
+    for field in ("similarity", "python", "machine", "cpu_count"):
+        old, new = baseline.get("meta", {}).get(field), current.get("meta", {}).get(field)
+        if old != new:
+            warnings.append(f"{field} differs: baseline {old!r}, current {new!r}")
+    return warnings
+
+
+def print_report(rows: List[Dict[str, Any]], warnings: List[str] = ()):
+    def fmt(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    print(f"{'size':>7}  {'case':<34} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}  status")
+    for row in rows:
+        print(f"{row['size']:>7}  {row['case']:<34} {fmt(row['baseline_ms']):>12} {fmt(row['current_ms']):>12} "
+              f"{fmt(row['ratio']):>7}  {row['status']}")
+    for warning in warnings:
+        print(f"warning: {warning}")
+    regressions = sum(row["status"] == "regression" for row in rows)
+    print(f"{regressions} regression(s) in {len(rows)} case(s)")
+
+
+def compare_files(current_path: str, baseline_path: str, threshold: float = DEFAULT_THRESHOLD,
+                  min_delta_ms: float = DEFAULT_MIN_DELTA_MS) -> int:
+    """Print the comparison of two result files; returns the number of regressions"""
+    with open(current_path) as f:
+        current = json.load(f)
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, threshold, min_delta_ms)
+    print_report(rows, environment_warnings(current, baseline))
+    return sum(row["status"] == "regression" for row in rows)
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.compare CURRENT.json BASELINE.json [THRESHOLD]
+    import sys
+    if len(sys.argv) < 3:
+        print("Usage: python -m benchmarks.compare current.json baseline.json [threshold]")
+        sys.exit(2)
+    found = compare_files(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_THRESHOLD)
+    sys.exit(1 if found else 0)
@@ -0,0 +1,131 @@
+import json
+import random
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import fitz
+
+# Base-14 fonts, so generated files need no font files: (regular, bold)
+FONTS = [("helv", "hebo"), ("tiro", "tibo"), ("cour", "cobo")]
+NUMBERING = ["decimal", "roman", "chapter", "appendix", "caps", "plain"]
+TOPICS = [
+    "neural networks", "supply chains", "climate models", "tax policy", "protein folding",
+    "urban transit", "query optimisation", "coral reefs", "bond markets", "speech recognition",
+    "battery chemistry", "medieval trade", "vaccine trials", "compiler design", "crop rotation",
+    "satellite imaging", "labour markets", "graph databases", "ocean currents", "cyber security",
+]
+WORDS = ("the results show that a careful analysis of each method reveals clear trade offs between cost "
+         "accuracy and latency while further experiments confirm these findings across datasets").split()
+
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII", "XIII", "XIV", "XV"]
+
+
+def heading_text(style: str, number: int, sub: Optional[int], topic: str) -> str:
+    """Heading in one of the numbering styles the extractor's patterns know about"""
+    if style == "decimal":
+        return f"{number}.{sub} {topic.title()} in practice" if sub else f"{number}. {topic.title()}"
+    if style == "roman":
+        return f"{ROMAN[(number - 1) % len(ROMAN)]}. {topic.title()}" + (f" part {sub}" if sub else "")
+    if style == "chapter":
+        return f"Section {number}.{sub} {topic.title()}" if sub else f"Chapter {number} {topic.title()}"
+    if style == "appendix":
+        return f"Appendix {chr(65 + (number - 1) % 26)} {topic.title()}" + (f" {sub}" if sub else "")
+    if style == "caps":
+        return f"{topic.upper()} OVERVIEW" + (f" {sub}" if sub else "")
+    return f"{topic.capitalize()} and related work" + (f" ({sub})" if sub else "")
+
+
+def make_pdf(path: str, pages: int, headings_per_page: float, lines_per_heading: int, style: str, fonts,
+             seed: int, max_sections: Optional[int] = None) -> Dict[str, int]:
+    """Write a synthetic report; returns how many headings and body lines it holds.
+
+    The extractor turns every line into a section (body lines become
+    subsections of the heading above), so both counts matter for sizing.
+    Writing stops once ``max_sections`` headings and lines are on the page.
+    """
+    max_sections = max_sections or pages * 100
+    rng = random.Random(seed)
+    regular, bold = fitz.Font(fonts[0]), fitz.Font(fonts[1])
+    doc = fitz.open()
+    number, sub, headings, lines = 0, 0, 0, 0
+    for _ in range(pages):
+        page = doc.new_page()
+        writer = fitz.TextWriter(page.rect)
+        y = 60
+        # Carry the fractional part so the density averages out over the document
+        count = int(headings_per_page) + (rng.random() < headings_per_page % 1)
+        for _ in range(count):
+            if headings + lines >= max_sections:
+                break
+            topic = rng.choice(TOPICS)
+            if sub == 0 or rng.random() < 0.3:
+                number, sub = number + 1, 0
+                text, size = heading_text(style, number, None, topic), rng.choice([16, 18, 20])
+            else:
+                text, size = heading_text(style, number, sub, topic), rng.choice([13, 14])
+            sub += 1
+            writer.append((72, y), text, font=bold, fontsize=size)
+            headings += 1
+            y += size + 10
+            for _ in range(lines_per_heading):
+                if y > 780 or headings + lines >= max_sections:
+                    break
+                # Short enough to fit the page width even in Courier
+                body = " ".join(rng.choice(WORDS) for _ in range(6))
+                writer.append((72, y), f"{body.capitalize()} for {topic}.", font=regular, fontsize=10)
+                lines += 1
+                y += 13
+            y += 6
+            if y > 760:
+                break
+        writer.write_text(page)
+    doc.save(path)
+    doc.close()
+    return {"headings": headings, "lines": lines}
+
+
+def build_corpus(out_dir: str, sections: int, seed: int = 0) -> Dict[str, Any]:
+    """Synthetic PDFs that extract to about ``sections`` sections in total.
+
+    Documents vary in page count (1-40), heading density (0.5-4 per page),
+    body lines per heading, fonts and numbering style. The same ``sections`` and ``seed`` always
+    produce the same files; an existing corpus with a matching manifest is
+    reused instead of being generated again.
+    """
+    out = Path(out_dir)
+    manifest_path = out / "manifest.json"
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest["target_sections"] == sections and manifest["seed"] == seed and \
+                all((out / d["file"]).exists() for d in manifest["documents"]):
+            return manifest
+    out.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    documents: List[Dict[str, Any]] = []
+    planned = 0
+    # Every corpus spans at least four documents, so there is something to relate
+    per_document = max(3, -(-sections // 4))
+    while planned < sections:
+        density = rng.choice([0.5, 1, 2, 3, 4])
+        lines_per_heading = rng.choice([1, 2, 4, 8, 15])
+        # About 45 lines fit on a page
+        per_page = max(1, min(45, density * (1 + lines_per_heading)))
+        pages = min(rng.randint(1, 40), max(1, round((sections - planned) / per_page)))
+        style = rng.choice(NUMBERING)
+        fonts = rng.choice(FONTS)
+        name = f"doc{len(documents):05d}.pdf"
+        counts = make_pdf(str(out / name), pages, density, lines_per_heading, style, fonts,
+                          seed * 100003 + len(documents), min(per_document, sections - planned))
+        documents.append({"file": name, "pages": pages, "headings_per_page": density,
+                          "lines_per_heading": lines_per_heading, "numbering": style, "font": fonts[0], **counts})
+        planned += counts["headings"] + counts["lines"]
+    manifest = {"target_sections": sections, "seed": seed, "planned_sections": planned, "documents": documents}
+    manifest_path.write_text(json.dumps(manifest, indent=1))
+    return manifest
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.corpus OUT_DIR SECTIONS [SEED]
+    import sys
+    result = build_corpus(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"{len(result['documents'])} documents, about {result['planned_sections']} sections in {sys.argv[1]}")
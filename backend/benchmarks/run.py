@@ -0,0 +1,293 @@
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Any, Callable
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = "10,1000,10000"
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "pdf-engine-bench-corpus")
+SUITES = ("extract", "stages", "related", "http")
+
+
+def measure(fn: Callable[[int], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Timing summary in milliseconds of ``fn(0)`` .. ``fn(repeat - 1)``.
+
+    The ``warmup`` untimed calls get the indexes after those, so a case that
+    varies its input by index never times an input it has already seen.
+    """
+    for i in range(warmup):
+        fn(repeat + i)
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 4),
+        "p50_ms": round(percentile(0.5), 4),
+        "p95_ms": round(percentile(0.95), 4),
+        "min_ms": round(ordered[0], 4),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallow the application's progress prints while setting up a corpus"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_extract(processor, corpus_dir: Path, manifest: Dict, repeat: int):
+    """Extract every document once (the corpus to query later) and one document repeatedly"""
+    cases = {}
+    extracted, per_page = {}, []
+    start = time.perf_counter()
+    with quiet():
+        for entry in manifest["documents"]:
+            doc_start = time.perf_counter()
+            extracted[entry["file"]] = processor.extract_sections(str(corpus_dir / entry["file"]), page_workers=1)
+            per_page.append((time.perf_counter() - doc_start) * 1000 / entry["pages"])
+    cases["extract_corpus"] = summarize([(time.perf_counter() - start) * 1000])
+    cases["extract_ms_per_page"] = summarize(per_page)
+
+    largest = max(manifest["documents"], key=lambda d: d["pages"])
+    path = str(corpus_dir / largest["file"])
+    cases["extract_sections_largest"] = measure(lambda i: processor.extract_sections(path, page_workers=1),
+                                                max(1, repeat // 4))
+    return cases, extracted, largest
+
+
+def bench_stages(processor, pdf_path: str, repeat: int):
+    """Each heading post-processing stage of ``extract_sections`` on its own"""
+    import fitz
+    doc = fitz.open(pdf_path)
+    try:
+        cases = {"stage_collect_pages": measure(lambda i: processor._collect_pages(doc, 0, len(doc)), repeat)}
+        candidates, lines = processor._collect_pages(doc, 0, len(doc))
+    finally:
+        doc.close()
+    # Level assignment only (re)sets 'level', so it can run on the same list again
+    cases["stage_assign_levels"] = measure(lambda i: processor._assign_heading_levels(candidates), repeat)
+    leveled = processor._assign_heading_levels(candidates)
+    cases["stage_filter_headings"] = measure(lambda i: processor._filter_headings(leveled), repeat)
+    filtered = processor._filter_headings(leveled)
+    cases["stage_reconstruct_phrases"] = measure(lambda i: processor._reconstruct_phrases(filtered), repeat)
+    headings = processor._reconstruct_phrases(filtered)
+    cases["stage_section_contents"] = measure(lambda i: processor._section_contents(lines, headings), repeat)
+    return cases
+
+
+def sample_queries(extracted: Dict[str, List[Dict]], count: int, seed: int) -> List[str]:
+    """``count`` distinct section titles, made unique when the corpus has fewer"""
+    titles = sorted({s["title"] for sections in extracted.values() for s in sections if len(s["title"]) >= 10})
+    rng = random.Random(seed)
+    rng.shuffle(titles)
+    titles = titles or ["related work"]
+    return [titles[i % len(titles)] + (f" {i // len(titles)}" if i >= len(titles) else "") for i in range(count)]
+
+
+def bench_related(processor, catalog, extracted: Dict[str, List[Dict]], queries: List[str], repeat: int):
+    documents = [sections for sections in extracted.values() if sections]
+    return {
+        "find_related_sections": measure(
+            lambda i: processor.find_related_sections(documents[i % len(documents)], catalog), repeat),
+        "find_related_sections_for_section": measure(
+            lambda i: processor.find_related_sections_for_section(queries[i], catalog), repeat),
+    }
+
+
+def bench_http(client, documents: List[str], queries: List[str], repeat: int):
+    """Main read endpoints through the in-process client.
+
+    Search endpoints get a different query per call so the query cache
+    misses; ``*_cached`` cases repeat one query to time the hit path.
+    """
+    def get(url, **params):
+        response = client.get(url, params=params)
+        assert response.status_code == 200, f"{url}: {response.status_code} {response.text[:200]}"
+
+    def post(url, body):
+        response = client.post(url, json=body)
+        assert response.status_code == 200, f"{url}: {response.status_code} {response.text[:200]}"
+
+    def doc(i):
+        return documents[i % len(documents)]
+
+    offset = repeat + 1  # Queries the related-sections case has not used, warm-up included
+    return {
+        "http_health": measure(lambda i: get("/health"), repeat),
+        "http_documents": measure(lambda i: get("/documents"), repeat),
+        "http_sections": measure(lambda i: get(f"/sections/{doc(i)}"), repeat),
+        "http_related_sections": measure(
+            lambda i: get(f"/related-sections/{doc(i)}", section_text=queries[i]), repeat),
+        "http_related_sections_cached": measure(
+            lambda i: get(f"/related-sections/{doc(0)}", section_text=queries[0]), repeat),
+        "http_insights": measure(
+            lambda i: post("/insights", {"selected_text": queries[offset + i]}), repeat),
+        "http_related_for_document": measure(lambda i: get(f"/related-for-document/{doc(i)}"), repeat),
+    }
+
+
+def run_size(size: int, args) -> Dict[str, Any]:
+    """Benchmark one corpus size; runs in its own process because ``main`` keeps global state"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from benchmarks.corpus import build_corpus
+
+    corpus_dir = Path(args.corpus_dir).resolve() / f"sections-{size}-seed-{args.seed}"
+    print(f"[{size}] building corpus in {corpus_dir}", file=sys.stderr)
+    manifest = build_corpus(str(corpus_dir), size, args.seed)
+
+    # The app keeps uploads and its catalog under the working directory
+    workdir = tempfile.mkdtemp(prefix="pdf-engine-bench-")
+    atexit.register(shutil.rmtree, workdir, True)
+    os.chdir(workdir)
+    os.environ["WARMUP_ON_STARTUP"] = "0"
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["TTS_PROVIDER"] = "fake"
+    with quiet():
+        import main
+
+    suites = set(args.only.split(",")) if args.only else set(SUITES)
+    processor, catalog = main.pdf_processor, main.catalog
+    cases = {}
+    print(f"[{size}] extracting {len(manifest['documents'])} documents", file=sys.stderr)
+    extract_cases, extracted, largest = bench_extract(processor, corpus_dir, manifest, args.repeat)
+    if "extract" in suites:
+        cases.update(extract_cases)
+    if "stages" in suites:
+        cases.update(bench_stages(processor, str(corpus_dir / largest["file"]), args.repeat))
+
+    print(f"[{size}] loading the catalog, section index and related-sections graph", file=sys.stderr)
+    start = time.perf_counter()
+    with quiet():
+        for filename, sections in extracted.items():
+            catalog.upsert_document(filename, sections, file_path=str(corpus_dir / filename))
+    cases["catalog_load"] = summarize([(time.perf_counter() - start) * 1000])
+    start = time.perf_counter()
+    with quiet():
+        main.run_warmup()
+    cases["warmup_index_and_graph"] = summarize([(time.perf_counter() - start) * 1000])
+
+    queries = sample_queries(extracted, 3 * args.repeat + 4, args.seed)
+    if "related" in suites:
+        print(f"[{size}] related sections", file=sys.stderr)
+        cases.update(bench_related(processor, catalog, extracted, queries, args.repeat))
+    if "http" in suites:
+        print(f"[{size}] HTTP endpoints", file=sys.stderr)
+        from fastapi.testclient import TestClient
+        with quiet(), TestClient(main.app) as client:
+            cases.update(bench_http(client, sorted(extracted), queries, args.repeat))
+
+    sections = sum(len(s) for s in extracted.values())
+    return {
+        "corpus": {"documents": len(manifest["documents"]), "pages": sum(d["pages"] for d in manifest["documents"]),
+                   "sections": sections, "target_sections": size, "seed": args.seed},
+        "similarity": processor.similarity_tag,
+        "cases": cases,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark extraction, related-section search and the HTTP API")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated corpus sizes in sections, 10 to 50000 (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per case (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed; same seed, same PDFs")
+    parser.add_argument("--only", help=f"comma-separated subset of {','.join(SUITES)}")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR,
+                        help="where generated corpora are kept and reused (default %(default)s)")
+    parser.add_argument("--output", default="benchmark-results.json", help="result file (default %(default)s)")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against this result file")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="allowed slowdown of a case's median as a fraction (default 0.2)")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        result = run_size(args.child, args)
+        with open(args.child_output, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    from benchmarks.compare import compare_files, DEFAULT_THRESHOLD
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results, similarity = {}, None
+    for size in sizes:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            child_output = f.name
+        command = [sys.executable, "-m", "benchmarks.run", "--child", str(size), "--child-output", child_output,
+                   "--repeat", str(args.repeat), "--seed", str(args.seed), "--corpus-dir", os.path.abspath(args.corpus_dir)]
+        if args.only:
+            command += ["--only", args.only]
+        start = time.perf_counter()
+        completed = subprocess.run(command, cwd=BACKEND_DIR)
+        if completed.returncode != 0:
+            print(f"Benchmark for {size} sections failed (exit {completed.returncode})")
+            return completed.returncode
+        with open(child_output) as f:
+            result = json.load(f)
+        os.remove(child_output)
+        similarity = result.pop("similarity")
+        results[str(size)] = result
+        print(f"{size} sections: {result['corpus']['documents']} documents, {result['corpus']['sections']} "
+              f"extracted, {len(result['cases'])} cases in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "similarity": similarity,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        threshold = DEFAULT_THRESHOLD if args.threshold is None else args.threshold
+        return 1 if compare_files(args.output, args.compare, threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.run --sizes 10,1000 --output results.json [--compare baseline.json]
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    sha256 TEXT,
+    file_path TEXT,
+    sections_count INTEGER NOT NULL DEFAULT 0,
+    uploaded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents(sha256);
+
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    level TEXT,
+    page INTEGER,
+    content TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sections_document ON sections(document_id, position);
+CREATE INDEX IF NOT EXISTS idx_sections_page ON sections(document_id, page);
+CREATE INDEX IF NOT EXISTS idx_sections_level ON sections(level);
+
+-- Precomputed related-sections graph: the k nearest sections of other
+-- documents for every section, plus the documents it has been built for
+CREATE TABLE IF NOT EXISTS section_neighbors (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    neighbor_document TEXT NOT NULL,
+    neighbor_position INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (document_id, position, rank)
+);
+CREATE INDEX IF NOT EXISTS idx_neighbors_target ON section_neighbors(neighbor_document);
+
+CREATE TABLE IF NOT EXISTS graph_documents (
+    document_id INTEGER PRIMARY KEY REFERENCES documents(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('corpus_version', '0');
+"""
+
+
+class Catalog:
+    """SQLite catalog of processed documents and their sections.
+
+    Replaces the one-JSON-file-per-document layout of processed/: listing
+    reads only the ``documents`` table, and section fetches are indexed by
+    document, page and level. The database runs in WAL mode so the ingest
+    writer never blocks readers. Connections are per thread.
+
+    Every write bumps ``corpus_version`` so in-memory caches (in this or
+    another process) can tell cheaply whether the corpus changed.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.data_dir = self.db_path.parent
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def upsert_document(self, filename: str, sections: List[Dict[str, Any]], file_path: Optional[str] = None,
+                        sha256: Optional[str] = None, uploaded_at: Optional[float] = None):
+        """Store a document and replace all of its sections in one transaction"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+            cursor = conn.execute(
+                "INSERT INTO documents (filename, sha256, file_path, sections_count, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+                (filename, sha256, file_path, len(sections), uploaded_at or time.time()),
+            )
+            document_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO sections (document_id, position, title, level, page, content) VALUES (?, ?, ?, ?, ?, ?)",
+                [(document_id, position, s['title'], s.get('level'), s.get('page'), s.get('content'))
+                 for position, s in enumerate(sections)],
+            )
+            self._bump_version(conn)
+
+    def delete_document(self, filename: str) -> bool:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+            if cursor.rowcount:
+                self._bump_version(conn)
+        return cursor.rowcount > 0
+
+    def _bump_version(self, conn: sqlite3.Connection):
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'corpus_version'")
+
+    def corpus_version(self) -> int:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'corpus_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT filename, sections_count, uploaded_at FROM documents ORDER BY uploaded_at"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def all_documents(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT filename, sha256, file_path, sections_count, uploaded_at FROM documents ORDER BY uploaded_at"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def document_names(self) -> List[str]:
+        return [row[0] for row in self._connect().execute("SELECT filename FROM documents")]
+
+    def get_document(self, filename: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT filename, sha256, file_path, sections_count, uploaded_at FROM documents WHERE filename = ?",
+            (filename,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get_sections(self, filename: str, page: Optional[int] = None,
+                     level: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Sections of one document in reading order, optionally narrowed to a page or level"""
+        query = ("SELECT s.title, s.level, s.page, s.content FROM sections s "
+                 "JOIN documents d ON d.id = s.document_id WHERE d.filename = ?")
+        params: list = [filename]
+        if page is not None:
+            query += " AND s.page = ?"
+            params.append(page)
+        if level is not None:
+            query += " AND s.level = ?"
+            params.append(level)
+        query += " ORDER BY s.position"
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def get_section_contents(self, filename: str) -> List[Optional[str]]:
+        """Section bodies of one document in reading order"""
+        rows = self._connect().execute(
+            "SELECT s.content FROM sections s JOIN documents d ON d.id = s.document_id "
+            "WHERE d.filename = ? ORDER BY s.position",
+            (filename,),
+        )
+        return [row[0] for row in rows]
+
+    def iter_sections(self, filenames: Optional[List[str]] = None) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield ``(filename, sections)`` for the given documents (default: all)"""
+        for filename in (filenames if filenames is not None else self.document_names()):
+            yield filename, self.get_sections(filename)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def replace_neighbors(self, lists: Dict[Tuple[str, int], List[Tuple[str, int, float]]],
+                          built: Optional[List[str]] = None):
+        """Replace the neighbour lists of the given ``(filename, position)`` sections.
+
+        Each list holds ``(neighbor_filename, neighbor_position, score)`` best
+        first. Documents named in ``built`` are marked as having their lists.
+        """
+        conn = self._connect()
+        with conn:
+            ids = {row[0]: row[1] for row in conn.execute("SELECT filename, id FROM documents")}
+            for (filename, position), neighbors in lists.items():
+                document_id = ids.get(filename)
+                if document_id is None:
+                    continue
+                conn.execute("DELETE FROM section_neighbors WHERE document_id = ? AND position = ?",
+                             (document_id, position))
+                conn.executemany(
+                    "INSERT INTO section_neighbors (document_id, position, rank, neighbor_document, "
+                    "neighbor_position, score) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(document_id, position, rank, n_file, n_pos, score)
+                     for rank, (n_file, n_pos, score) in enumerate(neighbors)],
+                )
+            conn.executemany("INSERT OR IGNORE INTO graph_documents (document_id) VALUES (?)",
+                             [(ids[f],) for f in built or [] if f in ids])
+
+    def get_neighbor_lists(self, keys: List[Tuple[str, int]]) -> Dict[Tuple[str, int], List[Tuple[str, int, float]]]:
+        wanted = set(keys)
+        lists: Dict[Tuple[str, int], List[Tuple[str, int, float]]] = {}
+        for filename in {filename for filename, _ in wanted}:
+            rows = self._connect().execute(
+                "SELECT n.position, n.neighbor_document, n.neighbor_position, n.score FROM section_neighbors n "
+                "JOIN documents d ON d.id = n.document_id WHERE d.filename = ? ORDER BY n.position, n.rank",
+                (filename,),
+            )
+            for position, n_file, n_pos, score in rows:
+                if (filename, position) in wanted:
+                    lists.setdefault((filename, position), []).append((n_file, n_pos, score))
+        return lists
+
+    def sections_referencing(self, filename: str) -> List[Tuple[str, int]]:
+        """Sections of other documents whose neighbour lists point into ``filename``"""
+        rows = self._connect().execute(
+            "SELECT DISTINCT d.filename, n.position FROM section_neighbors n "
+            "JOIN documents d ON d.id = n.document_id WHERE n.neighbor_document = ? AND d.filename != ?",
+            (filename, filename),
+        )
+        return [(row[0], row[1]) for row in rows]
+
+    def graph_documents(self) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT d.filename FROM graph_documents g JOIN documents d ON d.id = g.document_id"
+        )
+        return [row[0] for row in rows]
+
+    def clear_graph(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM section_neighbors")
+            conn.execute("DELETE FROM graph_documents")
+
+    def get_related(self, filename: str, position: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stored neighbours of a document's sections, joined with the neighbour sections"""
+        query = ("SELECT n.position, n.rank, n.neighbor_document, n.neighbor_position, n.score, "
+                 "ns.title, ns.page, ns.content FROM section_neighbors n "
+                 "JOIN documents d ON d.id = n.document_id "
+                 "JOIN documents nd ON nd.filename = n.neighbor_document "
+                 "JOIN sections ns ON ns.document_id = nd.id AND ns.position = n.neighbor_position "
+                 "WHERE d.filename = ?")
+        params: list = [filename]
+        if position is not None:
+            query += " AND n.position = ?"
+            params.append(position)
+        query += " ORDER BY n.position, n.rank"
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def import_json_dir(self, processed_dir: str) -> int:
+        """One-time migration of legacy processed/*.json files not yet in the catalog"""
+        known = set(self.document_names())
+        imported = 0
+        for doc_file in Path(processed_dir).glob("*.json"):
+            # Legacy files are named "<filename>.json"; skip known ones without parsing them
+            if doc_file.stem in known:
+                continue
+            try:
+                with open(doc_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data["filename"] in known:
+                    continue
+                self.upsert_document(data["filename"], data.get("sections", []), data.get("file_path"),
+                                     data.get("sha256"), doc_file.stat().st_mtime)
+                imported += 1
+            except Exception as e:
+                print(f"Could not import {doc_file} into the catalog: {e}")
+        return imported
@@ -0,0 +1,136 @@
+import os
+import re
+import hashlib
+from typing import List, Dict, Any, Optional
+
+# Budgets are in estimated tokens (see estimate_tokens)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+CHAT_CONTEXT_TOP_K = int(os.getenv("CHAT_CONTEXT_TOP_K", "6"))
+CHAT_SECTION_TOKENS = int(os.getenv("CHAT_SECTION_TOKENS", "400"))
+CHAT_SELECTION_TOKENS = int(os.getenv("CHAT_SELECTION_TOKENS", "400"))
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+
+CHARS_PER_TOKEN = 4
+# Excerpts shorter than this are not worth including
+MIN_EXCERPT_TOKENS = 24
+
+INSTRUCTIONS = (
+    "You are an AI assistant helping with document analysis. Answer from the document "
+    "excerpts below and cite the excerpt numbers you used; if they do not cover the "
+    "question, say so. Provide helpful, concise responses."
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut ``text`` to about ``tokens`` tokens, at a word boundary"""
+    text = _WHITESPACE.sub(" ", text).strip()
+    limit = max(tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:max(limit - 3, 0)]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + "..."
+
+
+def retrieval_query(messages: List[Dict[str, str]], selected_text: str = "") -> str:
+    """What to retrieve for: the selection if there is one, else the latest user message.
+
+    Keying on the selection keeps the retrieved context (and so the prompt
+    prefix) identical across the turns of a conversation about it.
+    """
+    if selected_text.strip():
+        return truncate_to_tokens(selected_text, CHAT_SELECTION_TOKENS)
+    for message in reversed(messages):
+        if message.get("role") == "user" and message.get("content", "").strip():
+            return truncate_to_tokens(message["content"], CHAT_SELECTION_TOKENS)
+    return ""
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(_WHITESPACE.sub(" ", text).strip().lower().encode("utf-8")).hexdigest()
+
+
+def build_context(processor, catalog, corpus, query: str, selected_text: str = "",
+                  document_context: str = "", budget: Optional[int] = None,
+                  top_k: Optional[int] = None) -> Dict[str, Any]:
+    """System prompt grounded in the sections most relevant to ``query``.
+
+    The prompt is laid out stable-parts-first (instructions, current
+    document, selection, then the numbered excerpts) and packed into
+    ``budget`` tokens: each excerpt is capped at ``CHAT_SECTION_TOKENS``,
+    the same section or identical text (e.g. a PDF uploaded under two
+    names) is included once, and the excerpt that no longer fits is cut.
+    Returns the prompt, its sources and its estimated size.
+    """
+    budget = budget or CHAT_CONTEXT_TOKENS
+    top_k = top_k or CHAT_CONTEXT_TOP_K
+    parts = [INSTRUCTIONS]
+    if document_context:
+        parts.append(f"Current document: {truncate_to_tokens(document_context, 50)}")
+    selection = truncate_to_tokens(selected_text, CHAT_SELECTION_TOKENS) if selected_text else ""
+    if selection:
+        parts.append(f"Selected text:\n{selection}")
+    remaining = budget - sum(estimate_tokens(p) + 1 for p in parts)
+
+    hits = []
+    if query:
+        try:
+            # Extra candidates make up for the ones dropped as duplicates
+            hits = processor.search_sections([query], top_k * 2, catalog)[0]
+        except Exception as e:
+            print(f"Chat retrieval failed: {e}")
+
+    seen = {_fingerprint(selection)} if selection else set()
+    documents: Dict[str, List[Dict[str, Any]]] = {}
+    excerpts, sources = [], []
+    for row, score in hits:
+        if len(sources) >= top_k:
+            break
+        if row['document'] not in documents:
+            documents[row['document']] = corpus.get_sections(row['document'])
+        sections = documents[row['document']]
+        if row['position'] >= len(sections):
+            continue
+        text = sections[row['position']].get('content') or row['title']
+        fingerprint = _fingerprint(text)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        header = f"[{len(sources) + 1}] {row['document']}, page {row['page']}: {row['title']}"
+        room = min(CHAT_SECTION_TOKENS, remaining - estimate_tokens(header) - 2)
+        if room < MIN_EXCERPT_TOKENS:
+            break
+        body = truncate_to_tokens(text, room)
+        excerpt = header if body == row['title'].strip() else f"{header}\n{body}"
+        remaining -= estimate_tokens(excerpt) + 2
+        excerpts.append(excerpt)
+        sources.append({'document': row['document'], 'position': row['position'], 'title': row['title'],
+                        'page': row['page'], 'similarity_score': round(float(score), 4)})
+
+    if excerpts:
+        parts.append("Document excerpts:\n\n" + "\n\n".join(excerpts))
+    system = "\n\n".join(parts)
+    return {'system': system, 'sources': sources, 'prompt_tokens': estimate_tokens(system)}
+
+
+def fit_history(messages: List[Dict[str, str]], budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """The most recent messages that fit in ``budget`` tokens (the latest is always kept, cut if needed)"""
+    budget = budget or CHAT_HISTORY_TOKENS
+    kept = []
+    for message in reversed([m for m in messages if m.get("role") in ("user", "assistant")]):
+        tokens = estimate_tokens(message.get("content", ""))
+        if tokens > budget:
+            if not kept:
+                kept.append({"role": message["role"], "content": truncate_to_tokens(message["content"], budget)})
+            break
+        kept.append({"role": message["role"], "content": message.get("content", "")})
+        budget -= tokens
+    return list(reversed(kept))
@@ -1,6 +1,7 @@
 import os
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Iterator, Tuple
 
 
 def chat_with_llm(messages: List[Dict[str, str]]) -> Dict[str, Any]:
@@ -13,6 +14,13 @@ def chat_with_llm(messages: List[Dict[str, str]]) -> Dict[str, Any]:
     provider = os.getenv("LLM_PROVIDER", "").lower()
     model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
+    if provider == "fake":
+        return {
+            "provider": provider,
+            "model": "fake",
+            "choices": [{"message": {"role": "assistant", "content": _fake_reply(messages)}}]
+        }
+
     # Fallback/local stub when no provider or offline
     if provider not in {"gemini", "gcp", "openai", "ollama"}:
         prompt = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
@@ -50,18 +58,14 @@ def chat_with_llm(messages: List[Dict[str, str]]) -> Dict[str, Any]:
             }
 
         if provider == "ollama":
-            # Call local Ollama if available
-            import subprocess
-            import tempfile
-            prompt = "\n\n".join(m.get("content", "") for m in messages)
-            with tempfile.NamedTemporaryFile("w", delete=False) as f:
-                f.write(prompt)
-                prompt_file = f.name
+            # Local Ollama over its REST API, on a shared keep-alive connection pool
+            import ollama_client
             model_name = os.getenv("OLLAMA_MODEL", "llama3")
             try:
-                out = subprocess.check_output(["ollama", "run", model_name, prompt])
-                text = out.decode("utf-8", errors="ignore")
-            except Exception:
+                text = ollama_client.chat(model_name, messages)
+            except ollama_client.OllamaError as e:
+                print(f"Ollama unavailable: {e}")
+                prompt = "\n\n".join(m.get("content", "") for m in messages)
                 text = f"[ollama-unavailable] {prompt[:400]}"
             return {
                 "provider": provider,
@@ -86,6 +90,81 @@ def chat_with_llm(messages: List[Dict[str, str]]) -> Dict[str, Any]:
         }
 
 
+# Replies produced without reaching a provider; not worth caching
+FALLBACK_PREFIXES = ("[offline]", "[no-sdk]", "[generic]", "[error]", "[ollama-unavailable]")
+
+
+def is_fallback_reply(content: str) -> bool:
+    return not content or content.startswith(FALLBACK_PREFIXES)
+
+
+def llm_provider_and_model() -> Tuple[str, str]:
+    """Provider and model name as reported alongside replies"""
+    provider = os.getenv("LLM_PROVIDER", "").lower()
+    if provider == "ollama":
+        return provider, os.getenv("OLLAMA_MODEL", "llama3")
+    if provider == "fake":
+        return provider, "fake"
+    return provider or "none", os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+
+def _fake_reply(messages: List[Dict[str, str]]) -> str:
+    prompt = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    return f"[fake] You asked about: {prompt[:400]}"
+
+
+def stream_chat_with_llm(messages: List[Dict[str, str]]) -> Iterator[str]:
+    """Yield the assistant reply in pieces as the provider produces them.
+
+    Gemini and Ollama stream natively. ``LLM_PROVIDER=fake`` emits a canned
+    reply word by word every ``FAKE_LLM_DELAY_MS`` for local testing; the
+    offline stubs yield their whole reply at once. Closing the generator
+    stops the provider, e.g. when the client has gone away.
+    """
+    provider, model = llm_provider_and_model()
+
+    if provider == "fake":
+        delay = float(os.getenv("FAKE_LLM_DELAY_MS", "20")) / 1000.0
+        words = _fake_reply(messages).split(" ")
+        for i, word in enumerate(words):
+            time.sleep(delay)
+            yield word if i == len(words) - 1 else word + " "
+        return
+
+    if provider in {"gemini", "gcp"}:
+        try:
+            import google.generativeai as genai
+        except Exception:
+            yield chat_with_llm(messages)["choices"][0]["message"]["content"]
+            return
+        genai.configure()  # credentials via GOOGLE_APPLICATION_CREDENTIALS
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        user_parts = [m["content"] for m in messages if m["role"] == "user"]
+        prompt = (system + "\n" if system else "") + "\n\n".join(user_parts)
+        for chunk in genai.GenerativeModel(model).generate_content(prompt, stream=True):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+        return
+
+    if provider == "ollama":
+        import ollama_client
+        started = False
+        try:
+            for delta in ollama_client.stream_chat(model, messages):
+                started = True
+                yield delta
+        except ollama_client.OllamaError as e:
+            if started:
+                raise
+            print(f"Ollama unavailable: {e}")
+            prompt = "\n\n".join(m.get("content", "") for m in messages)
+            yield f"[ollama-unavailable] {prompt[:400]}"
+        return
+
+    yield chat_with_llm(messages)["choices"][0]["message"]["content"]
+
+
 if __name__ == "__main__":
     import sys
     sample_prompt = " ".join(sys.argv[1:]) or "Summarize this content."
@@ -0,0 +1,136 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+# Ceiling on section bodies held in memory; titles and metadata are always kept
+CORPUS_CACHE_MAX_BYTES = int(os.getenv("CORPUS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class CorpusCache:
+    """Shared in-memory view of the catalog for the request path.
+
+    Document metadata and section outlines (title, level, page) are loaded
+    once and stay resident. Section bodies are kept in an LRU bounded by
+    ``max_content_bytes`` and re-read from the catalog only when evicted.
+
+    Entries are refreshed per document: the ingest path calls
+    ``invalidate`` directly, and every read compares the catalog's
+    ``corpus_version`` so writes from other processes are picked up too;
+    only documents whose ``uploaded_at`` changed (or that disappeared) are
+    dropped.
+    """
+
+    def __init__(self, catalog, max_content_bytes: Optional[int] = None):
+        self.catalog = catalog
+        self.max_content_bytes = CORPUS_CACHE_MAX_BYTES if max_content_bytes is None else max_content_bytes
+        self._lock = threading.RLock()
+        self._version = None
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._outlines: Dict[str, List[Dict[str, Any]]] = {}
+        self._content: "OrderedDict[str, List[Optional[str]]]" = OrderedDict()
+        self._content_sizes: Dict[str, int] = {}
+        self._content_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            return [{"filename": d["filename"], "sections_count": d["sections_count"],
+                     "uploaded_at": d["uploaded_at"]} for d in self._documents.values()]
+
+    def get_document(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            document = self._documents.get(filename)
+            return dict(document) if document else None
+
+    def get_outline(self, filename: str) -> List[Dict[str, Any]]:
+        """Sections without their bodies; never touches the content LRU"""
+        with self._lock:
+            self._sync()
+            return [dict(s) for s in self._load_outline(filename)]
+
+    def get_sections(self, filename: str) -> List[Dict[str, Any]]:
+        """Sections of one document in reading order, bodies included"""
+        with self._lock:
+            self._sync()
+            contents = self._content.get(filename) if filename in self._outlines else None
+            if contents is not None:
+                self.hits += 1
+                self._content.move_to_end(filename)
+            outline = self._load_outline(filename)
+            if contents is None:
+                self.misses += 1
+                contents = self._content.get(filename)
+                if contents is None:
+                    contents = self.catalog.get_section_contents(filename)
+                    self._remember_content(filename, contents)
+            return [dict(s, content=c) for s, c in zip(outline, contents)]
+
+    def invalidate(self, filename: Optional[str] = None):
+        """Forget one document (or everything) after it was written"""
+        with self._lock:
+            if filename is None:
+                self._version = None
+                self._outlines.clear()
+                self._content.clear()
+                self._content_sizes.clear()
+                self._content_bytes = 0
+                return
+            self._forget(filename)
+            self._version = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "outlines": len(self._outlines),
+                "content_documents": len(self._content),
+                "content_bytes": self._content_bytes,
+                "max_content_bytes": self.max_content_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _sync(self):
+        version = self.catalog.corpus_version()
+        if version == self._version:
+            return
+        documents = {d["filename"]: d for d in self.catalog.all_documents()}
+        for filename, old in self._documents.items():
+            new = documents.get(filename)
+            if new is None or new["uploaded_at"] != old["uploaded_at"]:
+                self._forget(filename)
+        self._documents = documents
+        self._version = version
+
+    def _load_outline(self, filename: str) -> List[Dict[str, Any]]:
+        outline = self._outlines.get(filename)
+        if outline is None:
+            if filename not in self._documents:
+                return []
+            sections = self.catalog.get_sections(filename)
+            outline = [{"title": s["title"], "level": s["level"], "page": s["page"]} for s in sections]
+            self._outlines[filename] = outline
+            self._remember_content(filename, [s["content"] for s in sections])
+        return outline
+
+    def _remember_content(self, filename: str, contents: List[Optional[str]]):
+        if filename in self._content:
+            return
+        size = sum(len(c.encode("utf-8")) for c in contents if c)
+        if size > self.max_content_bytes:
+            return
+        self._content[filename] = contents
+        self._content_sizes[filename] = size
+        self._content_bytes += size
+        while self._content_bytes > self.max_content_bytes:
+            evicted, _ = self._content.popitem(last=False)
+            self._content_bytes -= self._content_sizes.pop(evicted)
+
+    def _forget(self, filename: str):
+        self._outlines.pop(filename, None)
+        if self._content.pop(filename, None) is not None:
+            self._content_bytes -= self._content_sizes.pop(filename)
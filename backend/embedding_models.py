@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# torch (sentence-transformers, the reference), onnx (fp32, same vectors) or onnx-int8 (quantized)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models")
+# Lowest cosine similarity to the reference vectors each backend must reach
+PARITY_THRESHOLDS = {"onnx": 0.9999, "onnx-int8": 0.98}
+# Headings and sentences like those in section titles and queries
+PARITY_TEXTS = [
+    "Introduction to machine learning", "Results and discussion", "Appendix A: survey questions",
+    "The quarterly revenue grew by twelve percent compared to the previous year.",
+    "Table 3 lists the hyperparameters used for every experiment in this section.",
+    "CHAPTER 2 RELATED WORK", "How do transformers handle long documents?",
+    "Methods", "Conclusion and future directions for sparse retrieval",
+]
+
+
+def model_tag(model_name: str, backend: str) -> str:
+    """Identifier stored with the section index.
+
+    fp32 ONNX reproduces the PyTorch vectors, so both share the plain model
+    name and an index built by one is reused by the other. Quantized vectors
+    drift slightly, so int8 gets its own tag and the index is re-embedded
+    when switching to or from it.
+    """
+    return f"{model_name}:int8" if backend == "onnx-int8" else model_name
+
+
+class OnnxEmbeddingModel:
+    """Sentence embeddings from an exported ONNX transformer on ONNX Runtime (CPU).
+
+    Reproduces the sentence-transformers pipeline of the MiniLM models
+    (tokenize, transformer, attention-masked mean pooling, optional L2
+    normalisation) without importing torch, and offers the subset of
+    ``SentenceTransformer.encode`` that ``PDFProcessor`` uses.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        with open(self.model_dir / "export.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.max_seq_length = meta["max_seq_length"]
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=meta.get("pad_id", 0), pad_token=meta.get("pad_token", "[PAD]"))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(os.getenv("ONNX_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = self.model_dir / ("model.int8.onnx" if quantized else "model.onnx")
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 64, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Length-sorted batches waste less work on padding
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            chunk = order[start:start + batch_size]
+            for i, vector in zip(chunk, self._embed([texts[i] for i in chunk])):
+                out[i] = vector
+        vectors = np.stack(out).astype(np.float32)
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def export_onnx(model_name: str, model_dir: Optional[str] = None, quantize: bool = True) -> Path:
+    """Export ``model_name``'s transformer to ONNX (plus a dynamically quantized int8 copy).
+
+    A one-off step that needs torch and sentence-transformers, run with
+    ``python embedding_models.py export`` (or at image build time); serving
+    the exported files needs only onnxruntime and tokenizers.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(model_dir or Path(ONNX_MODEL_DIR) / model_name)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    reference = SentenceTransformer(model_name, device="cpu")
+    transformer = reference[0].auto_model.eval()
+    tokenizer = reference.tokenizer
+    tokenizer.save_pretrained(str(out_dir))
+
+    sample = tokenizer(["an example sentence to trace the graph"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[name] for name in names), str(out_dir / "model.onnx"),
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=14)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(str(out_dir / "model.onnx"), str(out_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    with open(out_dir / "export.json", "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "max_seq_length": reference.max_seq_length,
+                   "pad_id": tokenizer.pad_token_id, "pad_token": tokenizer.pad_token}, f)
+    return out_dir
+
+
+def onnx_export_ready(model_name: str, backend: str) -> bool:
+    """Whether ``ONNX_MODEL_DIR`` holds the exported files ``backend`` loads"""
+    model_dir = Path(ONNX_MODEL_DIR) / model_name
+    model_file = "model.int8.onnx" if backend == "onnx-int8" else "model.onnx"
+    return all((model_dir / name).exists() for name in (model_file, "export.json", "tokenizer.json"))
+
+
+def load_embedding_model(model_name: str, backend: Optional[str] = None) -> Tuple[object, str]:
+    """Load the configured embedding backend; returns ``(model, backend)``.
+
+    ONNX models are never exported here, since that needs torch; if the
+    export is missing or cannot be loaded, the PyTorch model is used
+    instead, with a warning saying how to export it.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend in ("onnx", "onnx-int8"):
+        model_dir = Path(ONNX_MODEL_DIR) / model_name
+        if not onnx_export_ready(model_name, backend):
+            print(f"WARNING: EMBEDDING_BACKEND={backend} but {model_dir} has no ONNX export; using torch. "
+                  f"Export it once with 'python embedding_models.py export' (needs torch).")
+        else:
+            try:
+                return OnnxEmbeddingModel(str(model_dir), quantized=backend == "onnx-int8"), backend
+            except Exception as e:
+                print(f"WARNING: could not load the {backend} embedding backend (using torch): {e}")
+    elif backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device="cpu"), "torch"
+
+
+def check_parity(candidate, reference, texts: List[str]) -> dict:
+    """Cosine similarity between candidate and reference embeddings of the same texts"""
+    a = candidate.encode(texts, normalize_embeddings=True)
+    b = reference.encode(texts, normalize_embeddings=True)
+    cosines = np.sum(np.asarray(a) * np.asarray(b), axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+
+if __name__ == "__main__":
+    # Export the ONNX models, or check a backend's parity with the PyTorch reference:
+    #   python embedding_models.py export [MODEL_DIR]
+    #   python embedding_models.py [onnx|onnx-int8]
+    import sys
+    import resource
+    from pdf_processor import MODEL_NAME
+
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        print(f"Exported {MODEL_NAME} to {export_onnx(MODEL_NAME, sys.argv[2] if len(sys.argv) > 2 else None)}")
+        sys.exit()
+
+    backend = sys.argv[1] if len(sys.argv) > 1 else "onnx-int8"
+    texts = PARITY_TEXTS * 8
+
+    def timed(model) -> float:
+        model.encode(texts[:4])
+        start = time.perf_counter()
+        for _ in range(5):
+            model.encode(texts, normalize_embeddings=True)
+        return (time.perf_counter() - start) / 5 * 1000
+
+    candidate, loaded = load_embedding_model(MODEL_NAME, backend)
+    if loaded != backend:
+        sys.exit(f"{backend} backend unavailable")
+    candidate_ms = timed(candidate)
+    candidate_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    reference, _ = load_embedding_model(MODEL_NAME, "torch")
+    reference_ms = timed(reference)
+    parity = check_parity(candidate, reference, texts)
+    print(f"{backend}: {candidate_ms:.1f} ms/batch, peak RSS {candidate_rss:.0f} MB before torch was loaded")
+    print(f"torch: {reference_ms:.1f} ms/batch")
+    print(f"min cosine {parity['min_cosine']:.5f}, mean cosine {parity['mean_cosine']:.5f}")
+    if parity["min_cosine"] < PARITY_THRESHOLDS[backend]:
+        sys.exit(f"parity check failed: below {PARITY_THRESHOLDS[backend]}")
+    print("parity check passed")
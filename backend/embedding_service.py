@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Any, Optional
+import metrics
+
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent encode calls into one batched model call.
+
+    Callers (search pool threads) block in ``encode``; a dispatcher thread
+    takes every waiting request (up to ``max_batch_size`` texts), runs a
+    single ``encode_fn`` over all of them and hands each caller its slice of
+    the result. Requests that arrive while a batch is encoding form the
+    next one. The dispatcher only holds a batch back, for at most
+    ``max_wait_ms``, while a caller has entered ``encode`` but not queued
+    yet, so a lone caller never waits for company that cannot come. Each
+    request's queue wait and each batch's encode time are recorded as the
+    ``embedding_queue_wait`` and ``embedding_batch`` metric stages and
+    summarised by ``stats``.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size or EMBED_BATCH_MAX
+        self.max_wait = (EMBED_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Callers inside encode() whose request has not been taken into a batch yet
+        self._arriving = 0
+        self._batches = 0
+        self._requests = 0
+        self._texts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._encode_total = 0.0
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed ``texts`` as part of the next batch; blocks until the vectors are ready"""
+        future = Future()
+        self._ensure_thread()
+        with self._lock:
+            self._arriving += 1
+        self._queue.put((list(texts), future, time.perf_counter()))
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self._batches,
+                "requests": self._requests,
+                "texts": self._texts,
+                "queued": self._queue.qsize(),
+                "avg_batch_texts": round(self._texts / batches, 2),
+                "avg_requests_per_batch": round(self._requests / batches, 2),
+                "avg_queue_wait_ms": round(self._wait_total / requests * 1000.0, 3),
+                "max_queue_wait_ms": round(self._wait_max * 1000.0, 3),
+                "avg_encode_ms": round(self._encode_total / batches * 1000.0, 3),
+            }
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch_size:
+                with self._lock:
+                    expected = self._arriving > len(batch)
+                remaining = deadline - time.perf_counter()
+                try:
+                    # Take what is already queued; wait only for callers known to be on their way
+                    request = self._queue.get(timeout=remaining) if expected and remaining > 0 \
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            with self._lock:
+                self._arriving -= len(batch)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        texts = [text for request in batch for text in request[0]]
+        start = time.perf_counter()
+        try:
+            vectors = self.encode_fn(texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - start
+        waits = [start - enqueued for _, _, enqueued in batch]
+        for wait in waits:
+            metrics.observe("embedding_queue_wait", wait, 1)
+        metrics.observe("embedding_batch", elapsed, len(texts))
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._texts += len(texts)
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, *waits)
+            self._encode_total += elapsed
+        offset = 0
+        for request_texts, future, _ in batch:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+if __name__ == "__main__":
+    # Throughput of concurrent single-query searches, as the server runs them: at most
+    # SEARCH_WORKERS callers at once (the search pool in main.py), each calling the encoder
+    # directly as before the batcher, or through it. Uses the configured embedding
+    # model when it can be loaded, else a synthetic one whose cost, like a transformer's
+    # on CPU, is mostly reading its weights once per call whatever the batch size.
+    #   python embedding_service.py [concurrency ...]
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        from pdf_processor import MODEL_NAME
+        from embedding_models import load_embedding_model
+        model, backend = load_embedding_model(MODEL_NAME)
+        label = f"{MODEL_NAME} ({backend})"
+
+        def encode_texts(texts: List[str]) -> np.ndarray:
+            return model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    except Exception as e:
+        print(f"Embedding model unavailable ({e}); using a synthetic encoder")
+        weights = np.random.default_rng(0).standard_normal((384, 12288)).astype(np.float32)
+        label = "synthetic"
+
+        def encode_texts(texts: List[str]) -> np.ndarray:
+            # One pass over all the weights per call, plus work for 64 tokens per text
+            pooled = weights.sum(axis=1)
+            tokens = np.random.default_rng(len(texts)).standard_normal((len(texts) * 64, 384)).astype(np.float32)
+            hidden = tokens @ weights[:, :2048] @ weights[:, :2048].T
+            return hidden.reshape(len(texts), 64, 384).mean(axis=1) + pooled
+
+    def measure(encode: Callable[[List[str]], np.ndarray], concurrency: int, seconds: float = 3.0) -> float:
+        calls = [0] * concurrency
+        stop = time.perf_counter() + seconds
+
+        def caller(i):
+            while time.perf_counter() < stop:
+                encode([f"related sections for query {i}-{calls[i]}"])
+                calls[i] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(caller, range(concurrency)))
+        return sum(calls) / (time.perf_counter() - start)
+
+    search_workers = int(os.getenv("SEARCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    levels = [int(c) for c in sys.argv[1:]] or sorted({1, search_workers, 4 * search_workers})
+    encode_texts(["warm up"])
+    print(f"encoder: {label}, cpus: {os.cpu_count()}, search pool workers: {search_workers}")
+    for concurrency in levels:
+        batcher = EmbeddingBatcher(encode_texts)
+        direct, batched = measure(encode_texts, concurrency), measure(batcher.encode, concurrency)
+        stats = batcher.stats()
+        print(f"{concurrency:>3} callers: direct {direct:7.1f}/s, batched {batched:7.1f}/s ({batched / direct:.2f}x), "
+              f"{stats['avg_requests_per_batch']} per batch, queue wait avg {stats['avg_queue_wait_ms']} ms")
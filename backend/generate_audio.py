@@ -1,36 +1,23 @@
 import os
+import shutil
+
+from tts import AudioCache
+
+# Shared with the API server, so audio made here is reused there and vice versa
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join("uploads", "audio"))
 
 
 def generate_audio(text: str, outfile_path: str) -> str:
     """Generate an MP3 file from text using the configured TTS provider.
 
     Returns the outfile_path on success. Mirrors the evaluator sample intent while
-    keeping the project self-contained. Only Azure is implemented here, per evaluation.
+    keeping the project self-contained. Azure is the evaluated provider; ``fake``
+    writes silent audio for tests. Audio is taken from the shared TTS cache when
+    the same text was synthesized before.
     """
-    provider = os.getenv("TTS_PROVIDER", "").lower()
-    if provider != "azure":
-        raise RuntimeError("Unsupported TTS_PROVIDER. Set TTS_PROVIDER=azure for evaluation.")
-
-    try:
-        import azure.cognitiveservices.speech as speechsdk
-    except Exception as e:
-        raise RuntimeError(f"Azure Speech SDK not available: {e}")
-
-    azure_key = os.getenv("AZURE_TTS_KEY", "").strip()
-    azure_endpoint = os.getenv("AZURE_TTS_ENDPOINT", "").strip()
-    if not azure_key or not azure_endpoint:
-        raise RuntimeError("AZURE_TTS_KEY or AZURE_TTS_ENDPOINT missing.")
-
-    speech_config = speechsdk.SpeechConfig(subscription=azure_key, endpoint=azure_endpoint)
-    speech_config.set_speech_synthesis_output_format(
-        speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
-    )
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=outfile_path)
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-
-    result = synthesizer.speak_text_async(text).get()
-    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-        raise RuntimeError("Audio synthesis failed")
+    audio = AudioCache(AUDIO_CACHE_DIR).synthesize(text)
+    if os.path.abspath(audio) != os.path.abspath(outfile_path):
+        shutil.copyfile(audio, outfile_path)
     return outfile_path
 
 
@@ -41,5 +28,3 @@ if __name__ == "__main__":
         sys.exit(1)
     path = generate_audio(sys.argv[1], sys.argv[2])
     print(path)
-
-
@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, CancelledError
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from pdf_processor import process_pool_context
+import metrics
+import profiling
+from uploads import content_addressed_name
+
+_worker_processor = None
+
+
+def extract_file(pdf_path: str, page_workers: Optional[int] = None, raise_errors: bool = False
+                 ) -> List[Dict[str, Any]]:
+    """Process-pool entry point: extract the sections of one PDF."""
+    global _worker_processor
+    if _worker_processor is None:
+        from pdf_processor import PDFProcessor
+        _worker_processor = PDFProcessor(load_model=False)
+    return _worker_processor.extract_sections(pdf_path, page_workers=page_workers, raise_errors=raise_errors)
+
+
+def extract_file_timed(pdf_path: str, page_workers: Optional[int] = None, raise_errors: bool = False
+                       ) -> Tuple[List[Dict[str, Any]], float, Optional[list]]:
+    """Like ``extract_file`` but also returns the seconds spent and the stage metrics recorded"""
+    start = time.perf_counter()
+    sections = extract_file(pdf_path, page_workers, raise_errors)
+    return sections, time.perf_counter() - start, metrics.drain_stages()
+
+
+def extract_file_profiled(pdf_path: str, meta: Dict[str, Any]
+                          ) -> Tuple[List[Dict[str, Any]], float, Optional[list], str]:
+    """``extract_file_timed`` under cProfile, one page range at a time so the profile sees all the work.
+
+    Also returns the id of the stored capture.
+    """
+    (sections, seconds, stage_metrics), capture_id = profiling.run_profiled(meta, extract_file_timed, pdf_path, 1,
+                                                                              True)
+    return sections, seconds, stage_metrics, capture_id
+
+
+class ExtractionCache:
+    """Extraction results keyed by PDF content hash and processor version.
+
+    Identical bytes uploaded again (under any name) reuse the stored sections
+    instead of being extracted; bumping ``PROCESSOR_VERSION`` invalidates the
+    cache without deleting it. Empty results are not stored, so a file that
+    yielded nothing is extracted again next time.
+    """
+
+    def __init__(self, cache_dir: str, version: str):
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sha256: str) -> Path:
+        return self.cache_dir / f"{sha256}-v{self.version}.json"
+
+    def get(self, sha256: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._path(sha256), "r", encoding="utf-8") as f:
+                # Entries written before empty results were skipped count as misses
+                return json.load(f) or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable extraction cache entry {sha256}: {e}")
+            return None
+
+    def put(self, sha256: str, sections: List[Dict[str, Any]]):
+        if not sections:
+            return
+        tmp = self.cache_dir / f".{sha256}.{uuid.uuid4().hex}.tmp"
+        with metrics.timed("json_persistence", len(sections)), open(tmp, "w", encoding="utf-8") as f:
+            json.dump(sections, f, ensure_ascii=False)
+        os.replace(tmp, self._path(sha256))
+
+
+class IngestJobManager:
+    """Runs section extraction for uploaded PDFs in the background.
+
+    Extraction fans out over a process pool (one worker per core by default);
+    each finished file is handed to ``persist(filename, file_path, sections,
+    sha256)`` on a single writer thread, so processed/ and the section index
+    are only ever written from one place. Files whose content hash is in the
+    extraction cache skip the pool entirely. Jobs are kept in memory and can
+    be polled or cancelled by id.
+
+    At most ``max_queue`` files (``INGEST_QUEUE``) may wait for extraction;
+    callers check ``saturated()`` before accepting more work. Upload names
+    are claimed with ``reserve_name()`` and held until the file is stored,
+    fails or is cancelled, so two uploads never land on the same path.
+    """
+
+    # Finished jobs stay pollable for this many seconds
+    job_ttl = 3600
+
+    def __init__(self, persist: Callable[[str, str, List[Dict[str, Any]], str], None],
+                 cache: Optional[ExtractionCache] = None, max_workers: Optional[int] = None,
+                 max_queue: Optional[int] = None):
+        self.persist = persist
+        self.cache = cache
+        self.max_workers = max_workers or int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("INGEST_QUEUE", "64"))
+        self._avg_seconds = 0.0
+        self._extracted = 0
+        self._executor = None
+        # Writes to processed/ and the index are serialised on one thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-writer")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._futures: Dict[str, List[Any]] = {}
+        self._adhoc = set()
+        self._lock = threading.Lock()
+        # filename -> [sha256, uploads holding it] of uploads not yet stored; own lock, as
+        # claiming may hash a file on disk
+        self._reserved: Dict[str, List[Any]] = {}
+        self._names_lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=process_pool_context())
+        return self._executor
+
+    def start(self):
+        """Start the worker processes now rather than on the first upload.
+
+        With the fork start method this must happen before other threads
+        (such as model warm-up) exist, since a forked child only inherits the
+        calling thread and any locks the others held.
+        """
+        self._pool().submit(os.getpid).result()
+
+    def reserve_name(self, filename: str, sha256: str, stored: Callable[[str], Tuple[Optional[str], bool]]
+                     ) -> Tuple[str, bool]:
+        """Pick the name an upload is stored under and hold it until the file is stored.
+
+        ``stored(name)`` returns the hash of what is stored under ``name``
+        (the document, else the file in uploads/) and whether it is a
+        processed document. A name is taken if an upload still in flight or
+        the stored file holds different bytes. Returns ``(name, duplicate)``;
+        only a processed document with the same bytes under that name is a
+        duplicate, and it reserves nothing. Other names go to ``submit`` or
+        back through ``release_names``.
+        """
+        with self._names_lock:
+            existing, processed = self._occupant(filename, stored)
+            name = content_addressed_name(filename, sha256, existing)
+            if name != filename:
+                existing, processed = self._occupant(name, stored)
+            if processed and existing == sha256:
+                return name, True
+            held = self._reserved.setdefault(name, [sha256, 0])
+            held[1] += 1
+            return name, False
+
+    def _occupant(self, name: str, stored: Callable[[str], Tuple[Optional[str], bool]]
+                  ) -> Tuple[Optional[str], bool]:
+        held = self._reserved.get(name)
+        if held is not None:
+            return held[0], False
+        return stored(name)
+
+    def release_names(self, files: List[Dict[str, Any]]):
+        """Give back names from ``reserve_name`` (``filename`` and ``sha256`` of each file)"""
+        with self._names_lock:
+            for f in files:
+                held = self._reserved.get(f["filename"])
+                if held is not None and f.get("sha256") == held[0]:
+                    held[1] -= 1
+                    if not held[1]:
+                        del self._reserved[f["filename"]]
+
+    def submit(self, files: List[Dict[str, Any]], profile: bool = False) -> Dict[str, Any]:
+        """Queue uploaded files for extraction; returns the new job's status.
+
+        Each file is a dict with ``filename``, ``file_path``, ``sha256`` and
+        ``original_filename``, named through ``reserve_name``; the name is
+        released once the file is stored, fails or is cancelled. Files passed
+        with ``status="duplicate"`` are already stored and are only reported. With ``profile``, extraction
+        and storage of each file run under cProfile; the capture ids are
+        listed under the file's ``profiles``.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "finished_at": None,
+            "profile": profile,
+            "files": [{"filename": f["filename"], "original_filename": f.get("original_filename", f["filename"]),
+                       "sha256": f.get("sha256"), "status": f.get("status", "queued"),
+                       "sections_count": f.get("sections_count"), "cached": False, "error": None,
+                       **({"profiles": []} if profile else {})}
+                      for f in files],
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._futures[job_id] = []
+        # Several files already keep the pool busy; only a lone file is split by page
+        page_workers = 1 if len(files) > 1 else None
+        for entry, f in zip(job["files"], files):
+            future = Future()
+            self._futures[job_id].append(future)
+            if entry["status"] != "queued":
+                future.set_result(None)
+                continue
+            sections = self.cache.get(entry["sha256"]) if self.cache and entry["sha256"] else None
+            if sections is not None:
+                entry["cached"] = True
+                future.set_result(sections)
+                self._writer.submit(self._store, job, entry, f["file_path"], sections)
+                continue
+            if profile:
+                future = self._pool().submit(extract_file_profiled, f["file_path"], self._profile_meta(
+                    job, entry, "extract"))
+            else:
+                # A failed extraction fails the file rather than storing (and caching) no sections
+                future = self._pool().submit(extract_file_timed, f["file_path"], page_workers, True)
+            self._futures[job_id][-1] = future
+            future.add_done_callback(lambda fut, e=entry, p=f["file_path"]: self._on_extracted(job, e, p, fut))
+        with self._lock:
+            self._finish_if_done(job)
+        self._prune()
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            for entry, future in zip(job["files"], self._futures[job_id]):
+                if entry["status"] == "queued" and future.running():
+                    entry["status"] = "processing"
+            if job["status"] == "queued" and any(e["status"] != "queued" for e in job["files"]):
+                job["status"] = "running"
+            done = sum(e["status"] in ("processed", "duplicate", "failed", "cancelled") for e in job["files"])
+            return dict(job, files=[dict(e) for e in job["files"]],
+                        progress={"done": done, "total": len(job["files"])})
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel queued files; files already being extracted finish but are not stored."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in ("completed", "failed"):
+                job["status"] = "cancelled"
+                cancelled = []
+                for entry, future in zip(job["files"], self._futures[job_id]):
+                    future.cancel()
+                    if entry["status"] in ("queued", "processing"):
+                        entry["status"] = "cancelled"
+                        cancelled.append(entry)
+                self._finish_if_done(job)
+                self.release_names(cancelled)
+        return self.status(job_id)
+
+    def extract(self, pdf_path: str) -> Future:
+        """Extract one PDF on the pool outside of any job (e.g. for ad-hoc analysis)"""
+        future = self._pool().submit(extract_file_timed, pdf_path)
+        with self._lock:
+            self._adhoc.add(future)
+        result = Future()
+
+        def unwrap(done):
+            with self._lock:
+                self._adhoc.discard(done)
+            try:
+                sections, seconds, stage_metrics = done.result()
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            self._record_duration(seconds)
+            metrics.merge_stages(stage_metrics)
+            result.set_result(sections)
+
+        future.add_done_callback(unwrap)
+        return result
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            pending = sum(1 for futures in self._futures.values() for f in futures if not f.done())
+            return pending + len(self._adhoc)
+
+    def saturated(self, incoming: int = 1) -> bool:
+        """True if ``incoming`` more files would overflow the queue (an idle pool takes any batch)"""
+        depth = self.queue_depth()
+        return depth > 0 and depth + incoming > self.max_workers + self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained, from recent extraction times"""
+        waves = self.queue_depth() / self.max_workers
+        return max(1, int(round(waves * (self._avg_seconds or 1.0))))
+
+    def stats(self) -> Dict[str, Any]:
+        depth = self.queue_depth()
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending_files": depth,
+                "jobs": len(self._jobs),
+                "extracted": self._extracted,
+                "avg_seconds": round(self._avg_seconds, 4),
+            }
+
+    def _record_duration(self, seconds: float):
+        with self._lock:
+            self._extracted += 1
+            self._avg_seconds = seconds if self._extracted == 1 else 0.8 * self._avg_seconds + 0.2 * seconds
+
+    def _prune(self):
+        """Forget finished jobs after ``job_ttl`` seconds"""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+                del self._jobs[job_id]
+                del self._futures[job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._writer.shutdown(wait=False)
+
+    def _on_extracted(self, job: Dict[str, Any], entry: Dict[str, Any], file_path: str, future):
+        try:
+            sections, seconds, stage_metrics, *capture = future.result()
+            self._record_duration(seconds)
+            metrics.merge_stages(stage_metrics)
+            if capture:
+                self._add_profile(entry, capture[0])
+        except CancelledError:
+            return
+        except Exception as e:
+            print(f"Error extracting sections from {entry['filename']}: {e}")
+            self._mark(job, entry, "failed", error=str(e))
+            return
+        if job["status"] == "cancelled":
+            return
+        self._writer.submit(self._store, job, entry, file_path, sections)
+
+    def _store(self, job: Dict[str, Any], entry: Dict[str, Any], file_path: str, sections: List[Dict[str, Any]]):
+        if job["status"] == "cancelled":
+            return
+        try:
+            if self.cache and entry["sha256"] and not entry["cached"]:
+                self.cache.put(entry["sha256"], sections)
+            if job["profile"]:
+                _, capture_id = profiling.run_profiled(self._profile_meta(job, entry, "store"), self.persist,
+                                                       entry["filename"], file_path, sections, entry["sha256"])
+                self._add_profile(entry, capture_id)
+            else:
+                self.persist(entry["filename"], file_path, sections, entry["sha256"])
+            self._mark(job, entry, "processed", sections_count=len(sections))
+            print(f"Completed processing {entry['filename']} ({len(sections)} sections)")
+        except Exception as e:
+            print(f"Error storing {entry['filename']}: {e}")
+            self._mark(job, entry, "failed", error=str(e))
+
+    def _profile_meta(self, job: Dict[str, Any], entry: Dict[str, Any], stage: str) -> Dict[str, Any]:
+        return {"trigger": "ingest", "stage": stage, "job_id": job["job_id"], "document": entry["filename"]}
+
+    def _add_profile(self, entry: Dict[str, Any], capture_id: str):
+        with self._lock:
+            entry["profiles"] = entry["profiles"] + [capture_id]
+
+    def _mark(self, job: Dict[str, Any], entry: Dict[str, Any], status: str, **fields):
+        with self._lock:
+            if entry["status"] == "cancelled":
+                return
+            entry.update(fields, status=status)
+            self._finish_if_done(job)
+        self.release_names([entry])
+
+    def _finish_if_done(self, job: Dict[str, Any]):
+        if any(e["status"] in ("queued", "processing") for e in job["files"]):
+            return
+        if job["finished_at"] is None:
+            job["finished_at"] = time.time()
+        if job["status"] != "cancelled":
+            failed = all(e["status"] == "failed" for e in job["files"])
+            job["status"] = "failed" if failed and job["files"] else "completed"
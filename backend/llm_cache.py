@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+from query_cache import normalize_query
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0.95"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    context_key TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    query TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    embedding_tag TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_context ON responses(context_key, embedding_tag);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at);
+"""
+
+TIERS = ("exact", "semantic")
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Tuple[str, str]]:
+    """Role and whitespace-normalised content of each message (other fields are ignored)"""
+    return [(m.get("role", ""), normalize_query(m.get("content", ""))) for m in messages]
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Persistent cache of LLM replies in SQLite, in two tiers.
+
+    - exact: keyed by provider, model and the normalised messages.
+    - semantic (``LLM_CACHE_SEMANTIC=1``): everything but the last user
+      message must match exactly (so the system prompt, and with it the
+      retrieved document context, is the same); the last message only has
+      to be within ``LLM_CACHE_SEMANTIC_THRESHOLD`` cosine similarity of a
+      cached one, using the section-embedding model. Without an embedding
+      model (TF-IDF fallback) only the exact tier is used.
+
+    Entries expire after ``LLM_CACHE_TTL`` seconds; beyond
+    ``LLM_CACHE_MAX_ENTRIES`` or ``LLM_CACHE_MAX_BYTES`` the least recently
+    used are evicted. Connections are per thread, like the catalog's.
+    """
+
+    def __init__(self, db_path: str, processor=None, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 semantic: Optional[bool] = None, threshold: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.processor = processor
+        self.max_entries = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = LLM_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = LLM_CACHE_TTL if ttl is None else ttl
+        self.semantic = (LLM_CACHE_SEMANTIC if semantic is None else semantic) and processor is not None
+        self.threshold = LLM_CACHE_SEMANTIC_THRESHOLD if threshold is None else threshold
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = {tier: 0 for tier in TIERS}
+        self.misses = {tier: 0 for tier in TIERS}
+        self.stores = 0
+        self.evictions = 0
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, provider: str, model: str, messages: List[Dict[str, str]]) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Cached ``(response, tier)`` for these messages, or None"""
+        normalized = normalize_messages(messages)
+        conn = self._connect()
+        fresh_after = time.time() - self.ttl
+        key = _digest([provider, model, normalized])
+        row = conn.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                           (key, fresh_after)).fetchone()
+        if row is not None:
+            self._touch(conn, key)
+            self._count("exact", hit=True)
+            return json.loads(row[0]), "exact"
+        self._count("exact", hit=False)
+
+        query = self._semantic_query(normalized)
+        if query is None:
+            return None
+        tag = self.processor.similarity_tag
+        rows = conn.execute(
+            "SELECT key, embedding, response FROM responses "
+            "WHERE context_key = ? AND embedding_tag = ? AND created_at >= ?",
+            (_digest([provider, model, normalized[:-1]]), tag, fresh_after)).fetchall()
+        if rows:
+            vector = self._embed(query)
+            if vector is not None:
+                matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._touch(conn, rows[best][0])
+                    self._count("semantic", hit=True)
+                    return json.loads(rows[best][2]), "semantic"
+        self._count("semantic", hit=False)
+        return None
+
+    def put(self, provider: str, model: str, messages: List[Dict[str, str]], response: Dict[str, Any]):
+        normalized = normalize_messages(messages)
+        payload = json.dumps(response, ensure_ascii=False)
+        query = self._semantic_query(normalized)
+        vector = self._embed(query) if query is not None else None
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, context_key, provider, model, query, response, embedding, "
+                "embedding_tag, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_digest([provider, model, normalized]), _digest([provider, model, normalized[:-1]]),
+                 provider, model, normalized[-1][1] if normalized else "", payload,
+                 vector.tobytes() if vector is not None else None,
+                 self.processor.similarity_tag if vector is not None else None,
+                 len(payload), now, now))
+            evicted = self._evict(conn, now)
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def _semantic_query(self, normalized: List[Tuple[str, str]]) -> Optional[str]:
+        if not self.semantic or not normalized or normalized[-1][0] != "user":
+            return None
+        return normalized[-1][1]
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        vectors = self.processor.embed_texts([text])
+        return None if vectors is None else np.asarray(vectors[0], dtype=np.float32)
+
+    def _touch(self, conn: sqlite3.Connection, key: str):
+        with conn:
+            conn.execute("UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        evicted = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count > self.max_entries:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used_at LIMIT ?)",
+                (count - self.max_entries,)).rowcount
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while total > self.max_bytes and count:
+            # Drop the least recently used tenth until the cache fits
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used_at LIMIT ?)",
+                (max(1, count // 10),)).rowcount
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return evicted
+
+    def _count(self, tier: str, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits[tier] += 1
+            else:
+                self.misses[tier] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        count, total = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            tiers = {}
+            for tier in TIERS:
+                lookups = self.hits[tier] + self.misses[tier]
+                tiers[tier] = {"hits": self.hits[tier], "misses": self.misses[tier],
+                               "hit_rate": round(self.hits[tier] / lookups, 4) if lookups else 0.0}
+            return {
+                "entries": count,
+                "bytes": total,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "semantic_enabled": self.semantic,
+                "semantic_threshold": self.threshold,
+                "tiers": tiers,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
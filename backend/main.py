@@ -1,15 +1,31 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response, FileResponse
 from fastapi.staticfiles import StaticFiles
 import os
-import shutil
 import json
+import time
+import asyncio
+import threading
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uvicorn
-from pdf_processor import PDFProcessor
-from chat_with_llm import chat_with_llm
+from pdf_processor import PDFProcessor, PROCESSOR_VERSION
+from chat_with_llm import chat_with_llm, stream_chat_with_llm, llm_provider_and_model, is_fallback_reply
+import ollama_client
+import metrics
+import profiling
+from chat_context import (build_context, fit_history, retrieval_query,
+                          CHAT_CONTEXT_TOKENS, CHAT_CONTEXT_TOP_K)
+from tts import AudioCache, AudioJobs, AudioStreams, TTS_PROVIDERS, tts_provider
+from ingest import IngestJobManager, ExtractionCache
+from catalog import Catalog
+from corpus_cache import CorpusCache
+from workers import make_pool, PoolSaturated
+from query_cache import QueryResultCache, normalize_query
+from related_graph import RelatedSectionsGraph
+from llm_cache import LLMResponseCache, LLM_CACHE_ENABLED
+from uploads import receive_files, file_sha256, UploadTooLarge, MalformedUpload, MAX_UPLOAD_REQUEST_BYTES
 from dotenv import load_dotenv
 
 # Load environment variables from a local .env if present (useful for local/dev)
@@ -17,7 +33,21 @@ load_dotenv()
 
 app = FastAPI(title="Adobe Hackathon Finale - PDF Intelligence Engine")
 
-# CORS middleware for frontend communication
+UPLOAD_PATHS = {"/upload", "/upload-simple", "/analyze-current"}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized upload requests from Content-Length before the body is read.
+
+    Bodies without a length (chunked) are counted by ``receive_files`` as they arrive.
+    """
+    if request.method == "POST" and request.url.path in UPLOAD_PATHS:
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > MAX_UPLOAD_REQUEST_BYTES:
+            return JSONResponse(status_code=413, content={"detail": "Upload request too large"})
+    return await call_next(request)
+
+# CORS middleware for frontend communication (added last so it also wraps early 413s)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,12 +56,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request profiling (PROFILE_ENABLED=1); outermost, so a capture covers the whole response
+profile_store = profiling.ProfileStore()
+if profiling.PROFILE_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware, store=profile_store)
+
 # Create necessary directories
 UPLOAD_DIR = Path("uploads")
 PROCESSED_DIR = Path("processed")
 UPLOAD_DIR.mkdir(exist_ok=True)
 PROCESSED_DIR.mkdir(exist_ok=True)
-AUDIO_DIR = UPLOAD_DIR / "audio"
+EXTRACTION_CACHE_DIR = PROCESSED_DIR / "cache"
+CATALOG_PATH = PROCESSED_DIR / "catalog.db"
+AUDIO_DIR = Path(os.getenv("AUDIO_CACHE_DIR", str(UPLOAD_DIR / "audio")))
 AUDIOS_MOUNT = "/audio"
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -39,38 +76,96 @@ AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/files", StaticFiles(directory=str(UPLOAD_DIR)), name="files")
 app.mount(AUDIOS_MOUNT, StaticFiles(directory=str(AUDIO_DIR)), name="audio")
 
-# Initialize PDF processor
+# Initialize PDF processor; the embedding model loads on first use or warm-up
 pdf_processor = PDFProcessor()
 
+# Document catalog; documents processed before it existed are imported once
+catalog = Catalog(str(CATALOG_PATH))
+imported = catalog.import_json_dir(str(PROCESSED_DIR))
+if imported:
+    print(f"Imported {imported} processed documents into the catalog")
+
+# Request-path reads go through the in-memory corpus cache
+corpus = CorpusCache(catalog)
+
+# Precomputed nearest sections of other documents, maintained at ingest
+related_graph = RelatedSectionsGraph(pdf_processor, catalog)
+
 @app.get("/")
 async def root():
     return {"message": "Adobe Hackathon Finale - PDF Intelligence Engine"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "PDF Intelligence Engine"}
+    """Liveness plus warm-up progress; answers 200 while the model is still loading"""
+    return {
+        "status": "healthy",
+        "service": "PDF Intelligence Engine",
+        "ready": pdf_processor.ready,
+        "model": pdf_processor.model_state,
+    }
+
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """200 once the model and section index are loaded, 503 while warming up"""
+    if pdf_processor.ready:
+        return {"status": "ready", "model": pdf_processor.model_state}
+    return JSONResponse(status_code=503, content={"status": "warming", "model": pdf_processor.model_state,
+                                                  "warmup": warmup_status()})
+
+def upload_form(field: str, multiple: bool = True) -> dict:
+    """OpenAPI request body for endpoints that parse their multipart body themselves"""
+    schema = {"type": "string", "format": "binary"}
+    if multiple:
+        schema = {"type": "array", "items": schema}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {
+        "schema": {"type": "object", "required": [field], "properties": {field: schema}}}}}}
+
+def is_pdf(filename: str) -> bool:
+    return filename.lower().endswith('.pdf')
+
+async def receive_uploads(request: Request, field: str) -> List[dict]:
+    """The files of ``field``, streamed to temp files in uploads/; non-PDFs are skipped unwritten"""
+    try:
+        files = await receive_files(request, field, UPLOAD_DIR, accept=is_pdf)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MalformedUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not files:
+        raise HTTPException(status_code=422, detail=f"No files uploaded in the '{field}' field")
+    return files
+
+async def run_blocking(fn, *args):
+    """Blocking work on the default executor, off the event loop.
+
+    File-system calls (renames, deletes, hashing) and corpus cache reads,
+    which query SQLite while holding the cache's lock.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
 
-@app.post("/upload-simple")
-async def upload_pdfs_simple(files: List[UploadFile] = File(...)):
+@app.post("/upload-simple", openapi_extra=upload_form("files"))
+async def upload_pdfs_simple(request: Request):
     """Upload multiple PDFs without processing (for testing)"""
     try:
+        files = await receive_uploads(request, "files")
         print(f"Simple upload of {len(files)} files...")
         uploaded_files = []
         
-        for i, file in enumerate(files):
-            if not file.filename.lower().endswith('.pdf'):
+        for file in files:
+            if file["temp_path"] is None:
                 continue
             
-            print(f"Saving file {i+1}/{len(files)}: {file.filename}")
-            
-            # Save file
-            file_path = UPLOAD_DIR / file.filename
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            print(f"Saving file: {file['filename']}")
+            await run_blocking(os.replace, file["temp_path"], UPLOAD_DIR / file["filename"])
             
             uploaded_files.append({
-                "filename": file.filename,
-                "size_bytes": file_path.stat().st_size,
+                "filename": file["filename"],
+                "size_bytes": file["size"],
                 "status": "saved"
             })
         
@@ -79,145 +174,416 @@ async def upload_pdfs_simple(files: List[UploadFile] = File(...)):
             "files": uploaded_files
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Simple upload failed: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-@app.post("/upload")
-async def upload_pdfs(files: List[UploadFile] = File(...)):
-    """Upload multiple PDFs for analysis and storage"""
+def store_processed(filename: str, file_path: str, sections: list, sha256: Optional[str] = None):
+    """Persist extracted sections for a document and add them to the section index"""
+    with metrics.timed("catalog_write", len(sections)):
+        catalog.upsert_document(filename, sections, file_path=file_path, sha256=sha256)
+    corpus.invalidate(filename)
+    
+    # Embed the new sections into the persistent related-sections index
+    pdf_processor.index_document(filename, sections, catalog)
+    query_cache.invalidate()
     try:
-        print(f"Starting upload of {len(files)} files...")
-        uploaded_files = []
+        related_graph.add_document(filename, sections)
+    except Exception as e:
+        print(f"Error updating the related-sections graph for {filename}: {e}")
+
+def stored_sha256(filename: str) -> Tuple[Optional[str], bool]:
+    """Content hash of what is stored under ``filename`` and whether it is a processed document.
+
+    Files in uploads/ that were never processed (saved by ``/upload-simple``,
+    or left by a failed or cancelled job) only occupy the name.
+    """
+    document = corpus.get_document(filename)
+    sha256 = document["sha256"] if document is not None else None
+    if sha256 is None and (UPLOAD_DIR / filename).exists():
+        # Documents processed before uploads were hashed, and files that were never processed
+        sha256 = file_sha256(UPLOAD_DIR / filename)
+    return sha256, document is not None
+
+ingest_jobs = IngestJobManager(
+    persist=store_processed,
+    cache=ExtractionCache(str(EXTRACTION_CACHE_DIR), PROCESSOR_VERSION)
+)
+
+# Blocking work runs off the event loop, each kind with its own concurrency limit
+search_pool = make_pool("search", default_workers=min(4, os.cpu_count() or 1), default_queue=32)
+llm_pool = make_pool("llm", default_workers=4, default_queue=16)
+tts_pool = make_pool("tts", default_workers=2, default_queue=8)
+WORKER_POOLS = (search_pool, llm_pool, tts_pool)
+
+async def offload(pool, fn, *args, **kwargs):
+    """Run a blocking call on ``pool``; a full pool becomes an HTTP error with Retry-After"""
+    try:
+        return await pool.run(fn, *args, **kwargs)
+    except PoolSaturated as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+
+# Repeated lookups are answered from memory until the corpus changes
+query_cache = QueryResultCache()
+
+async def cached_search(key: tuple, fn, *args, **kwargs):
+    """Result of a search-pool call, served from the query cache when possible.
+
+    The corpus version is appended to ``key`` so any ingest or delete makes
+    earlier entries unreachable.
+    """
+    key = key + (catalog.corpus_version(),)
+    result = query_cache.get(key)
+    if result is None:
+        generation = query_cache.generation
+        result = await offload(search_pool, fn, *args, **kwargs)
+        query_cache.put(key, result, generation)
+    return result
+
+def reject_if_ingest_saturated(incoming: int = 1):
+    if ingest_jobs.saturated(incoming):
+        raise HTTPException(status_code=429, detail="Too many uploads are waiting to be processed",
+                            headers={"Retry-After": str(ingest_jobs.retry_after())})
+
+# Model and index loading, started once in the background
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+warmup = {"status": "idle", "seconds": None, "error": None}
+warmup_done = threading.Event()
+_warmup_lock = threading.Lock()
+
+def run_warmup():
+    start = time.perf_counter()
+    try:
+        pdf_processor.warm_up(catalog)
+        related_graph.sync(pdf_processor.similarity_tag)
+        warmup.update(status="done", error=None)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        warmup.update(status="failed", error=str(e))
+    warmup["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"Warm-up {warmup['status']} in {warmup['seconds']}s (model: {pdf_processor.model_state})")
+    warmup_done.set()
+
+def start_warmup():
+    """Start warm-up in a background thread unless it is running or already done"""
+    with _warmup_lock:
+        if warmup["status"] in ("running", "done"):
+            return
+        warmup.update(status="running", seconds=None, error=None)
+        warmup_done.clear()
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+def warmup_status():
+    return dict(warmup, ready=pdf_processor.ready, model=pdf_processor.model_state)
+
+@app.on_event("startup")
+def startup_warmup():
+    # Fork the extraction workers while this is the only thread
+    ingest_jobs.start()
+    if WARMUP_ON_STARTUP:
+        start_warmup()
+
+@app.post("/warmup")
+async def warmup_endpoint(wait: bool = False):
+    """Load the model and section index now; ``wait=true`` returns only once done"""
+    start_warmup()
+    if wait:
+        await asyncio.get_running_loop().run_in_executor(None, warmup_done.wait)
+    status = warmup_status()
+    return JSONResponse(status_code=200 if status["ready"] else 202, content=status)
+
+@app.on_event("shutdown")
+def shutdown_ingest():
+    ingest_jobs.shutdown()
+    for pool in WORKER_POOLS:
+        pool.shutdown()
+    audio_streams.shutdown()
+    ollama_client.close()
+
+def collect_stats() -> dict:
+    return {
+        "pools": {pool.name: pool.stats() for pool in WORKER_POOLS},
+        "ingest": ingest_jobs.stats(),
+        "corpus_cache": corpus.stats(),
+        "embedding_batches": pdf_processor.batcher.stats(),
+        "query_cache": query_cache.stats(),
+        "ollama": ollama_client.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+        "audio_cache": audio_cache.stats(),
+        "audio_jobs": audio_jobs.stats(),
+        "audio_streams": audio_streams.stats(),
+    }
+
+@app.get("/stats")
+async def stats():
+    """Queue depths and throughput of the worker pools, for sizing them"""
+    # The corpus and LLM caches read SQLite
+    return await run_blocking(collect_stats)
+
+def collect_metrics():
+    """Corpus size, queue depths and cache hit rates, read from the components' stats at scrape time"""
+    documents = corpus.list_documents()
+    yield "corpus_documents", "gauge", "Processed documents", [({}, len(documents))]
+    yield "corpus_sections", "gauge", "Sections across processed documents", \
+        [({}, sum(d.get("sections_count") or 0 for d in documents))]
+
+    pools = {pool.name: pool.stats() for pool in WORKER_POOLS}
+    yield "pool_running", "gauge", "Calls running on each worker pool", \
+        [({"pool": name}, s["running"]) for name, s in pools.items()]
+    yield "pool_queued", "gauge", "Calls waiting for a worker", [({"pool": name}, s["queued"]) for name, s in pools.items()]
+    yield "pool_rejected_total", "counter", "Calls refused because the pool was full", \
+        [({"pool": name}, s["rejected"]) for name, s in pools.items()]
+    ingest = ingest_jobs.stats()
+    yield "ingest_pending_files", "gauge", "Uploaded files waiting for or in extraction", [({}, ingest["pending_files"])]
+    yield "ingest_extracted_total", "counter", "Files extracted by the ingest workers", [({}, ingest["extracted"])]
+    yield "embedding_queued", "gauge", "Encode requests waiting for the next batch", \
+        [({}, pdf_processor.batcher.stats()["queued"])]
+    yield "audio_jobs", "gauge", "Audio synthesis jobs by status", \
+        [({"status": status}, count) for status, count in audio_jobs.stats().items()]
+    ollama = ollama_client.stats()
+    if ollama is not None:
+        yield "ollama_in_flight", "gauge", "Requests in flight to Ollama", [({}, ollama["in_flight"])]
+        yield "ollama_waiting", "gauge", "Requests waiting for an Ollama connection slot", [({}, ollama["waiting"])]
+
+    caches = {"query": query_cache.stats(), "corpus": corpus.stats(), "audio": audio_cache.stats()}
+    if llm_cache is not None:
+        for tier, counts in llm_cache.stats()["tiers"].items():
+            caches[f"llm_{tier}"] = counts
+    yield "cache_hits_total", "counter", "Cache lookups answered from the cache", \
+        [({"cache": name}, c["hits"]) for name, c in caches.items()]
+    yield "cache_misses_total", "counter", "Cache lookups that missed", \
+        [({"cache": name}, c["misses"]) for name, c in caches.items()]
+    yield "cache_hit_ratio", "gauge", "Hits over lookups since startup", \
+        [({"cache": name}, c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0)
+         for name, c in caches.items()]
+
+metrics.register_collector(collect_metrics)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latencies, queue depths and cache hit rates in Prometheus text format (``METRICS_ENABLED=1``)"""
+    if not metrics.enabled():
+        raise HTTPException(status_code=404, detail="Metrics are disabled; set METRICS_ENABLED=1")
+    return Response(await offload(search_pool, metrics.render), media_type="text/plain; version=0.0.4")
+
+def require_profiling(request: Request):
+    if not profiling.PROFILE_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILE_ENABLED=1")
+    if not profiling.authorized(request.headers.get("x-profile-token"), request.scope.get("client")):
+        raise HTTPException(status_code=403, detail="X-Profile-Token required"
+                            if profiling.PROFILE_TOKEN else "Profiles are only served locally without PROFILE_TOKEN")
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request, limit: int = 50):
+    """Recent captures, newest first: flagged or slow requests and profiled ingest stages"""
+    require_profiling(request)
+    return {
+        "profiles": await offload(search_pool, profile_store.list, limit),
+        "slow_ms": profiling.PROFILE_SLOW_MS,
+        "max_captures": profile_store.max_captures,
+    }
+
+@app.get("/admin/profiles/{capture_id}")
+async def get_profile(capture_id: str, request: Request):
+    """A capture's metadata and its top functions by self time"""
+    require_profiling(request)
+    meta = profile_store.get(capture_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return meta
+
+@app.get("/admin/profiles/{capture_id}/file")
+async def download_profile(capture_id: str, request: Request):
+    """The raw profile: collapsed stacks for sampled captures, a pstats file for cProfile ones"""
+    require_profiling(request)
+    path = profile_store.path(capture_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(str(path), filename=path.name)
+
+@app.post("/upload", status_code=202, openapi_extra=upload_form("files"))
+async def upload_pdfs(request: Request):
+    """Upload multiple PDFs; section extraction runs as a background job.
+
+    Uploads are identified by SHA-256: re-uploading a processed document's
+    bytes under its name is a no-op, identical bytes under a new name reuse the cached
+    extraction, and a different file with a name already stored, earlier in
+    the batch or still being processed is stored under ``<name>-<hash8>.pdf``.
+    Files are hashed and size-checked as the body arrives. Returns
+    immediately with a ``job_id`` to poll at ``/upload/jobs/{job_id}``. A
+    profiled upload (see ``/admin/profiles``) also profiles each file's
+    extraction and storage.
+    """
+    try:
+        # The file count is only known once the body is read; refuse early if even one won't fit
+        reject_if_ingest_saturated()
+        files = await receive_uploads(request, "files")
+        print(f"Received {len(files)} files...")
+        incoming = []
+        for file in files:
+            if file["temp_path"] is None:
+                print(f"Skipping non-PDF file: {file['filename']}")
+            else:
+                incoming.append(file)
         
-        for i, file in enumerate(files):
-            if not file.filename.lower().endswith('.pdf'):
-                print(f"Skipping non-PDF file: {file.filename}")
-                continue
-            
-            print(f"Processing file {i+1}/{len(files)}: {file.filename}")
-            
-            # Save file
-            file_path = UPLOAD_DIR / file.filename
-            print(f"Saving file to {file_path}")
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            print(f"File saved, size: {file_path.stat().st_size} bytes")
-            
-            # Process the PDF to extract sections
-            print(f"Extracting sections from {file.filename}...")
-            try:
-                sections = pdf_processor.extract_sections(str(file_path))
-                print(f"Extracted {len(sections)} sections from {file.filename}")
-            except Exception as e:
-                print(f"Error extracting sections from {file.filename}: {e}")
-                sections = []
-            
-            # Save processed data
-            processed_data = {
-                "filename": file.filename,
-                "sections": sections,
-                "file_path": str(file_path)
-            }
-            
-            processed_file = PROCESSED_DIR / f"{file.filename}.json"
-            with open(processed_file, "w", encoding="utf-8") as f:
-                json.dump(processed_data, f, indent=2, ensure_ascii=False)
-            
-            uploaded_files.append({
-                "filename": file.filename,
-                "sections_count": len(sections),
-                "status": "processed"
-            })
+        # Names are reserved until each file is stored, so neither another file in this
+        # batch nor an upload still being processed can be overwritten
+        saved_files = []
+        try:
+            reject_if_ingest_saturated(len(incoming))
+            for file in incoming:
+                filename, duplicate = await run_blocking(
+                    ingest_jobs.reserve_name, file["filename"], file["sha256"], stored_sha256)
+                
+                entry = {"filename": filename, "original_filename": file["filename"], "sha256": file["sha256"]}
+                saved_files.append(entry)
+                if duplicate:
+                    print(f"{file['filename']} is unchanged, skipping")
+                    await run_blocking(file["temp_path"].unlink)
+                    entry["status"] = "duplicate"
+                else:
+                    file_path = UPLOAD_DIR / filename
+                    await run_blocking(os.replace, file["temp_path"], file_path)
+                    entry["file_path"] = str(file_path)
             
-            print(f"Completed processing {file.filename}")
-        
-        print(f"Upload completed successfully. Processed {len(uploaded_files)} files.")
+            profile = profiling.PROFILE_ENABLED and profiling.flagged_scope(request.scope)
+            job = ingest_jobs.submit(saved_files, profile=profile)
+        except BaseException:
+            ingest_jobs.release_names([e for e in saved_files if e.get("status") != "duplicate"])
+            for file in incoming:
+                file["temp_path"].unlink(missing_ok=True)
+            raise
+        print(f"Queued {len(saved_files)} files as job {job['job_id']}")
         return {
-            "message": f"Successfully uploaded {len(uploaded_files)} PDFs",
-            "files": uploaded_files
+            "message": f"Queued {len(saved_files)} PDFs for processing",
+            **job
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Upload failed with error: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+@app.get("/upload/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Status and per-file results of an ingestion job"""
+    job = ingest_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/upload/jobs/{job_id}")
+async def cancel_upload_job(job_id: str):
+    """Cancel an ingestion job; files already extracted are kept"""
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/documents")
 async def list_documents():
     """List all uploaded and processed documents"""
     try:
-        documents = []
-        for json_file in PROCESSED_DIR.glob("*.json"):
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                documents.append({
-                    "filename": data["filename"],
-                    "sections_count": len(data["sections"]),
-                    "uploaded_at": json_file.stat().st_mtime
-                })
+        documents = await run_blocking(corpus.list_documents)
         
         return {"documents": documents}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list documents: {str(e)}")
 
-@app.post("/analyze-current")
-async def analyze_current_pdf(file: UploadFile = File(...)):
+@app.post("/analyze-current", openapi_extra=upload_form("file", multiple=False))
+async def analyze_current_pdf(request: Request):
     """Analyze a current PDF and find related sections from uploaded documents"""
     try:
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="File must be a PDF")
+        reject_if_ingest_saturated()
         
         # Save current PDF temporarily
-        temp_path = UPLOAD_DIR / f"current_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Extract sections from current PDF
-        current_sections = pdf_processor.extract_sections(str(temp_path))
-        
-        # Find related sections from uploaded documents
-        related_sections = pdf_processor.find_related_sections(
-            current_sections, 
-            str(PROCESSED_DIR)
-        )
-        
-        # Clean up temp file
-        temp_path.unlink()
+        file, *extra = await receive_uploads(request, "file")
+        for other in extra:
+            if other["temp_path"] is not None:
+                await run_blocking(other["temp_path"].unlink)
+        temp_path = file["temp_path"]
+        if temp_path is None:
+            raise HTTPException(status_code=400, detail="File must be a PDF")
+        try:
+            # Extract sections from current PDF on the ingest process pool
+            current_sections = await asyncio.wrap_future(ingest_jobs.extract(str(temp_path)))
+            
+            # Find related sections from uploaded documents
+            related_sections = await offload(
+                search_pool,
+                pdf_processor.find_related_sections,
+                current_sections, 
+                catalog
+            )
+        finally:
+            # Clean up temp file
+            await run_blocking(temp_path.unlink, True)
         
         return {
-            "current_pdf": file.filename,
+            "current_pdf": file["filename"],
             "current_sections": current_sections,
             "related_sections": related_sections
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.delete("/documents/{document_name}")
+async def delete_document(document_name: str):
+    """Remove an uploaded document, its processed data and its index entries"""
+    try:
+        if not await run_blocking(catalog.delete_document, document_name):
+            raise HTTPException(status_code=404, detail="Document not found")
+        await run_blocking(corpus.invalidate, document_name)
+        
+        # Legacy processed JSON would otherwise be re-imported on the next start
+        await run_blocking((PROCESSED_DIR / f"{document_name}.json").unlink, True)
+        await run_blocking((UPLOAD_DIR / document_name).unlink, True)
+        await offload(search_pool, pdf_processor.remove_document, document_name, catalog)
+        query_cache.invalidate()
+        await offload(search_pool, related_graph.remove_document, document_name)
+        
+        return {"message": f"Deleted {document_name}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
+
 @app.get("/related-sections/{document_name}")
-async def get_related_sections(document_name: str, section_text: Optional[str] = None):
-    """Get related sections for a specific document or section"""
+async def get_related_sections(document_name: str, section_text: Optional[str] = None, probes: Optional[int] = None):
+    """Get related sections for a specific document or section.
+
+    ``probes`` widens (or narrows) the approximate search for this query only.
+    """
     try:
         # Find the document
-        doc_file = PROCESSED_DIR / f"{document_name}.json"
-        if not doc_file.exists():
+        if await run_blocking(corpus.get_document, document_name) is None:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        with open(doc_file, "r", encoding="utf-8") as f:
-            doc_data = json.load(f)
-        
         if section_text:
             # Find related sections for specific section
-            related = pdf_processor.find_related_sections_for_section(
+            section_text = normalize_query(section_text)
+            related = await cached_search(
+                ("section", section_text, 3, probes),
+                pdf_processor.find_related_sections_for_section,
                 section_text, 
-                str(PROCESSED_DIR)
+                catalog,
+                probes=probes
             )
             return {"related_sections": related}
         else:
             # Return all sections
-            return {"sections": doc_data["sections"]}
+            return {"sections": await run_blocking(corpus.get_sections, document_name)}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get related sections: {str(e)}")
 
@@ -225,32 +591,46 @@ async def get_related_sections(document_name: str, section_text: Optional[str] =
 async def get_document_sections(document_name: str):
     """Get all sections from a specific document"""
     try:
-        doc_file = PROCESSED_DIR / f"{document_name}.json"
-        if not doc_file.exists():
+        if await run_blocking(corpus.get_document, document_name) is None:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        with open(doc_file, "r", encoding="utf-8") as f:
-            doc_data = json.load(f)
-        
-        return {"sections": doc_data["sections"]}
+        return {"sections": await run_blocking(corpus.get_sections, document_name)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get sections: {str(e)}")
 @app.get("/related-for-document/{document_name}")
-async def related_for_document(document_name: str):
-    """Compute related sections across all uploaded docs for the given document's sections."""
+async def related_for_document(document_name: str, position: Optional[int] = None, limit: int = 5):
+    """Related sections across all uploaded docs for every section of the given document.
+
+    Served from the related-sections graph built at ingest: ``sections`` lists
+    the neighbours of each section (or only of ``position``) and
+    ``related_sections`` the best ``limit`` of them. Documents not yet in the
+    graph (e.g. during warm-up) fall back to a live search over their first
+    sections, with an empty ``sections``.
+    """
     try:
-        doc_file = PROCESSED_DIR / f"{document_name}.json"
-        if not doc_file.exists():
+        if await run_blocking(corpus.get_document, document_name) is None:
             raise HTTPException(status_code=404, detail="Document not found")
 
-        with open(doc_file, "r", encoding="utf-8") as f:
-            doc_data = json.load(f)
-
-        current_sections = doc_data.get("sections", [])
-        related_sections = pdf_processor.find_related_sections(current_sections, str(PROCESSED_DIR))
-
-        return {"current_document": document_name, "related_sections": related_sections}
+        current_sections = await run_blocking(corpus.get_outline, document_name)
+        if not related_graph.has_document(document_name):
+            related_sections = await cached_search(("document", document_name, 5),
+                                                   pdf_processor.find_related_sections, current_sections, catalog)
+            return {"current_document": document_name, "related_sections": related_sections, "sections": []}
+
+        sections = await offload(search_pool, related_graph.related, document_name, current_sections, position)
+        related_sections, seen = [], set()
+        for entry in sorted((r for s in sections for r in s["related"]), key=lambda r: -r["similarity_score"]):
+            key = (entry["source_document"], entry["section_title"])
+            if key not in seen:
+                seen.add(key)
+                related_sections.append(entry)
+        return {"current_document": document_name, "related_sections": related_sections[:max(1, limit)],
+                "sections": sections}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to compute related sections: {str(e)}")
 
@@ -268,9 +648,130 @@ async def get_config():
         raise HTTPException(status_code=500, detail=f"Failed to get config: {str(e)}")
 
 
+# Replies to identical (or, with the semantic tier, near-identical) prompts are reused
+llm_cache = LLMResponseCache(str(PROCESSED_DIR / "llm_cache.db"), processor=pdf_processor) if LLM_CACHE_ENABLED else None
+
+def cached_reply(llm_messages: List[dict]):
+    """Cached ``(response, tier)`` for these messages, or None"""
+    if llm_cache is None:
+        return None
+    provider, model = llm_provider_and_model()
+    try:
+        return llm_cache.get(provider, model, llm_messages)
+    except Exception as e:
+        print(f"LLM cache lookup failed: {e}")
+        return None
+
+def remember_reply(llm_messages: List[dict], response: dict):
+    content = response["choices"][0]["message"]["content"]
+    if llm_cache is None or is_fallback_reply(content):
+        return
+    try:
+        llm_cache.put(response["provider"], response["model"], llm_messages, response)
+    except Exception as e:
+        print(f"LLM cache store failed: {e}")
+
+def chat_cached(llm_messages: List[dict]) -> dict:
+    """``chat_with_llm`` behind the response cache; hits are marked with their tier"""
+    hit = cached_reply(llm_messages)
+    if hit is not None:
+        response, tier = hit
+        return dict(response, cache=tier)
+    with metrics.timed("llm_call", 1):
+        response = chat_with_llm(llm_messages)
+    remember_reply(llm_messages, response)
+    return response
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat_response(request: Request, llm_messages: List[dict],
+                         sources: Optional[List[dict]] = None) -> StreamingResponse:
+    """Forward the reply as Server-Sent Events while the provider generates it.
+
+    The provider runs on the LLM pool (admitted before the response starts,
+    so a full pool is still a plain 503) and hands deltas to the event loop
+    through a queue. If the client disconnects, the producer is told to stop
+    and closes the provider stream between tokens.
+    """
+    loop = asyncio.get_running_loop()
+    deltas: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    finished = object()
+
+    outcome = {"cache": None}
+
+    def produce():
+        hit = cached_reply(llm_messages)
+        if hit is not None:
+            outcome["cache"] = hit[1]
+            loop.call_soon_threadsafe(deltas.put_nowait, hit[0]["choices"][0]["message"]["content"])
+            loop.call_soon_threadsafe(deltas.put_nowait, finished)
+            return
+        provider, model = llm_provider_and_model()
+        started = time.perf_counter()
+        stream = stream_chat_with_llm(llm_messages)
+        parts = []
+        try:
+            for delta in stream:
+                if cancelled.is_set():
+                    break
+                if not parts:
+                    metrics.observe("llm_first_token", time.perf_counter() - started, 1)
+                parts.append(delta)
+                loop.call_soon_threadsafe(deltas.put_nowait, delta)
+            else:
+                remember_reply(llm_messages, {"provider": provider, "model": model, "choices": [
+                    {"message": {"role": "assistant", "content": "".join(parts)}}]})
+        except Exception as e:
+            loop.call_soon_threadsafe(deltas.put_nowait, e)
+        finally:
+            stream.close()
+            metrics.observe("llm_call", time.perf_counter() - started, 1)
+            loop.call_soon_threadsafe(deltas.put_nowait, finished)
+
+    try:
+        llm_pool.submit(produce)
+    except PoolSaturated as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+
+    async def events():
+        provider, model = llm_provider_and_model()
+        parts = []
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(deltas.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    continue
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    yield sse_event("error", {"detail": f"Chat failed: {item}"})
+                    return
+                parts.append(item)
+                yield sse_event("token", {"delta": item})
+            yield sse_event("done", {"provider": provider, "model": model, "content": "".join(parts),
+                                     "sources": sources or [], "cache": outcome["cache"]})
+        finally:
+            cancelled.set()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/chat")
-async def chat_with_documents(payload: dict):
-    """Chat with LLM about uploaded documents and selected content."""
+async def chat_with_documents(payload: dict, request: Request):
+    """Chat with LLM about uploaded documents and selected content.
+
+    With ``"stream": true`` the reply is sent as Server-Sent Events:
+    ``token`` events carry ``{"delta": ...}``, a final ``done`` event carries
+    the provider, model, full content and retrieved sources, and failures
+    end with ``error``.
+    """
     try:
         messages = payload.get("messages", [])
         selected_text = payload.get("selected_text", "")
@@ -279,25 +780,31 @@ async def chat_with_documents(payload: dict):
         if not messages:
             raise HTTPException(status_code=400, detail="messages are required")
         
-        # Build system context from documents
-        system_context = "You are an AI assistant helping with document analysis. "
-        if document_context:
-            system_context += f"Current document context: {document_context}. "
-        if selected_text:
-            system_context += f"Selected text: {selected_text}. "
-        system_context += "Provide helpful, concise responses based on the document content."
+        # Ground the system prompt in the sections most relevant to the question.
+        # It is cached per selection and corpus version, so follow-up turns send
+        # the same prefix (which providers can reuse) without searching again.
+        query = retrieval_query(messages, selected_text)
+        context = await cached_search(
+            ("chat-context", normalize_query(query), normalize_query(selected_text), document_context,
+             CHAT_CONTEXT_TOKENS, CHAT_CONTEXT_TOP_K),
+            build_context, pdf_processor, catalog, corpus, query, selected_text, document_context)
         
         # Prepare messages for LLM
-        llm_messages = [{"role": "system", "content": system_context}] + messages
+        llm_messages = [{"role": "system", "content": context["system"]}] + fit_history(messages)
         
+        if payload.get("stream"):
+            return stream_chat_response(request, llm_messages, sources=context["sources"])
+
         # Get response from LLM
-        response = chat_with_llm(llm_messages)
+        response = await offload(llm_pool, chat_cached, llm_messages)
         
         return {
             "response": response,
             "context": {
                 "selected_text": selected_text,
-                "document_context": document_context
+                "document_context": document_context,
+                "sources": context["sources"],
+                "prompt_tokens": context["prompt_tokens"]
             }
         }
         
@@ -310,16 +817,20 @@ async def chat_with_documents(payload: dict):
 async def generate_insights(payload: dict):
     """Generate contextual insights based on selected text and uploaded documents.
 
-    Request body: { "selected_text": str, "top_k": int }
+    Request body: { "selected_text": str, "top_k": int, "probes": int (optional) }
     """
     try:
-        selected_text = (payload or {}).get("selected_text", "").strip()
+        selected_text = normalize_query((payload or {}).get("selected_text", ""))
         top_k = int((payload or {}).get("top_k", 5))
+        probes = (payload or {}).get("probes")
+        probes = int(probes) if probes is not None else None
         if not selected_text:
             raise HTTPException(status_code=400, detail="selected_text is required")
 
         # Use semantic related sections as grounding
-        related = pdf_processor.find_related_sections_for_section(selected_text, str(PROCESSED_DIR))
+        related = await cached_search(("section", selected_text, 3, probes),
+                                      pdf_processor.find_related_sections_for_section,
+                                      selected_text, catalog, probes=probes)
         related = related[:max(1, top_k)]
 
         # Simple heuristic insights if no external LLM is configured
@@ -337,49 +848,136 @@ async def generate_insights(payload: dict):
         raise HTTPException(status_code=500, detail=f"Failed to generate insights: {str(e)}")
 
 
+# Audio is named by a digest of its text and voice, so it survives restarts
+audio_cache = AudioCache(str(AUDIO_DIR))
+audio_jobs = AudioJobs()
+audio_streams = AudioStreams(audio_cache)
+
+def audio_job_status(job: dict) -> dict:
+    status = {k: v for k, v in job.items() if k != "key"}
+    status["status_url"] = f"/audio-jobs/{job['job_id']}"
+    if job["status"] == "completed":
+        status["audio_url"] = f"{AUDIOS_MOUNT}/{audio_cache.file_name(job['key'])}"
+    return status
+
 @app.post("/audio")
 async def generate_audio(payload: dict):
     """Generate an audio MP3 overview for the given text using configured TTS provider.
 
     Request body: { "text": str }
+
+    Audio synthesized before is returned right away (``audio_url``).
+    Otherwise synthesis runs in the background and the answer is 202 with a
+    ``job_id`` to poll at ``/audio-jobs/{job_id}``.
     """
     try:
         text = (payload or {}).get("text", "").strip()
         if not text:
             raise HTTPException(status_code=400, detail="text is required")
 
-        provider = os.getenv("TTS_PROVIDER", "").lower()
-        if provider != "azure":
+        if tts_provider() not in TTS_PROVIDERS:
             # For non-azure or missing provider, return 501 to indicate not implemented
             raise HTTPException(status_code=501, detail="TTS provider not configured or unsupported in this build. Set TTS_PROVIDER=azure.")
 
-        # Lazy import to keep startup fast
-        try:
-            import azure.cognitiveservices.speech as speechsdk
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Azure TTS SDK not available: {e}")
+        key = audio_cache.key(text)
+        if audio_cache.get(key) is not None:
+            return {"audio_url": f"{AUDIOS_MOUNT}/{audio_cache.file_name(key)}", "cached": True}
 
-        azure_key = os.getenv("AZURE_TTS_KEY", "").strip()
-        azure_endpoint = os.getenv("AZURE_TTS_ENDPOINT", "").strip()
-        if not azure_key or not azure_endpoint:
-            raise HTTPException(status_code=500, detail="Azure TTS credentials not provided")
+        try:
+            job = audio_jobs.submit(key, lambda: audio_cache.synthesize(text, key), tts_pool.submit)
+        except PoolSaturated as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e),
+                                headers={"Retry-After": str(e.retry_after)})
+        return JSONResponse(status_code=202, content=audio_job_status(job))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
 
-        speech_config = speechsdk.SpeechConfig(subscription=azure_key, endpoint=azure_endpoint)
-        speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-        file_name = f"audio_{abs(hash(text))}.mp3"
-        output_path = AUDIO_DIR / file_name
-        audio_config = speechsdk.audio.AudioOutputConfig(filename=str(output_path))
-        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
+@app.get("/audio-jobs/{job_id}")
+async def get_audio_job(job_id: str):
+    """Status of a synthesis job; ``audio_url`` is set once it has completed"""
+    job = audio_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return audio_job_status(job)
+
+def audio_stream_status(stream) -> dict:
+    status = stream.status()
+    for segment in status["segments"]:
+        segment["audio_url"] = f"{AUDIOS_MOUNT}/{segment.pop('file')}" if segment["file"] else None
+    status["stream_url"] = f"/audio-stream/{stream.stream_id}"
+    if status.pop("complete"):
+        status["audio_url"] = f"{AUDIOS_MOUNT}/{audio_cache.file_name(stream.key)}"
+    return status
+
+@app.post("/audio-stream")
+async def start_audio_stream(payload: dict):
+    """Synthesize long text in sentence-sized chunks for progressive playback.
 
-        result = synthesizer.speak_text_async(text).get()
-        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-            raise HTTPException(status_code=500, detail="Audio synthesis failed")
+    Request body: { "text": str }
 
-        return {"audio_url": f"{AUDIOS_MOUNT}/{file_name}"}
-    except HTTPException:
-        raise
+    ``stream_url`` plays as one MP3 that grows as chunks are synthesized
+    (several at a time, in order); ``segments`` lists the chunks, each with
+    its own ``audio_url`` once ready (poll ``/audio-stream/{id}/segments``).
+    Text whose whole audio is already cached starts no stream: the answer is
+    just its ``audio_url``, as from ``/audio``. A stream that is neither
+    played nor polled for ``TTS_STREAM_IDLE_SECONDS`` stops synthesizing;
+    past ``TTS_MAX_STREAMS`` live streams the answer is 503 with Retry-After.
+    """
+    text = (payload or {}).get("text", "").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="text is required")
+    if tts_provider() not in TTS_PROVIDERS:
+        raise HTTPException(status_code=501, detail="TTS provider not configured or unsupported in this build. Set TTS_PROVIDER=azure.")
+    key = audio_cache.key(text)
+    if audio_cache.get(key) is not None:
+        return {"audio_url": f"{AUDIOS_MOUNT}/{audio_cache.file_name(key)}", "cached": True}
+    try:
+        stream = audio_streams.create(text)
+    except PoolSaturated as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
+    return audio_stream_status(stream)
+
+@app.get("/audio-stream/{stream_id}/segments")
+async def get_audio_stream_segments(stream_id: str):
+    stream = audio_streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    stream.touch()
+    return audio_stream_status(stream)
+
+@app.get("/audio-stream/{stream_id}")
+async def play_audio_stream(stream_id: str):
+    """The stream's chunks as one progressive MP3, each sent as soon as it and those before it are ready"""
+    stream = audio_streams.get(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found")
+
+    async def chunks():
+        stream.attach()
+        try:
+            for future in stream.futures:
+                if future.cancelled():
+                    break
+                # Shielded so a disconnecting listener does not cancel the shared chunk
+                path = await asyncio.shield(asyncio.wrap_future(future))
+                with open(path, "rb") as f:
+                    while True:
+                        data = f.read(64 * 1024)
+                        if not data:
+                            break
+                        yield data
+        except Exception as e:
+            # Headers are already sent; end the audio where synthesis stopped
+            print(f"Audio stream {stream_id} ended early: {e}")
+        finally:
+            stream.detach()
+
+    return StreamingResponse(chunks(), media_type="audio/mpeg", headers={"Cache-Control": "no-cache"})
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,203 @@
+import os
+import json
+import asyncio
+import threading
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
+
+import httpx
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+
+# Worth another attempt: Ollama is loading the model, restarting or overloaded
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class OllamaError(Exception):
+    """The Ollama API could not produce a reply"""
+
+
+class OllamaClient:
+    """Chat client for Ollama's REST API (``/api/chat``).
+
+    One ``httpx.AsyncClient`` keeps connections to the server alive between
+    messages, at most ``max_concurrency`` requests are in flight (the rest
+    wait their turn), and connection failures or retryable statuses are
+    retried with exponential backoff. A streamed reply is only retried until
+    its first token has been handed out.
+    """
+
+    def __init__(self, host: Optional[str] = None, timeout: Optional[float] = None,
+                 retries: Optional[int] = None, max_concurrency: Optional[int] = None):
+        self.host = (host or OLLAMA_HOST).rstrip("/")
+        self.timeout = httpx.Timeout(OLLAMA_TIMEOUT if timeout is None else timeout,
+                                     connect=OLLAMA_CONNECT_TIMEOUT)
+        self.retries = OLLAMA_RETRIES if retries is None else retries
+        self.max_concurrency = max_concurrency or OLLAMA_MAX_CONCURRENCY
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._in_flight = 0
+        self._requests = 0
+        self._retried = 0
+        self._failed = 0
+
+    def _ensure_client(self):
+        # Created lazily so both belong to the event loop that uses them
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency,
+                                  max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(base_url=self.host, timeout=self.timeout, limits=limits)
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def chat(self, model: str, messages: List[Dict[str, str]]) -> str:
+        """Complete reply to ``messages``"""
+        parts = []
+        async for delta in self.stream_chat(model, messages):
+            parts.append(delta)
+        return "".join(parts)
+
+    async def stream_chat(self, model: str, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Reply to ``messages`` in pieces as Ollama generates them"""
+        self._ensure_client()
+        body = {"model": model, "messages": messages, "stream": True}
+        self._waiting += 1
+        async with self._slots:
+            self._waiting -= 1
+            self._in_flight += 1
+            self._requests += 1
+            try:
+                attempt = 0
+                while True:
+                    started = False
+                    try:
+                        async with self._client.stream("POST", "/api/chat", json=body) as response:
+                            if response.status_code in RETRY_STATUSES:
+                                raise httpx.HTTPStatusError(f"Ollama answered {response.status_code}",
+                                                            request=response.request, response=response)
+                            if response.status_code != 200:
+                                await response.aread()
+                                raise OllamaError(f"Ollama answered {response.status_code}: {response.text[:200]}")
+                            async for line in response.aiter_lines():
+                                if not line.strip():
+                                    continue
+                                chunk = json.loads(line)
+                                if chunk.get("error"):
+                                    raise OllamaError(chunk["error"])
+                                delta = chunk.get("message", {}).get("content", "")
+                                if delta:
+                                    started = True
+                                    yield delta
+                                if chunk.get("done"):
+                                    break
+                        return
+                    except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                        if started or attempt >= self.retries:
+                            raise OllamaError(f"Ollama request failed: {e}") from e
+                        attempt += 1
+                        self._retried += 1
+                        await asyncio.sleep(0.25 * 2 ** (attempt - 1))
+            except BaseException as e:
+                if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                    self._failed += 1
+                raise
+            finally:
+                self._in_flight -= 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "requests": self._requests,
+            "retries": self._retried,
+            "failed": self._failed,
+        }
+
+
+class _LoopThread:
+    """An event loop on a daemon thread, so blocking callers can share one async client"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="ollama-client", daemon=True)
+        self.thread.start()
+
+    def run(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_runner: Optional[_LoopThread] = None
+_client: Optional[OllamaClient] = None
+_init_lock = threading.Lock()
+
+
+def get_client() -> OllamaClient:
+    global _runner, _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                _runner = _LoopThread()
+                _client = OllamaClient()
+    return _client
+
+
+def chat(model: str, messages: List[Dict[str, str]]) -> str:
+    """Blocking ``OllamaClient.chat`` on the shared client (for worker threads)"""
+    client = get_client()
+    return _runner.run(client.chat(model, messages))
+
+
+def stream_chat(model: str, messages: List[Dict[str, str]]) -> Iterator[str]:
+    """Blocking iterator over ``OllamaClient.stream_chat``; closing it cancels the request"""
+    client = get_client()
+    stream = client.stream_chat(model, messages)
+    try:
+        while True:
+            try:
+                yield _runner.run(stream.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        _runner.run(stream.aclose())
+
+
+def stats() -> Optional[Dict[str, Any]]:
+    """Client counters, or None if Ollama has not been used"""
+    return _client.stats() if _client is not None else None
+
+
+def close():
+    global _runner, _client
+    if _client is not None:
+        _runner.run(_client.aclose())
+        _runner.loop.call_soon_threadsafe(_runner.loop.stop)
+        _runner = _client = None
+
+
+if __name__ == "__main__":
+    # Throughput against a running Ollama (or `python ollama_stub.py`):
+    #   python ollama_client.py [messages] [concurrency]
+    import sys
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    model = os.getenv("OLLAMA_MODEL", "llama3")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        replies = list(pool.map(lambda i: chat(model, [{"role": "user", "content": f"message {i}"}]), range(count)))
+    elapsed = time.perf_counter() - start
+    print(f"{count} replies in {elapsed:.2f}s ({count / elapsed:.1f}/s)")
+    print(stats())
+    close()
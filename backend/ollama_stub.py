@@ -0,0 +1,68 @@
+import os
+import json
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for the Ollama REST API, for tests and load runs without a model:
+#   python ollama_stub.py [port]   then   OLLAMA_HOST=http://localhost:11434 LLM_PROVIDER=ollama
+STUB_DELAY_MS = float(os.getenv("OLLAMA_STUB_DELAY_MS", "20"))
+# Answer the first N chat requests with 503, as Ollama does while a model is loading
+STUB_FAIL_FIRST = int(os.getenv("OLLAMA_STUB_FAIL_FIRST", "0"))
+
+app = FastAPI(title="Ollama stub")
+state = {"requests": 0, "cancelled": 0}
+
+
+def stub_reply(messages) -> str:
+    prompt = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    return f"[ollama-stub] You asked about: {prompt[:400]}"
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "stub"}
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": os.getenv("OLLAMA_MODEL", "llama3")}]}
+
+
+@app.get("/stats")
+async def stats():
+    return state
+
+
+@app.post("/api/chat")
+async def chat(payload: dict):
+    state["requests"] += 1
+    if state["requests"] <= STUB_FAIL_FIRST:
+        return JSONResponse({"error": "model is loading"}, status_code=503)
+    model = payload.get("model", "llama3")
+    words = stub_reply(payload.get("messages", [])).split(" ")
+
+    if not payload.get("stream", True):
+        await asyncio.sleep(STUB_DELAY_MS / 1000.0 * len(words))
+        return {"model": model, "message": {"role": "assistant", "content": " ".join(words)}, "done": True}
+
+    async def lines():
+        try:
+            for i, word in enumerate(words):
+                await asyncio.sleep(STUB_DELAY_MS / 1000.0)
+                delta = word if i == len(words) - 1 else word + " "
+                yield json.dumps({"model": model, "message": {"role": "assistant", "content": delta},
+                                  "done": False}) + "\n"
+            yield json.dumps({"model": model, "message": {"role": "assistant", "content": ""},
+                              "done": True, "done_reason": "stop"}) + "\n"
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    import sys
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(sys.argv[1]) if len(sys.argv) > 1 else 11434)
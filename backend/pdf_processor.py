@@ -3,121 +3,159 @@ import json
 import fitz
 from bs4 import BeautifulSoup
 import re
-import pdfplumber
+import time
+import multiprocessing
+import threading
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from catalog import Catalog
+from embedding_service import EmbeddingBatcher
+from embedding_models import load_embedding_model, model_tag
+import metrics
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# Bump whenever extract_sections output changes; cached extractions are keyed by it
+PROCESSOR_VERSION = '2'
+
+
+def process_pool_context():
+    """Multiprocessing context for extraction pools.
+
+    Prefer fork: spawned workers would re-run main.py's module-level setup
+    (model loading included), while extraction workers never need the model.
+    """
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    return multiprocessing.get_context(method)
+
+
+def _collect_page_range(pdf_path: str, start: int, end: int):
+    """Process-pool entry point: collect candidates for a page range with its own fitz handle.
+
+    Returns ``(candidates, lines, stage_metrics)``; the metrics recorded here
+    are merged into the parent process's.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        candidates, lines = PDFProcessor(load_model=False)._collect_pages(doc, start, end)
+        return candidates, lines, metrics.drain_stages()
+    finally:
+        doc.close()
 
 class PDFProcessor:
-    def __init__(self):
-        """Initialize the PDF processor with integrated engines"""
+    # Upper bound on stored body text per section; top-level sections of long
+    # documents would otherwise duplicate most of the file into every ancestor.
+    max_content_chars = 4000
+    # Related sections must score above this cosine similarity
+    min_similarity = 0.3
+
+    def __init__(self, load_model: bool = True):
+        """Initialize the PDF processor with integrated engines.
+
+        The embedding model is loaded on first use (or by ``warm_up``), not
+        here, so constructing a processor is cheap. Pass ``load_model=False``
+        for extraction-only instances (e.g. ingest worker processes) that
+        never compute similarities.
+        """
         self.patterns = [
             r'^\d+\.\s+', r'^\d+\.\d+\s+', r'^Chapter\s+\d+', r'^[A-Z]\.\s+', r'^[IVX]+\.\s+',
             r'^Section\s+\d+', r'^Part\s+\d+', r'^Appendix\s+[A-Z]', r'^Table\s+\d+', r'^Figure\s+\d+',
             r'^[A-Z][A-Z\s\-]{5,}$'  # ALL CAPS
         ]
         
-        # Initialize sentence transformer model if available; otherwise fall back to TF-IDF
-        self.model = None
-        self._tfidf_vectorizer = None
-        try:
-            from sentence_transformers import SentenceTransformer
-            # Try to use a base model that will be downloaded
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            print("Sentence transformer model loaded successfully")
-        except Exception as e:
-            print(f"Could not load sentence transformer model (falling back to TF-IDF): {e}")
-            self.model = None
+        # Sentence transformer model if available; otherwise fall back to TF-IDF.
+        # model_state: cold -> loading -> ready | fallback ("disabled" never loads)
+        self._model = None
+        self.model_state = "cold" if load_model else "disabled"
+        self.embedding_backend = None
+        # Recorded with the section index; vectors from another tag are re-embedded
+        self.model_tag = MODEL_NAME
+        self._model_lock = threading.Lock()
+        self._index = None
+        # Searches run on a thread pool while the ingest writer updates the index
+        self._index_lock = threading.RLock()
+        # Coalesces concurrent query encodes into one model call
+        self.batcher = EmbeddingBatcher(self._encode_batch)
+
+    @property
+    def model(self):
+        """The sentence transformer, loaded on first access; None when unavailable"""
+        if self.model_state in ("cold", "loading"):
+            self._load_model()
+        return self._model
+
+    @property
+    def ready(self) -> bool:
+        """True once the model (or its fallback) and the section index are loaded"""
+        return self.model_state in ("ready", "fallback", "disabled") and self._index is not None
+
+    @property
+    def similarity_tag(self) -> str:
+        """What similarity scores come from: the embedding model tag, or TF-IDF"""
+        return self.model_tag if self.model is not None else "tfidf"
+
+    def _load_model(self):
+        with self._model_lock:
+            if self.model_state not in ("cold", "loading"):
+                return
+            self.model_state = "loading"
             try:
-                from sklearn.feature_extraction.text import TfidfVectorizer  # noqa: F401
-                self._tfidf_vectorizer = None  # lazy init in similarity fn
-            except Exception:
-                self._tfidf_vectorizer = None
+                # PyTorch or ONNX Runtime, per EMBEDDING_BACKEND; downloaded on first use
+                self._model, self.embedding_backend = load_embedding_model(MODEL_NAME)
+                self.model_tag = model_tag(MODEL_NAME, self.embedding_backend)
+                self.model_state = "ready"
+                print(f"Sentence transformer model loaded successfully ({self.embedding_backend})")
+            except Exception as e:
+                print(f"Could not load sentence transformer model (falling back to TF-IDF): {e}")
+                self._model = None
+                self.model_state = "fallback"
+
+    def warm_up(self, catalog: Catalog):
+        """Load the model and section index and run one query, so the first request is fast"""
+        index = self._get_index(catalog)
+        self._search_index(index, ["warm up"], 1)
+
+    def extract_sections(self, pdf_path: str, page_workers: Optional[int] = None,
+                         raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Extract sections from PDF using integrated engine logic.
 
-    def extract_sections(self, pdf_path: str) -> List[Dict[str, Any]]:
-        """Extract sections from PDF using integrated engine logic"""
+        Documents of at least ``PDF_PAGE_PARALLEL_MIN_PAGES`` pages have their
+        page range split across ``page_workers`` processes (default
+        ``PDF_PAGE_WORKERS`` or the core count); pass ``page_workers=1`` to
+        force the serial path. Both paths produce identical sections.
+        A failed extraction returns no sections, or raises with ``raise_errors``.
+        """
         try:
             doc = fitz.open(pdf_path)
-            candidates = []
+            page_count = len(doc)
+            workers = self._page_workers(page_count, page_workers)
             
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                blocks = page.get_text('dict')
-                all_spans = []
-                
-                for block in blocks.get('blocks', []):
-                    if 'lines' in block:
-                        for line in block['lines']:
-                            for span in line['spans']:
-                                text = span['text'].strip()
-                                if not text or len(text) < 1 or len(text) > 200:
-                                    continue
-                                all_spans.append({
-                                    'text': text,
-                                    'font': span['font'],
-                                    'size': span['size'],
-                                    'flags': span.get('flags', 0),
-                                    'bbox': list(span['bbox']),
-                                    'page': page_num
-                                })
-                
-                all_spans.sort(key=lambda s: (s['page'], s['bbox'][1], s['bbox'][0]))
-                i = 0
-                
-                while i < len(all_spans):
-                    current = all_spans[i]
-                    merged_text = current['text']
-                    merged_bbox = current['bbox'][:]
-                    j = i + 1
-                    
-                    while j < len(all_spans):
-                        next_span = all_spans[j]
-                        if (next_span['page'] == current['page'] and
-                            next_span['font'] == current['font'] and
-                            abs(next_span['size'] - current['size']) < 0.5 and
-                            next_span['flags'] == current['flags'] and
-                            0 <= next_span['bbox'][1] - merged_bbox[3] < 10):
-                            if (len(merged_text) < 30 or next_span['text'][0].islower() or not merged_text.endswith(('.', ':', ';'))):
-                                merged_text += ' ' + next_span['text']
-                                merged_bbox[2] = max(merged_bbox[2], next_span['bbox'][2])
-                                merged_bbox[3] = next_span['bbox'][3]
-                                j += 1
-                                continue
-                        break
-                    
-                    if len(merged_text) >= 5:
-                        font_size = current['size']
-                        is_bold = 'bold' in current['font'].lower() or (current['flags'] & 2**4)
-                        pattern_score = 0
-                        
-                        for pattern in self.patterns:
-                            if re.match(pattern, merged_text):
-                                pattern_score += 10
-                        
-                        all_caps = merged_text.isupper() and len(merged_text) > 5
-                        length_score = 3 if 8 <= len(merged_text) <= 60 else 1
-                        score = 0
-                        score += int(font_size > 0) * int(font_size)
-                        score += 8 if is_bold else 0
-                        score += pattern_score
-                        score += 5 if all_caps else 0
-                        score += length_score
-                        
-                        candidates.append({
-                            'level': 'H1',  # temporary, will be replaced by clustering
-                            'text': merged_text,
-                            'page': current['page'],
-                            'score': score,
-                            'y': merged_bbox[1],
-                            'font_size': font_size
-                        })
-                    i = j
+            if workers > 1:
+                doc.close()
+                bounds = [page_count * k // workers for k in range(workers + 1)]
+                with ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context()) as pool:
+                    results = list(pool.map(_collect_page_range, [pdf_path] * workers, bounds[:-1], bounds[1:]))
+                chunks = []
+                for chunk_candidates, chunk_lines, stage_metrics in results:
+                    metrics.merge_stages(stage_metrics)
+                    chunks.append((chunk_candidates, chunk_lines))
+            else:
+                chunks = [self._collect_pages(doc, 0, page_count)]
+                doc.close()
             
-            doc.close()
+            # Stitch per-chunk candidates together; line indexes become document-global
+            candidates = []
+            lines = []
+            for chunk_candidates, chunk_lines in chunks:
+                for c in chunk_candidates:
+                    c['line'] += len(lines)
+                candidates.extend(chunk_candidates)
+                lines.extend(chunk_lines)
             
             # Assign heading levels
-            candidates = self._assign_heading_levels(candidates)
+            with metrics.timed("level_assignment", len(candidates)):
+                candidates = self._assign_heading_levels(candidates)
             
             # Filter and clean headings
             final_headings = self._filter_headings(candidates)
@@ -126,21 +164,133 @@ class PDFProcessor:
             final_headings = self._reconstruct_phrases(final_headings)
             
             # Convert to section format
+            with metrics.timed("content_extraction", len(final_headings)):
+                contents = self._section_contents(lines, final_headings)
             sections = []
-            for h in final_headings:
+            for h, content in zip(final_headings, contents):
                 sections.append({
                     'title': h['text'],
                     'level': h['level'],
                     'page': h['page'],
-                    'content': self._extract_section_content(pdf_path, h['page'], h['text'])
+                    'content': content
                 })
             
             return sections
             
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error extracting sections: {e}")
             return []
 
+    def _page_workers(self, page_count: int, page_workers: Optional[int]) -> int:
+        if page_workers is None:
+            if page_count < int(os.getenv("PDF_PAGE_PARALLEL_MIN_PAGES", "200")):
+                return 1
+            page_workers = int(os.getenv("PDF_PAGE_WORKERS", "0")) or os.cpu_count() or 1
+        return max(1, min(page_workers, page_count))
+
+    def _collect_pages(self, doc, start: int, end: int):
+        """Collect candidates and lines for pages ``start``..``end - 1`` of an open document"""
+        candidates = []
+        lines = []
+        for page_num in range(start, end):
+            page_candidates, page_lines = self._collect_page_candidates(doc[page_num], page_num)
+            for c in page_candidates:
+                c['line'] += len(lines)
+            candidates.extend(page_candidates)
+            lines.extend(page_lines)
+        return candidates, lines
+
+    def _collect_page_candidates(self, page, page_num: int):
+        """Collect heading candidates and text lines for a single page.
+
+        Returns ``(candidates, lines)``. Each candidate carries a ``line`` index
+        into ``lines`` (page-local) so section bodies can be sliced later without
+        reopening the document.
+        """
+        started = time.perf_counter()
+        blocks = page.get_text('dict')
+        all_spans = []
+        
+        for block in blocks.get('blocks', []):
+            if 'lines' in block:
+                for line in block['lines']:
+                    for span in line['spans']:
+                        text = span['text'].strip()
+                        if not text or len(text) < 1 or len(text) > 200:
+                            continue
+                        all_spans.append({
+                            'text': text,
+                            'font': span['font'],
+                            'size': span['size'],
+                            'flags': span.get('flags', 0),
+                            'bbox': list(span['bbox']),
+                            'page': page_num
+                        })
+        
+        all_spans.sort(key=lambda s: (s['page'], s['bbox'][1], s['bbox'][0]))
+        merge_started = time.perf_counter()
+        metrics.observe("span_collection", merge_started - started, 1)
+        candidates = []
+        lines = []
+        i = 0
+        
+        while i < len(all_spans):
+            current = all_spans[i]
+            merged_text = current['text']
+            merged_bbox = current['bbox'][:]
+            j = i + 1
+            
+            while j < len(all_spans):
+                next_span = all_spans[j]
+                if (next_span['page'] == current['page'] and
+                    next_span['font'] == current['font'] and
+                    abs(next_span['size'] - current['size']) < 0.5 and
+                    next_span['flags'] == current['flags'] and
+                    0 <= next_span['bbox'][1] - merged_bbox[3] < 10):
+                    if (len(merged_text) < 30 or next_span['text'][0].islower() or not merged_text.endswith(('.', ':', ';'))):
+                        merged_text += ' ' + next_span['text']
+                        merged_bbox[2] = max(merged_bbox[2], next_span['bbox'][2])
+                        merged_bbox[3] = next_span['bbox'][3]
+                        j += 1
+                        continue
+                break
+            
+            lines.append(merged_text)
+            
+            if len(merged_text) >= 5:
+                font_size = current['size']
+                is_bold = 'bold' in current['font'].lower() or (current['flags'] & 2**4)
+                pattern_score = 0
+                
+                for pattern in self.patterns:
+                    if re.match(pattern, merged_text):
+                        pattern_score += 10
+                
+                all_caps = merged_text.isupper() and len(merged_text) > 5
+                length_score = 3 if 8 <= len(merged_text) <= 60 else 1
+                score = 0
+                score += int(font_size > 0) * int(font_size)
+                score += 8 if is_bold else 0
+                score += pattern_score
+                score += 5 if all_caps else 0
+                score += length_score
+                
+                candidates.append({
+                    'level': 'H1',  # temporary, will be replaced by clustering
+                    'text': merged_text,
+                    'page': current['page'],
+                    'score': score,
+                    'y': merged_bbox[1],
+                    'font_size': font_size,
+                    'line': len(lines) - 1
+                })
+            i = j
+        
+        metrics.observe("span_merge", time.perf_counter() - merge_started, len(all_spans))
+        return candidates, lines
+
     def _assign_heading_levels(self, headings):
         """Assign heading levels based on font size clustering"""
         if not headings:
@@ -186,7 +336,8 @@ class PDFProcessor:
                 'page': h['page'],
                 'y': y if y is not None else 0,
                 'score': h.get('score', 0),
-                'font_size': h.get('font_size', 0)
+                'font_size': h.get('font_size', 0),
+                'line': h.get('line', 0)
             })
         
         filtered.sort(key=lambda h: (h['page'], h['y']))
@@ -200,6 +351,7 @@ class PDFProcessor:
         while i < len(headings):
             h = headings[i]
             phrase = h['text']
+            end_line = h.get('line', 0)
             j = i + 1
             
             while (j < len(headings) and
@@ -208,155 +360,202 @@ class PDFProcessor:
                    headings[j]['level'] == h['level'] and
                    abs(headings[j]['y'] - h['y']) < 30):
                 phrase += ' ' + headings[j]['text']
+                end_line = headings[j].get('line', end_line)
                 j += 1
             
             reconstructed.append({
                 'level': h['level'],
                 'text': phrase.strip(),
-                'page': h['page']
+                'page': h['page'],
+                'line': h.get('line', 0),
+                'end_line': end_line
             })
             i = j
         
         return reconstructed
 
-    def _extract_section_content(self, pdf_path: str, page_num: int, section_title: str) -> str:
-        """Extract content for a specific section"""
+    def _section_contents(self, lines: List[str], headings: List[Dict]) -> List[str]:
+        """Slice each heading's body out of the document's text lines.
+
+        A section runs from the line after its heading up to the next heading of
+        the same or a higher level, so bodies continue across page breaks.
+        """
+        contents = [''] * len(headings)
+        next_start = {}  # level -> line index of the closest following heading
+        
+        for i in range(len(headings) - 1, -1, -1):
+            h = headings[i]
+            bound = min((start for level, start in next_start.items() if level <= h['level']), default=len(lines))
+            body = '\n'.join(lines[h['end_line'] + 1:bound]).strip()
+            if len(body) > self.max_content_chars:
+                body = body[:self.max_content_chars].rstrip()
+            contents[i] = body
+            next_start[h['level']] = h['line']
+        
+        return contents
+
+    def index_document(self, filename: str, sections: List[Dict], catalog: Catalog):
+        """Add a processed document's sections to the persistent section index"""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                if page_num < len(pdf.pages):
-                    page = pdf.pages[page_num]
-                    text = page.extract_text() or ""
-                    
-                    # Find the section content after the title
-                    lines = text.split('\n')
-                    content_start = -1
-                    
-                    for i, line in enumerate(lines):
-                        if section_title.lower() in line.lower():
-                            content_start = i + 1
-                            break
-                    
-                    if content_start >= 0:
-                        content_lines = lines[content_start:content_start + 20]  # Get next 20 lines
-                        return '\n'.join(content_lines).strip()
-                    else:
-                        return text[:500]  # Return first 500 chars if section not found
-                
-                return ""
+            index = self._get_index(catalog)
+            item = self._index_item(filename, sections)
+            with self._index_lock:
+                index.add_documents([item])
         except Exception as e:
-            print(f"Error extracting section content: {e}")
-            return ""
+            print(f"Error indexing {filename}: {e}")
+
+    def remove_document(self, filename: str, catalog: Catalog):
+        """Drop a deleted document's sections from the section index"""
+        index = self._get_index(catalog)
+        with self._index_lock:
+            index.remove(filename)
+
+    def _get_index(self, catalog: Catalog):
+        """Return the section index stored next to the catalog, building it if needed.
+
+        Without an embedding model this is the corpus TF-IDF index instead.
+        """
+        index_dir = catalog.data_dir / ("index" if self.model is not None else "index_tfidf")
+        with self._index_lock:
+            if self._index is None or self._index.index_dir != index_dir:
+                # Imported here so that importing this module stays cheap
+                if self.model is not None:
+                    from section_index import SectionIndex
+                    index = SectionIndex(str(index_dir), self.model_tag)
+                else:
+                    from tfidf_index import TfidfSectionIndex
+                    index = TfidfSectionIndex(str(index_dir))
+                self._sync_index(index, catalog)
+                self._index = index
+            else:
+                self._index.reload_if_changed()
+            return self._index
+
+    def _sync_index(self, index, catalog: Catalog):
+        """Bring the index in line with the catalog (documents from before the index existed)"""
+        catalogued = set(catalog.document_names())
+        indexed = index.documents()
+        stale = indexed - catalogued
+        if stale:
+            index.remove_documents(list(stale))
+        items = []
+        for name, sections in catalog.iter_sections(sorted(catalogued - indexed)):
+            try:
+                items.append(self._index_item(name, sections))
+            except Exception as e:
+                print(f"Error indexing {name}: {e}")
+        if items:
+            index.add_documents(items)
+
+    def _index_item(self, filename: str, sections: List[Dict]):
+        rows = [{
+            'position': position,
+            'title': section['title'],
+            'page': section['page'],
+            'snippet': self.make_snippet(section.get('content') or section.get('title', ''))
+        } for position, section in enumerate(sections)]
+        return filename, rows, self._encode([row['title'] for row in rows])
+
+    def _encode(self, texts: List[str]):
+        """Batch-encode texts into L2-normalised embedding rows.
+
+        Without an embedding model the texts are returned unchanged; the TF-IDF
+        index tokenizes them itself. Small requests (typically search queries
+        from concurrent handlers) are coalesced by the embedding batcher.
+        """
+        if self.model is None:
+            return list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if len(texts) >= self.batcher.max_batch_size:
+            # Already a full batch (e.g. indexing a document); nothing to coalesce
+            return self._encode_batch(texts)
+        return self.batcher.encode(texts)
+
+    def embed_texts(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Normalised embeddings from the section model, or None under the TF-IDF fallback"""
+        if self.model is None:
+            return None
+        return self._encode(texts)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        with metrics.timed("embedding", len(texts)):
+            return self.model.encode(texts, batch_size=64, convert_to_numpy=True,
+                                     normalize_embeddings=True).astype(np.float32)
 
-    def find_related_sections(self, current_sections: List[Dict], processed_dir: str) -> List[Dict]:
+    def _search_index(self, index, queries: List[str], top_k: int,
+                      probes: Optional[int] = None) -> List[Dict]:
+        """Score all queries against the index with one batched encode and matrix product"""
+        vectors = self._encode(queries)
+        with self._index_lock, metrics.timed("similarity", len(queries)):
+            hits = index.search(vectors, top_k, min_score=self.min_similarity, exclude_titles=queries, probes=probes)
+        related_sections = []
+        for query, query_hits in zip(queries, hits):
+            for row, similarity in query_hits:
+                related_sections.append(self.related_entry(query, row['document'], row['title'], row['page'],
+                                                           row['snippet'], similarity))
+        related_sections.sort(key=lambda x: x['similarity_score'], reverse=True)
+        return related_sections
+
+    def related_entry(self, query: str, document: str, title: str, page: int, snippet: str,
+                      similarity: float) -> Dict[str, Any]:
+        """One related-section result as returned by the API"""
+        return {
+            'source_document': document,
+            'section_title': title,
+            'similarity_score': similarity,
+            'page': page,
+            'snippet': snippet,
+            'relevance_explanation': self._generate_relevance_explanation(query, title)
+        }
+
+    def reverse_neighbors(self, filename: str, top_k: int, catalog: Catalog):
+        """For sections of other documents, their ``top_k`` closest sections of ``filename``.
+
+        Returns ``{(document, position): [(filename, position, score), ...]}``.
+        """
+        index = self._get_index(catalog)
+        with self._index_lock:
+            with metrics.timed("similarity"):
+                matches = index.reverse_neighbors(filename, top_k, min_score=self.min_similarity)
+            rows = index.rows
+            return {(rows[i]['document'], rows[i]['position']):
+                    [(filename, rows[j]['position'], score) for j, score in found]
+                    for i, found in matches.items()}
+
+    def search_sections(self, titles: List[str], top_k: int, catalog: Catalog,
+                        exclude_documents: Optional[List[str]] = None):
+        """Raw ``(row, score)`` index hits per title; rows carry ``document`` and ``position``"""
+        index = self._get_index(catalog)
+        vectors = self._encode(titles)
+        with self._index_lock, metrics.timed("similarity", len(titles)):
+            return index.search(vectors, top_k, min_score=self.min_similarity, exclude_titles=titles,
+                                exclude_documents=exclude_documents)
+
+    def find_related_sections(self, current_sections: List[Dict], catalog: Catalog,
+                              probes: Optional[int] = None) -> List[Dict]:
         """Find related sections from uploaded documents using integrated engine logic"""
-        # Allow fallback path even if embedding model is not available
-        
         try:
-            related_sections = []
-            
-            # Get all processed documents
-            processed_files = list(Path(processed_dir).glob("*.json"))
-            
-            for section in current_sections[:3]:  # Analyze first 3 sections
-                section_text = section['title']
-                if len(section_text) < 10:
-                    continue
-                
-                # Find related sections across all documents
-                for doc_file in processed_files:
-                    with open(doc_file, 'r', encoding='utf-8') as f:
-                        doc_data = json.load(f)
-                    
-                    for doc_section in doc_data['sections']:
-                        if doc_section['title'] == section_text:
-                            continue
-                        
-                        # Calculate similarity
-                        similarity = self._calculate_similarity(section_text, doc_section['title'])
-                        
-                        if similarity > 0.3:  # Threshold for relevance
-                            snippet = self._make_snippet(doc_section.get('content') or doc_section.get('title', ''))
-                            related_sections.append({
-                                'source_document': doc_data['filename'],
-                                'section_title': doc_section['title'],
-                                'similarity_score': similarity,
-                                'page': doc_section['page'],
-                                'snippet': snippet,
-                                'relevance_explanation': self._generate_relevance_explanation(section_text, doc_section['title'])
-                            })
-            
-            # Sort by similarity and return top results
-            related_sections.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return related_sections[:5]  # Return top 5 related sections
+            index = self._get_index(catalog)
+            # Analyze first 3 sections
+            queries = [s['title'] for s in current_sections[:3] if len(s['title']) >= 10]
+            return self._search_index(index, queries, 5, probes)[:5]
             
         except Exception as e:
             print(f"Error finding related sections: {e}")
             return []
 
-    def find_related_sections_for_section(self, section_text: str, processed_dir: str) -> List[Dict]:
+    def find_related_sections_for_section(self, section_text: str, catalog: Catalog,
+                                          probes: Optional[int] = None) -> List[Dict]:
         """Find related sections for a specific section text"""
-        # Allow fallback path even if embedding model is not available
-        
         try:
-            related_sections = []
-            processed_files = list(Path(processed_dir).glob("*.json"))
-            
-            for doc_file in processed_files:
-                with open(doc_file, 'r', encoding='utf-8') as f:
-                    doc_data = json.load(f)
-                
-                for doc_section in doc_data['sections']:
-                    if doc_section['title'] == section_text:
-                        continue
-                    
-                    similarity = self._calculate_similarity(section_text, doc_section['title'])
-                    
-                    if similarity > 0.3:
-                        snippet = self._make_snippet(doc_section.get('content') or doc_section.get('title', ''))
-                        related_sections.append({
-                            'source_document': doc_data['filename'],
-                            'section_title': doc_section['title'],
-                            'similarity_score': similarity,
-                            'page': doc_section['page'],
-                            'snippet': snippet,
-                            'relevance_explanation': self._generate_relevance_explanation(section_text, doc_section['title'])
-                        })
-            
-            related_sections.sort(key=lambda x: x['similarity_score'], reverse=True)
-            return related_sections[:3]
+            index = self._get_index(catalog)
+            return self._search_index(index, [section_text], 3, probes)
             
         except Exception as e:
             print(f"Error finding related sections for section: {e}")
             return []
 
-    def _calculate_similarity(self, text1: str, text2: str) -> float:
-        """Calculate semantic similarity between two texts"""
-        try:
-            if self.model is not None:
-                embeddings = self.model.encode([text1, text2])
-                similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
-                return float(similarity)
-            # Fallback to TF-IDF cosine similarity
-            try:
-                from sklearn.feature_extraction.text import TfidfVectorizer
-                vectorizer = self._tfidf_vectorizer or TfidfVectorizer(stop_words='english', ngram_range=(1, 2))
-                tfidf = vectorizer.fit_transform([text1, text2])
-                sim = cosine_similarity(tfidf[0], tfidf[1])[0][0]
-                # cache vectorizer to reuse vocabulary
-                self._tfidf_vectorizer = vectorizer
-                return float(sim)
-            except Exception:
-                # very naive lexical overlap as last resort
-                s1 = set(w.lower() for w in text1.split())
-                s2 = set(w.lower() for w in text2.split())
-                if not s1 or not s2:
-                    return 0.0
-                overlap = len(s1 & s2) / float(len(s1 | s2))
-                return overlap
-        except Exception as e:
-            print(f"Error calculating similarity: {e}")
-            return 0.0
-
     def _generate_relevance_explanation(self, source_text: str, target_text: str) -> str:
         """Generate a brief explanation of why two sections are related"""
         try:
@@ -375,7 +574,7 @@ class PDFProcessor:
         except Exception as e:
             return "Related content identified through AI analysis"
     
-    def _make_snippet(self, text: str) -> str:
+    def make_snippet(self, text: str) -> str:
         """Create a 2-4 sentence snippet from section content."""
         try:
             if not text:
@@ -0,0 +1,318 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import asyncio
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable
+
+from starlette.datastructures import QueryParams
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("processed", "profiles"))
+# Requests slower than this are kept even without the flag (0 = only flagged requests)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_CAPTURES = int(os.getenv("PROFILE_MAX_CAPTURES", "100"))
+# When set, the flag must carry this value instead of "1"; when not, only local clients may profile
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY = "profile"
+TOP_FUNCTIONS = 25
+_CAPTURE_ID = re.compile(r"^[0-9A-Za-z-]+$")
+
+# Innermost frames of threads that are blocked rather than working (idle pool
+# workers, an event loop with nothing to do); such threads are left out of samples
+IDLE_LEAVES = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("selectors.py", "select"),
+               ("queue.py", "get"), ("thread.py", "_worker"), ("connection.py", "_recv"), ("connection.py", "_poll")}
+
+
+def requested(value: Optional[str]) -> bool:
+    """Whether a header or query value asks for a profile"""
+    if not value:
+        return False
+    if PROFILE_TOKEN:
+        return value == PROFILE_TOKEN
+    return value.lower() in ("1", "true", "yes")
+
+
+def is_local(client) -> bool:
+    """Whether an ASGI ``client`` (host, port) is on this machine"""
+    return bool(client) and client[0] in LOCAL_HOSTS
+
+
+def flagged_scope(scope) -> bool:
+    """Whether an ASGI request carries the profile header or query flag, without parsing the rest"""
+    if not PROFILE_TOKEN and not is_local(scope.get("client")):
+        return False
+    header = PROFILE_HEADER.encode()
+    for name, value in scope["headers"]:
+        if name == header:
+            return requested(value.decode("latin-1"))
+    query = scope.get("query_string", b"")
+    return PROFILE_QUERY.encode() + b"=" in query and requested(QueryParams(query).get(PROFILE_QUERY))
+
+
+def authorized(token: Optional[str], client) -> bool:
+    """Access to the captures: the ``PROFILE_TOKEN`` if one is set, else local clients only.
+
+    Captures hold stack frames and source paths, so they are never open to
+    the network without a token.
+    """
+    if PROFILE_TOKEN:
+        return token == PROFILE_TOKEN
+    return is_local(client)
+
+
+def new_capture_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def top_functions(self_counts: Dict[str, float], total_counts: Dict[str, float],
+                  limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+    ranked = sorted(total_counts, key=lambda f: (-self_counts.get(f, 0), -total_counts[f]))[:limit]
+    return [{"function": f, "self": round(self_counts.get(f, 0), 6), "total": round(total_counts[f], 6)}
+            for f in ranked]
+
+
+class StackSampler:
+    """Samples the Python stacks of every thread at a fixed interval.
+
+    Each active capture collects the samples taken while it is open, as
+    collapsed stacks (``thread;outer;...;inner``). Handlers hand work to pool
+    threads, so all threads are sampled; work from concurrent requests shows
+    up in each other's captures, which record how many were in flight. The
+    sampling thread sleeps while no capture is open.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._captures: Dict[str, Dict[str, Any]] = {}
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, capture_id: str):
+        with self._lock:
+            self._captures[capture_id] = {"stacks": Counter(), "ticks": 0, "max_concurrent": 1}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, capture_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._captures.pop(capture_id)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._captures
+            if idle:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            stacks = self._sample(me)
+            with self._lock:
+                for capture in self._captures.values():
+                    capture["stacks"].update(stacks)
+                    capture["ticks"] += 1
+                    capture["max_concurrent"] = max(capture["max_concurrent"], len(self._captures))
+            time.sleep(self.interval)
+
+    def _sample(self, me: int) -> List[str]:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                label = self._labels.get(code)
+                if label is None:
+                    label = self._labels[code] = _label(code.co_filename, code.co_firstlineno, code.co_name)
+                labels.append(label)
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks.append(";".join(reversed(labels)))
+        return stacks
+
+
+class ProfileStore:
+    """Captures on disk: the profile itself plus ``<id>.json`` with the request metadata.
+
+    Sampled captures are collapsed stacks (``<id>.collapsed``, one
+    ``stack count`` line each, for flamegraph.pl or speedscope); deterministic
+    ones are ``pstats`` files (``<id>.prof``). Only the newest
+    ``max_captures`` are kept.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, max_captures: int = PROFILE_MAX_CAPTURES):
+        self.directory = Path(directory)
+        self.max_captures = max_captures
+
+    def save_samples(self, capture_id: str, meta: Dict[str, Any], capture: Dict[str, Any], interval: float):
+        stacks = capture["stacks"]
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")[1:]
+            if frames:
+                self_counts[frames[-1]] += count
+                total_counts.update({f: count for f in set(frames)})
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{capture_id}.collapsed").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), encoding="utf-8")
+        self._write_meta(capture_id, ".collapsed",
+                         dict(meta, kind="sampled", unit="samples", interval_ms=round(interval * 1000, 3), samples=capture["ticks"],
+                              max_concurrent=capture["max_concurrent"],
+                              top=top_functions(self_counts, total_counts)))
+
+    def save_pstats(self, capture_id: str, meta: Dict[str, Any], profiler: cProfile.Profile):
+        stats = pstats.Stats(profiler)
+        self_times = {_label(*key): tt for key, (_, _, tt, _, _) in stats.stats.items()}
+        total_times = {_label(*key): ct for key, (_, _, _, ct, _) in stats.stats.items()}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(str(self.directory / f"{capture_id}.prof"))
+        self._write_meta(capture_id, ".prof", dict(meta, kind="cprofile", unit="seconds", top=top_functions(self_times, total_times)))
+
+    def _write_meta(self, capture_id: str, suffix: str, meta: Dict[str, Any]):
+        # Written last and renamed into place, so a listed capture always has its profile
+        meta = dict(meta, id=capture_id, file=f"{capture_id}{suffix}")
+        temp = self.directory / f".{capture_id}.json.tmp"
+        temp.write_text(json.dumps(meta, indent=1), encoding="utf-8")
+        os.replace(temp, self.directory / f"{capture_id}.json")
+        self._prune()
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest captures first, without their function tables"""
+        captures = []
+        for path in sorted(self.directory.glob("*.json"), reverse=True)[:max(0, limit)]:
+            try:
+                meta = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            meta.pop("top", None)
+            captures.append(meta)
+        return captures
+
+    def get(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        if not _CAPTURE_ID.match(capture_id):
+            return None
+        try:
+            return json.loads((self.directory / f"{capture_id}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def path(self, capture_id: str) -> Optional[Path]:
+        """The profile file of a capture, if it exists"""
+        meta = self.get(capture_id)
+        if meta is None:
+            return None
+        path = self.directory / meta["file"]
+        return path if path.exists() else None
+
+    def _prune(self):
+        # Capture ids start with their timestamp, so name order is age order
+        for path in sorted(self.directory.glob("*.json"), reverse=True)[self.max_captures:]:
+            capture_id = path.stem
+            for suffix in (".json", ".collapsed", ".prof"):
+                (self.directory / f"{capture_id}{suffix}").unlink(missing_ok=True)
+
+
+def run_profiled(meta: Dict[str, Any], fn: Callable, *args, **kwargs):
+    """Call ``fn`` under cProfile and store the capture (for work outside a request, e.g. ingest).
+
+    Returns ``(result, capture_id)``.
+    """
+    capture_id = new_capture_id()
+    profiler = cProfile.Profile()
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        return profiler.runcall(fn, *args, **kwargs), capture_id
+    finally:
+        try:
+            ProfileStore().save_pstats(capture_id, dict(meta, started_at=started_at,
+                                                         duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                                                         pid=os.getpid()), profiler)
+        except Exception as e:
+            print(f"Could not save profile {capture_id}: {e}")
+
+
+class ProfilingMiddleware:
+    """Samples requests flagged with ``X-Profile: 1`` or ``?profile=1``, and, with
+    ``PROFILE_SLOW_MS`` set, every request so those slower than it can be kept.
+
+    Without ``PROFILE_TOKEN`` only local clients can flag a request. Flagged
+    responses carry an ``X-Profile-Id`` header naming their capture.
+    The capture covers the whole response, streamed bodies included.
+    """
+
+    def __init__(self, app, store: Optional[ProfileStore] = None, slow_ms: float = PROFILE_SLOW_MS,
+                 interval_ms: float = PROFILE_INTERVAL_MS, exclude_prefix: str = "/admin/profiles"):
+        self.app = app
+        self.store = store or ProfileStore()
+        self.slow_ms = slow_ms
+        self.sampler = StackSampler(interval_ms / 1000.0)
+        self.exclude_prefix = exclude_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_prefix):
+            await self.app(scope, receive, send)
+            return
+        flagged = flagged_scope(scope)
+        if not flagged and self.slow_ms <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        capture_id = new_capture_id()
+        response = {"status": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if flagged:
+                    message = dict(message, headers=list(message.get("headers", [])) +
+                                   [(b"x-profile-id", capture_id.encode())])
+            await send(message)
+
+        started_at, start = time.time(), time.perf_counter()
+        self.sampler.start(capture_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            capture = self.sampler.stop(capture_id)
+            duration_ms = (time.perf_counter() - start) * 1000
+            # A request shorter than the sampling interval may have no samples; don't keep it as slow
+            if flagged or (duration_ms >= self.slow_ms and capture["stacks"]):
+                meta = {
+                    "trigger": "flag" if flagged else "slow",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": response["status"],
+                    "started_at": started_at,
+                    "duration_ms": round(duration_ms, 3),
+                }
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.store.save_samples, capture_id, meta, capture, self.sampler.interval)
+                except Exception as e:
+                    print(f"Could not save profile {capture_id}: {e}")
@@ -0,0 +1,102 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "900"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace so trivially different selections share a cache entry"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class QueryResultCache:
+    """LRU + TTL cache for search results, bounded by entry count and bytes.
+
+    Callers put the catalog's ``corpus_version`` in every key, so entries
+    from before an ingest or delete are never looked up again and simply
+    age out. Since a search may still be running against the old index
+    while a write lands, ``invalidate`` also bumps a generation counter:
+    ``put`` drops results computed under an older generation than the
+    current one. Cached values are shared and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        self.max_entries = QUERY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = QUERY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = QUERY_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        """Store ``value`` unless the cache was invalidated after ``generation`` was read"""
+        size = len(json.dumps(value, default=str))
+        with self._lock:
+            if generation != self.generation or size > self.max_bytes or self.max_entries <= 0:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop everything; results still being computed will not be stored"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "generation": self.generation,
+            }
+
+    def _drop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
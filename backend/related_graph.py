@@ -0,0 +1,114 @@
+import os
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+RELATED_GRAPH_K = int(os.getenv("RELATED_GRAPH_K", "10"))
+
+Key = Tuple[str, int]
+Edge = Tuple[str, int, float]
+
+
+class RelatedSectionsGraph:
+    """k-nearest-neighbour graph between sections of different documents.
+
+    Every section keeps its ``k`` most similar sections from *other*
+    documents in the catalog (``section_neighbors``), so related sections
+    for any section are a lookup instead of a search.
+
+    The graph is maintained incrementally as documents come and go:
+
+    - a new document gets its own lists from one batched index search;
+    - every other section is scored against the new document's sections
+      (one exact pass over the index) and the new candidates are merged into
+      its list; only lists that actually change are written;
+    - lists that pointed into a removed or replaced document are recomputed.
+
+    Under the TF-IDF fallback, stored scores reflect the IDF weights at the
+    time a list was written, so they drift slightly as the corpus grows.
+    """
+
+    def __init__(self, processor, catalog, k: Optional[int] = None):
+        self.processor = processor
+        self.catalog = catalog
+        self.k = k or RELATED_GRAPH_K
+        self._lock = threading.Lock()
+
+    def add_document(self, filename: str, sections: List[Dict[str, Any]]):
+        """Build the lists of a newly stored document and fold it into existing lists"""
+        with self._lock:
+            stale = self.catalog.sections_referencing(filename)
+            titles = [s['title'] for s in sections]
+            hits = self.processor.search_sections(titles, self.k, self.catalog,
+                                                  exclude_documents=[filename] * len(titles)) if titles else []
+            updates: Dict[Key, List[Edge]] = {
+                (filename, position): [(row['document'], row['position'], score) for row, score in section_hits]
+                for position, section_hits in enumerate(hits)
+            }
+            reverse = self.processor.reverse_neighbors(filename, self.k, self.catalog)
+
+            # Lists that referenced an earlier version of this file are rebuilt below
+            stale_keys = set(stale)
+            merge_keys = [key for key in reverse if key not in stale_keys]
+            current = self.catalog.get_neighbor_lists(merge_keys)
+            for key in merge_keys:
+                existing = current.get(key, [])
+                merged = sorted(existing + reverse[key], key=lambda edge: -edge[2])[:self.k]
+                if merged != existing:
+                    updates[key] = merged
+            updates.update(self._recompute(stale))
+            self.catalog.replace_neighbors(updates, built=[filename])
+
+    def remove_document(self, filename: str):
+        """Rebuild the lists that pointed into a deleted document (its own went with it)"""
+        with self._lock:
+            self.catalog.replace_neighbors(self._recompute(self.catalog.sections_referencing(filename)))
+
+    def sync(self, config: str):
+        """Build lists for documents stored before the graph existed.
+
+        ``config`` identifies what the scores came from (model tag, ``k``);
+        if it differs from the stored one the graph is rebuilt from scratch.
+        """
+        config = f"{config}|k={self.k}"
+        if self.catalog.get_meta("graph_config") != config:
+            self.catalog.clear_graph()
+            self.catalog.set_meta("graph_config", config)
+        built = set(self.catalog.graph_documents())
+        for filename, sections in self.catalog.iter_sections():
+            if filename not in built:
+                self.add_document(filename, sections)
+
+    def has_document(self, filename: str) -> bool:
+        return filename in self.catalog.graph_documents()
+
+    def related(self, filename: str, outline: List[Dict[str, Any]],
+                position: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Stored neighbours per section, formatted like the search API results"""
+        by_position: Dict[int, List[Dict[str, Any]]] = {}
+        for row in self.catalog.get_related(filename, position):
+            if row['position'] >= len(outline):
+                continue
+            query = outline[row['position']]['title']
+            by_position.setdefault(row['position'], []).append(self.processor.related_entry(
+                query, row['neighbor_document'], row['title'], row['page'],
+                self.processor.make_snippet(row['content'] or row['title']), row['score']))
+        positions = [position] if position is not None else range(len(outline))
+        return [{'position': p, 'title': outline[p]['title'], 'page': outline[p]['page'],
+                 'related': by_position.get(p, [])}
+                for p in positions if 0 <= p < len(outline)]
+
+    def _recompute(self, keys: List[Key]) -> Dict[Key, List[Edge]]:
+        by_document: Dict[str, List[int]] = {}
+        for filename, position in keys:
+            by_document.setdefault(filename, []).append(position)
+        lists: Dict[Key, List[Edge]] = {}
+        for filename, positions in by_document.items():
+            sections = self.catalog.get_sections(filename)
+            positions = [p for p in positions if p < len(sections)]
+            titles = [sections[p]['title'] for p in positions]
+            hits = self.processor.search_sections(titles, self.k, self.catalog,
+                                                  exclude_documents=[filename] * len(titles)) if titles else []
+            for position, section_hits in zip(positions, hits):
+                lists[(filename, position)] = [(row['document'], row['position'], score)
+                                               for row, score in section_hits]
+        return lists
@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+from ann import make_backend
+
+# Tombstoned rows are compacted away once they are this fraction of the index
+INDEX_COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.25"))
+# Past this many segments the newest, smallest ones are merged
+INDEX_MAX_SEGMENTS = int(os.getenv("INDEX_MAX_SEGMENTS", "8"))
+
+
+def collect_reverse_matches(scores: np.ndarray, offset: int, titles: np.ndarray, documents: np.ndarray,
+                            inside: np.ndarray, all_titles: np.ndarray, document: str, top_k: int,
+                            min_score: float, out: Dict[int, List[Tuple[int, float]]]):
+    """Fold one chunk of row-vs-document scores into ``out``.
+
+    ``scores[i, j]`` is the similarity of row ``offset + i`` to row
+    ``inside[j]``; rows of ``document`` itself and equal titles are skipped.
+    """
+    scores = np.where(titles[:, None] == all_titles[inside][None, :], -np.inf, scores)
+    scores[documents == document] = -np.inf
+    k = min(top_k, len(inside))
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    for i in np.flatnonzero(scores.max(axis=1) > min_score):
+        matches = [(int(inside[j]), float(scores[i, j])) for j in best[i] if scores[i, j] > min_score]
+        out[offset + int(i)] = sorted(matches, key=lambda m: -m[1])
+
+
+class SegmentedMatrix:
+    """Row-wise concatenation of segment matrices (memory-mapped), read piecewise.
+
+    Supports ``len``, ``shape``, slices and integer-array indexing, which is
+    all the index and ANN backends need, without ever materialising the
+    whole matrix.
+    """
+
+    def __init__(self, parts: List[np.ndarray], dim: int):
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [len(part) for part in parts])
+        self.shape = (int(self.offsets[-1]), dim)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            pieces = [part[max(start, offset) - offset:min(stop, offset + len(part)) - offset]
+                      for part, offset in zip(self.parts, self.offsets)
+                      if max(start, offset) < min(stop, offset + len(part))]
+            return np.concatenate(pieces).astype(np.float32, copy=False) if pieces else \
+                np.empty((0, self.shape[1]), dtype=np.float32)
+        rows = np.asarray(key, dtype=np.int64)
+        out = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        segments = np.searchsorted(self.offsets, rows, side='right') - 1
+        for segment in np.unique(segments):
+            mask = segments == segment
+            out[mask] = self.parts[segment][rows[mask] - self.offsets[segment]]
+        return out
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """``queries @ matrix.T``, one segment at a time"""
+        if not self.parts:
+            return np.empty((len(queries), 0), dtype=np.float32)
+        return np.hstack([queries @ np.asarray(part, dtype=np.float32).T for part in self.parts])
+
+
+class SectionIndex:
+    """Persistent section-embedding matrix used for related-section lookups.
+
+    Rows live in immutable segment directories (``seg-<id>/`` under
+    ``index_dir``), each holding:
+
+    - ``embeddings.npy``: float32 matrix, one L2-normalised row per section,
+      opened memory-mapped so large corpora are not read into RAM up front.
+    - ``rows.json``: row -> section table (document, position, title, page,
+      snippet).
+
+    Inserting a document writes one new segment; deleting or replacing one
+    only records its rows as tombstones. So a change costs about the size of
+    the change, not of the corpus. Once tombstones pass
+    ``INDEX_COMPACT_RATIO`` of the rows the live rows are compacted into one
+    segment, and past ``INDEX_MAX_SEGMENTS`` segments the newest, smallest
+    ones are merged, keeping segment sizes roughly geometric.
+
+    Each change writes a small generation directory (``manifest.json`` with
+    the model name and segment list, ``deleted.npy`` with the tombstones, and
+    the ANN backend's files, see ``ann.py``). ``CURRENT`` names the live
+    generation and is switched with a single ``os.replace`` once everything
+    it refers to is complete, so readers (and a restart after a crash) always
+    see a consistent index.
+
+    Row positions are global over the segments in order, tombstoned rows
+    included, and stay stable until a merge; ``rows`` is indexed by them.
+    """
+
+    def __init__(self, index_dir: str, model_name: str, backend=None):
+        self.index_dir = Path(index_dir)
+        self.model_name = model_name
+        self.backend = backend or make_backend()
+        self.current_path = self.index_dir / "CURRENT"
+        self._generation = None
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.embeddings: Optional[SegmentedMatrix] = None
+        self._segments: List[str] = []
+        self._deleted = np.empty(0, dtype=np.int64)
+        self._legacy = False
+        self._refresh_titles()
+
+    def __len__(self) -> int:
+        return len(self.rows) - len(self._deleted)
+
+    def documents(self) -> set:
+        return set(self._positions)
+
+    def _current_generation(self) -> Optional[str]:
+        """Name of the live generation, ``""`` for an index saved before generations, or None"""
+        try:
+            return self.current_path.read_text(encoding='utf-8').strip()
+        except OSError:
+            return "" if (self.index_dir / "rows.json").exists() else None
+
+    def load(self):
+        """Load the index from disk, discarding it if it was built by another model."""
+        self._reset()
+        self._generation = generation = self._current_generation()
+        if generation is None:
+            return
+        generation_dir = self.index_dir / generation if generation else self.index_dir
+        try:
+            manifest_path = generation_dir / "manifest.json"
+            if manifest_path.exists():
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                segments = data.get('segments', [])
+                deleted_path = generation_dir / "deleted.npy"
+                deleted = np.load(deleted_path) if deleted_path.exists() else np.empty(0, dtype=np.int64)
+            else:
+                # Saved before segments: the generation (or index_dir itself) is one segment
+                rows_path = generation_dir / "rows.json"
+                if not rows_path.exists():
+                    return
+                with open(rows_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                segments, deleted = [generation], np.empty(0, dtype=np.int64)
+                self._legacy = True
+            if data.get('model') != self.model_name:
+                print(f"Section index was built with {data.get('model')}, rebuilding for {self.model_name}")
+                self._reset()
+                return
+            rows, parts = [], []
+            for name in segments:
+                segment_dir = self.index_dir / name
+                embeddings = np.load(segment_dir / "embeddings.npy", mmap_mode='r')
+                if self._legacy:
+                    segment_rows = data.get('rows', [])
+                else:
+                    with open(segment_dir / "rows.json", 'r', encoding='utf-8') as f:
+                        segment_rows = json.load(f)['rows']
+                if embeddings.shape[0] != len(segment_rows):
+                    print("Section index rows and embeddings disagree, rebuilding")
+                    self._reset()
+                    return
+                rows.extend(segment_rows)
+                parts.append(embeddings)
+            self.rows = rows
+            self._segments = list(segments)
+            self._deleted = np.asarray(deleted, dtype=np.int64)
+            self.embeddings = SegmentedMatrix(parts, parts[0].shape[1]) if parts else None
+            if self.embeddings is not None and not self.backend.load(generation_dir, len(self.rows)):
+                self.backend.rebuild(self.embeddings)
+                self.backend.save(generation_dir)
+        except Exception as e:
+            print(f"Could not load section index (rebuilding): {e}")
+            self._reset()
+            return
+        self._refresh_titles()
+
+    def reload_if_changed(self):
+        """Pick up an index written by another process since we last loaded it."""
+        if self._current_generation() != self._generation:
+            self.load()
+
+    def add(self, document: str, rows: List[Dict[str, Any]], vectors: np.ndarray):
+        """Replace all rows of ``document`` with the given rows and vectors."""
+        self.add_documents([(document, rows, vectors)])
+
+    def add_documents(self, items: List[Tuple[str, List[Dict[str, Any]], np.ndarray]]):
+        """Replace the rows of several documents: tombstone the old rows, append one segment."""
+        previous = list(self._segments)
+        self._tombstone({document for document, _, _ in items})
+        new_rows, new_vectors = [], []
+        for document, rows, vectors in items:
+            if not rows:
+                continue
+            new_rows.extend(dict(row, document=document) for row in rows)
+            new_vectors.append(np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1))
+        created = []
+        if new_rows:
+            added = np.vstack(new_vectors)
+            name = self._write_segment(new_rows, added)
+            created.append(name)
+            kept = len(self.rows)
+            self._append_segment(name, new_rows)
+            self.backend.update(np.arange(kept, dtype=np.int64), added, self.embeddings)
+        self._save(previous, created)
+
+    def remove(self, document: str) -> int:
+        """Drop every row of ``document``; returns the number of rows removed."""
+        return self.remove_documents([document])
+
+    def remove_documents(self, documents: List[str]) -> int:
+        """Drop every row of the given documents; returns the number of rows removed."""
+        previous = list(self._segments)
+        removed = self._tombstone(set(documents))
+        if removed:
+            self._save(previous, [])
+        return removed
+
+    def search(self, query_vectors: np.ndarray, top_k: int, min_score: float = 0.0,
+               exclude_titles: Optional[List[str]] = None, probes: Optional[int] = None,
+               exact: bool = False, exclude_documents: Optional[List[str]] = None
+               ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Return the ``top_k`` best rows for each query vector.
+
+        The ANN backend narrows each query to candidate rows (``probes`` trades
+        recall for latency); ``exact=True`` scores every row instead and is the
+        baseline approximate results are checked against. Rows whose title
+        equals the corresponding entry of ``exclude_titles`` are skipped,
+        matching the "don't relate a section to itself" rule of the original
+        pairwise loop; ``exclude_documents`` likewise skips a whole document
+        per query. Tombstoned rows never match.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if self.embeddings is None or not len(self) or not len(queries):
+            return [[] for _ in range(len(queries))]
+
+        candidates = [None] * len(queries) if exact else self.backend.candidates(queries, probes)
+        full_scores = None
+        if any(c is None for c in candidates):
+            full_scores = self.embeddings.scores(queries)
+
+        results = []
+        for qi, positions in enumerate(candidates):
+            if positions is None:
+                row_scores = full_scores[qi]
+                titles = self._titles
+                documents = self._documents
+            else:
+                row_scores = self.embeddings[positions] @ queries[qi]
+                titles = self._titles[positions]
+                documents = self._documents[positions]
+            # Tombstoned rows have no document
+            row_scores = np.where(documents == None, -np.inf, row_scores)  # noqa: E711
+            if exclude_titles is not None:
+                row_scores = np.where(titles == exclude_titles[qi], -np.inf, row_scores)
+            if exclude_documents is not None:
+                row_scores = np.where(documents == exclude_documents[qi], -np.inf, row_scores)
+            if not len(row_scores):
+                results.append([])
+                continue
+            k = min(top_k, len(row_scores))
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            hits = []
+            for i in top:
+                if row_scores[i] > min_score:
+                    row = i if positions is None else positions[i]
+                    hits.append((self.rows[row], float(row_scores[i])))
+            results.append(hits)
+        return results
+
+    def reverse_neighbors(self, document: str, top_k: int, min_score: float = 0.0,
+                          chunk: int = 8192) -> Dict[int, List[Tuple[int, float]]]:
+        """For every row outside ``document``, its ``top_k`` best rows inside it.
+
+        The exact reverse of searching with the document's own vectors:
+        returns ``{row: [(document_row, score), ...]}`` for rows with at
+        least one match above ``min_score``.
+        """
+        inside = self._positions.get(document, np.empty(0, dtype=np.int64))
+        out: Dict[int, List[Tuple[int, float]]] = {}
+        if self.embeddings is None or not len(inside):
+            return out
+        targets = self.embeddings[inside]
+        for start in range(0, len(self.rows), chunk):
+            scores = self.embeddings[start:start + chunk] @ targets.T
+            documents = self._documents[start:start + chunk]
+            scores[documents == None] = -np.inf  # noqa: E711
+            collect_reverse_matches(scores, start, self._titles[start:start + chunk], documents, inside,
+                                    self._titles, document, top_k, min_score, out)
+        return out
+
+    def _dim(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings is not None else 0
+
+    def _tombstone(self, documents: set) -> int:
+        """Mark every row of ``documents`` deleted; returns how many rows that was."""
+        dead = [self._positions.pop(document) for document in documents if document in self._positions]
+        if not dead:
+            return 0
+        dead = np.concatenate(dead)
+        self._documents[dead] = None
+        self._deleted = np.union1d(self._deleted, dead)
+        return len(dead)
+
+    def _write_segment(self, rows: List[Dict[str, Any]], vectors, chunk: int = 8192) -> str:
+        """Write a new segment directory; ``vectors`` is a matrix or a ``(count, fill(start, stop))`` pair.
+
+        The segment is not part of the index until a generation refers to it.
+        """
+        name = f"seg-{uuid.uuid4().hex[:12]}"
+        segment_dir = self.index_dir / name
+        segment_dir.mkdir(parents=True)
+        if isinstance(vectors, np.ndarray):
+            np.save(segment_dir / "embeddings.npy", vectors.astype(np.float32, copy=False))
+        else:
+            # Streamed into a memory-mapped file, so merging never holds a whole segment in RAM
+            count, fill = vectors
+            out = np.lib.format.open_memmap(segment_dir / "embeddings.npy", mode='w+', dtype=np.float32,
+                                            shape=(count, self._dim()))
+            for start in range(0, count, chunk):
+                out[start:start + chunk] = fill(start, min(start + chunk, count))
+            out.flush()
+            del out
+        with open(segment_dir / "rows.json", 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows}, f, ensure_ascii=False)
+        return name
+
+    def _append_segment(self, name: str, rows: List[Dict[str, Any]]):
+        offset = len(self.rows)
+        embeddings = np.load(self.index_dir / name / "embeddings.npy", mmap_mode='r')
+        parts = self.embeddings.parts if self.embeddings is not None else []
+        self.embeddings = SegmentedMatrix(parts + [embeddings], embeddings.shape[1])
+        self._segments.append(name)
+        self.rows.extend(rows)
+        self._titles = np.concatenate([self._titles, np.array([row['title'] for row in rows], dtype=object)])
+        documents = np.array([row['document'] for row in rows], dtype=object)
+        self._documents = np.concatenate([self._documents, documents])
+        for document in dict.fromkeys(documents):
+            self._positions[document] = np.flatnonzero(documents == document) + offset
+
+    def _merge_start(self) -> Optional[int]:
+        """First segment to merge into one, or None if the index is fine as it is"""
+        if not self._segments:
+            return None
+        if self._legacy or len(self._deleted) > INDEX_COMPACT_RATIO * len(self.rows):
+            return 0
+        if len(self._segments) <= INDEX_MAX_SEGMENTS:
+            return None
+        sizes = [len(part) for part in self.embeddings.parts]
+        start, total = len(sizes) - 2, sizes[-1] + sizes[-2]
+        while start > 0 and 2 * total >= sizes[start - 1]:
+            start -= 1
+            total += sizes[start]
+        return start
+
+    def _merge(self, start: int) -> List[str]:
+        """Rewrite the live rows of segments ``start`` onwards as one segment; returns its name, if any"""
+        base = int(self.embeddings.offsets[start])
+        live = np.setdiff1d(np.arange(base, len(self.rows), dtype=np.int64), self._deleted)
+        rows = [self.rows[i] for i in live]
+        created = []
+        parts = self.embeddings.parts[:start]
+        if len(live):
+            name = self._write_segment(rows, (len(live), lambda lo, hi: self.embeddings[live[lo:hi]]))
+            created.append(name)
+            parts = parts + [np.load(self.index_dir / name / "embeddings.npy", mmap_mode='r')]
+        keep = np.concatenate([np.arange(base, dtype=np.int64), live])
+        dim = self._dim()
+        self._segments = self._segments[:start] + created
+        self.embeddings = SegmentedMatrix(parts, dim) if parts else None
+        self.rows = self.rows[:base] + rows
+        self._titles = np.concatenate([self._titles[:base], self._titles[live]])
+        self._documents = np.concatenate([self._documents[:base], self._documents[live]])
+        self._deleted = self._deleted[self._deleted < base]
+        # Positions after ``base`` close up over the dropped rows
+        self._positions = {document: np.searchsorted(keep, positions)
+                           for document, positions in self._positions.items()}
+        self._legacy = False
+        if self.embeddings is not None:
+            self.backend.update(keep, np.empty((0, dim), dtype=np.float32), self.embeddings)
+        else:
+            self.backend.rebuild(np.empty((0, dim), dtype=np.float32))
+        return created
+
+    def _save(self, previous: List[str], created: List[str]):
+        start = self._merge_start()
+        if start is not None:
+            created = created + self._merge(start)
+        generation = uuid.uuid4().hex[:12]
+        generation_dir = self.index_dir / generation
+        generation_dir.mkdir(parents=True)
+        np.save(generation_dir / "deleted.npy", self._deleted)
+        with open(generation_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'segments': self._segments}, f)
+        self.backend.save(generation_dir)
+        tmp_current = self.index_dir / f"CURRENT.{generation}.tmp"
+        tmp_current.write_text(generation, encoding='utf-8')
+        replaced = self._current_generation()
+        os.replace(tmp_current, self.current_path)
+        self._generation = generation
+        self._remove_stale(replaced, generation, set(previous) | set(created))
+
+    def _remove_stale(self, previous: Optional[str], generation: str, segments: set):
+        """Delete the generation just replaced, segments it no longer needs, and leftovers.
+
+        ``segments`` are the ones the replaced generation referred to or this
+        save wrote; those the new generation does not refer to go at once.
+        Leftovers of an interrupted save are only swept once they are an
+        hour old, so a save still in progress in another process is not
+        pulled from under it. Processes still mapping an old file keep it
+        alive on POSIX; where the delete is refused (Windows) the sweep
+        retries it later.
+        """
+        if previous == "":
+            for name in ("rows.json", "embeddings.npy", "ivf_centroids.npy", "ivf_assign.npy"):
+                try:
+                    (self.index_dir / name).unlink(missing_ok=True)
+                except OSError:
+                    pass
+        live = {generation, *self._segments}
+        cutoff = time.time() - 3600
+        for path in self.index_dir.iterdir():
+            if path.is_dir() and path.name not in live and \
+                    (path.name == previous or path.name in segments or path.stat().st_mtime < cutoff):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _refresh_titles(self):
+        self._titles = np.array([row['title'] for row in self.rows], dtype=object)
+        self._documents = np.array([row['document'] for row in self.rows], dtype=object)
+        self._documents[self._deleted] = None
+        self._positions: Dict[str, np.ndarray] = {}
+        for position, document in enumerate(self._documents):
+            if document is not None:
+                self._positions.setdefault(document, []).append(position)
+        self._positions = {document: np.asarray(positions, dtype=np.int64)
+                           for document, positions in self._positions.items()}
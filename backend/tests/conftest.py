@@ -0,0 +1,73 @@
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+# The backend modules import each other by bare name, as when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APP_ENV = {"WARMUP_ON_STARTUP": "0", "LLM_PROVIDER": "fake", "FAKE_LLM_DELAY_MS": "0",
+           "TTS_PROVIDER": "fake", "PROFILE_ENABLED": "0"}
+
+
+@pytest.fixture(scope="module")
+def app_main(tmp_path_factory):
+    """A freshly imported ``main`` serving an empty corpus from a scratch directory.
+
+    The app keeps its uploads, catalog and caches relative to the working
+    directory, so each test module gets its own.
+    """
+    workdir = tmp_path_factory.mktemp("backend")
+    saved_env = {name: os.environ.get(name) for name in APP_ENV}
+    saved_cwd = os.getcwd()
+    os.environ.update(APP_ENV)
+    os.chdir(workdir)
+    try:
+        sys.modules.pop("main", None)
+        yield importlib.import_module("main")
+    finally:
+        sys.modules.pop("main", None)
+        os.chdir(saved_cwd)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@pytest.fixture(scope="module")
+def client(app_main):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Factory for small synthetic reports, as bytes; each call writes a new file"""
+    from benchmarks.corpus import FONTS, make_pdf as write_pdf
+
+    def make(pages=2, seed=0, headings_per_page=2, lines_per_heading=2):
+        path = tmp_path / f"generated-{seed}-{len(list(tmp_path.glob('generated-*')))}.pdf"
+        write_pdf(str(path), pages, headings_per_page, lines_per_heading, "decimal", FONTS[0], seed)
+        return path.read_bytes()
+
+    return make
+
+
+@pytest.fixture(scope="module")
+def wait_for_job(client):
+    """Poll an ingestion job until it stops running; returns its final status"""
+
+    def wait(job_id, timeout=60):
+        deadline = time.time() + timeout
+        while True:
+            job = client.get(f"/upload/jobs/{job_id}").json()
+            if job["status"] in ("completed", "failed", "cancelled") or time.time() > deadline:
+                return job
+            time.sleep(0.05)
+
+    return wait
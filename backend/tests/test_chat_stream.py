@@ -0,0 +1,43 @@
+import json
+
+
+def parse_sse(body: str):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        events.append((fields.get("event"), json.loads(fields.get("data", "null"))))
+    return events
+
+
+def chat_payload(question):
+    return {"messages": [{"role": "user", "content": question}], "stream": True}
+
+
+def test_chat_streams_tokens_then_done(client):
+    response = client.post("/chat", json=chat_payload("What does the first section cover?"))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"token"}
+    assert len(names) > 2, "the fake provider streams word by word"
+
+    done = events[-1][1]
+    assert done["provider"] == "fake" and done["model"] == "fake"
+    assert "".join(data["delta"] for name, data in events if name == "token") == done["content"]
+    assert "What does the first section cover?" in done["content"]
+    assert done["sources"] == []
+
+
+def test_chat_without_stream_returns_the_whole_reply(client):
+    response = client.post("/chat", json={"messages": [{"role": "user", "content": "Summarize it"}]})
+    assert response.status_code == 200
+    reply = response.json()["response"]
+    assert reply["provider"] == "fake"
+    assert "Summarize it" in reply["choices"][0]["message"]["content"]
+
+
+def test_chat_requires_messages(client):
+    assert client.post("/chat", json={"messages": [], "stream": True}).status_code == 400
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/documents", "/sections/missing.pdf", "/related-sections/missing.pdf", "/stats"])
+def test_corpus_reads_do_not_block_the_event_loop(app_main, path):
+    """With the corpus cache's lock held elsewhere, other requests are still answered"""
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            held, release = threading.Event(), threading.Event()
+
+            def hold_lock():
+                with app_main.corpus._lock:
+                    held.set()
+                    release.wait(10)
+
+            threading.Thread(target=hold_lock, daemon=True).start()
+            assert held.wait(5)
+            waiting = asyncio.create_task(client.get(path))
+            try:
+                live = await asyncio.wait_for(client.get("/health/live"), timeout=5)
+                assert live.status_code == 200
+                assert not waiting.done()
+            finally:
+                release.set()
+            return await asyncio.wait_for(waiting, timeout=10)
+
+    assert asyncio.run(scenario()).status_code in (200, 404)
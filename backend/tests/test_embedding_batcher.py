@@ -0,0 +1,70 @@
+import re
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from embedding_service import EmbeddingBatcher
+
+
+def stage_total(stage, kind="count"):
+    match = re.search(rf'pdf_engine_stage_seconds_{kind}{{stage="{stage}"}} (\S+)', metrics.render())
+    return float(match.group(1)) if match else 0.0
+
+
+def slow_encoder(calls, delay=0.02):
+    def encode(texts):
+        calls.append(len(texts))
+        time.sleep(delay)
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+    return encode
+
+
+def test_concurrent_callers_share_batches_and_get_their_own_rows():
+    calls = []
+    batcher = EmbeddingBatcher(slow_encoder(calls), max_batch_size=64, max_wait_ms=5)
+    results = {}
+
+    def caller(i):
+        texts = ["x" * (i + 1), "y" * (i + 2)]
+        results[i] = (texts, batcher.encode(texts))
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(results) == 12
+    for texts, vectors in results.values():
+        assert vectors[:, 0].tolist() == [len(text) for text in texts]
+    assert sum(calls) == 24 and len(calls) < 12
+    assert batcher.stats()["requests"] == 12
+
+
+def test_a_lone_caller_is_not_held_back():
+    batcher = EmbeddingBatcher(slow_encoder([], delay=0), max_batch_size=64, max_wait_ms=200)
+    batcher.encode(["warm up"])
+    start = time.perf_counter()
+    batcher.encode(["alone"])
+    assert time.perf_counter() - start < 0.1
+
+
+def test_queue_wait_and_batch_encode_time_are_recorded(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    waits, batches = stage_total("embedding_queue_wait"), stage_total("embedding_batch")
+    seconds = stage_total("embedding_batch", "sum")
+    batcher = EmbeddingBatcher(slow_encoder([], delay=0.01), max_batch_size=64, max_wait_ms=5)
+
+    threads = [threading.Thread(target=batcher.encode, args=(["a", "b", "c"],)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    stats = batcher.stats()
+    assert stage_total("embedding_queue_wait") - waits == 4
+    assert stage_total("embedding_batch") - batches == stats["batches"]
+    assert stage_total("embedding_batch", "sum") - seconds >= 0.01 * stats["batches"]
+    assert 'pdf_engine_stage_items_total{stage="embedding_batch"}' in metrics.render()
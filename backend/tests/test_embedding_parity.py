@@ -0,0 +1,55 @@
+import sys
+import types
+
+import pytest
+
+import embedding_models
+from embedding_models import (PARITY_TEXTS, PARITY_THRESHOLDS, check_parity, export_onnx, load_embedding_model,
+                              onnx_export_ready)
+from pdf_processor import MODEL_NAME
+
+
+@pytest.fixture(scope="module")
+def reference():
+    pytest.importorskip("sentence_transformers")
+    try:
+        model, _ = load_embedding_model(MODEL_NAME, "torch")
+    except Exception as e:
+        pytest.skip(f"{MODEL_NAME} is not available: {e}")
+    return model
+
+
+@pytest.fixture(scope="module")
+def exported(reference, tmp_path_factory):
+    """ONNX_MODEL_DIR with both exports, exporting into a scratch directory if it has none"""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    if all(onnx_export_ready(MODEL_NAME, backend) for backend in PARITY_THRESHOLDS):
+        yield embedding_models.ONNX_MODEL_DIR
+        return
+    pytest.importorskip("onnx")
+    model_dir = tmp_path_factory.mktemp("models")
+    export_onnx(MODEL_NAME, str(model_dir / MODEL_NAME))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(embedding_models, "ONNX_MODEL_DIR", str(model_dir))
+        yield str(model_dir)
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_matches_torch(backend, reference, exported):
+    assert onnx_export_ready(MODEL_NAME, backend)
+    candidate, loaded = load_embedding_model(MODEL_NAME, backend)
+    assert loaded == backend
+    parity = check_parity(candidate, reference, PARITY_TEXTS)
+    assert parity["min_cosine"] >= PARITY_THRESHOLDS[backend]
+
+
+def test_missing_export_falls_back_without_exporting(tmp_path, monkeypatch):
+    fake = types.ModuleType("sentence_transformers")
+    fake.SentenceTransformer = lambda name, device=None: f"torch:{name}"
+    monkeypatch.setitem(sys.modules, "sentence_transformers", fake)
+    monkeypatch.setattr(embedding_models, "ONNX_MODEL_DIR", str(tmp_path))
+    monkeypatch.setattr(embedding_models, "export_onnx", lambda *a, **k: pytest.fail("exported on the serving path"))
+
+    assert load_embedding_model(MODEL_NAME, "onnx-int8") == (f"torch:{MODEL_NAME}", "torch")
+    assert not any(tmp_path.iterdir())
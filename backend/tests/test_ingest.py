@@ -0,0 +1,109 @@
+import hashlib
+import time
+
+from ingest import ExtractionCache, IngestJobManager
+
+
+def sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def nothing_stored(name):
+    return None, False
+
+
+def test_names_are_held_until_released():
+    jobs = IngestJobManager(persist=lambda *a: None)
+    first, second = sha(b"first"), sha(b"second")
+
+    assert jobs.reserve_name("report.pdf", first, nothing_stored) == ("report.pdf", False)
+    # Different bytes while the first is in flight get their own name
+    assert jobs.reserve_name("report.pdf", second, nothing_stored) == (f"report-{second[:8]}.pdf", False)
+    # The same bytes in flight are not a duplicate yet: that upload may still fail
+    assert jobs.reserve_name("report.pdf", first, nothing_stored) == ("report.pdf", False)
+
+    jobs.release_names([{"filename": "report.pdf", "sha256": first}])
+    assert jobs.reserve_name("report.pdf", second, nothing_stored)[0] != "report.pdf"
+    jobs.release_names([{"filename": "report.pdf", "sha256": first}])
+    assert jobs.reserve_name("report.pdf", second, nothing_stored) == ("report.pdf", False)
+
+
+def test_only_processed_documents_are_duplicates():
+    jobs = IngestJobManager(persist=lambda *a: None)
+    data = sha(b"report")
+    processed = {"report.pdf": (data, True)}
+    on_disk = {"report.pdf": (data, False)}
+    other = {"report.pdf": (sha(b"other"), True)}
+
+    assert jobs.reserve_name("report.pdf", data, lambda n: processed.get(n, (None, False))) == ("report.pdf", True)
+    assert jobs.reserve_name("report.pdf", data, lambda n: on_disk.get(n, (None, False))) == ("report.pdf", False)
+    jobs.release_names([{"filename": "report.pdf", "sha256": data}])
+    assert jobs.reserve_name("report.pdf", data, lambda n: other.get(n, (None, False))) == \
+        (f"report-{data[:8]}.pdf", False)
+
+
+def upload(client, name, data, path="/upload"):
+    return client.post(path, files=[("files", (name, data, "application/pdf"))])
+
+
+def test_upload_processes_a_file_saved_by_upload_simple(client, make_pdf, wait_for_job):
+    data = make_pdf(seed=1)
+    assert upload(client, "simple.pdf", data, "/upload-simple").json()["files"][0]["status"] == "saved"
+
+    response = upload(client, "simple.pdf", data)
+    assert response.status_code == 202
+    assert response.json()["files"][0]["status"] != "duplicate"
+    job = wait_for_job(response.json()["job_id"])
+    assert job["files"][0]["status"] == "processed" and job["files"][0]["filename"] == "simple.pdf"
+    assert "simple.pdf" in [d["filename"] for d in client.get("/documents").json()["documents"]]
+
+    # Now that it is processed, the same bytes again are a duplicate
+    again = upload(client, "simple.pdf", data).json()
+    assert again["files"][0]["status"] == "duplicate"
+
+
+def test_different_bytes_under_a_taken_name_are_kept_apart(client, make_pdf, wait_for_job):
+    first, second = make_pdf(seed=2), make_pdf(seed=3)
+    response = client.post("/upload", files=[("files", ("same.pdf", first, "application/pdf")),
+                                              ("files", ("same.pdf", second, "application/pdf"))])
+    job = wait_for_job(response.json()["job_id"])
+    names = [f["filename"] for f in job["files"]]
+    assert names == ["same.pdf", f"same-{sha(second)[:8]}.pdf"]
+    assert all(f["status"] == "processed" for f in job["files"])
+
+
+def test_empty_extractions_are_not_cached(tmp_path):
+    cache = ExtractionCache(str(tmp_path), "1")
+    cache.put("abc", [])
+    assert cache.get("abc") is None
+    (tmp_path / "def-v1.json").write_text("[]")
+    assert cache.get("def") is None
+    cache.put("abc", [{"title": "1. Intro", "level": "H1", "page": 0, "content": ""}])
+    assert cache.get("abc")[0]["title"] == "1. Intro"
+
+
+def test_failed_extraction_fails_the_file_and_is_not_cached(tmp_path, make_pdf):
+    stored = []
+    cache = ExtractionCache(str(tmp_path / "cache"), "1")
+    jobs = IngestJobManager(persist=lambda *args: stored.append(args), cache=cache, max_workers=1)
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"%PDF-1.4 not really a pdf")
+    try:
+        job = jobs.submit([{"filename": "broken.pdf", "file_path": str(broken), "sha256": "feed"}])
+        deadline = time.time() + 60
+        while jobs.status(job["job_id"])["status"] not in ("completed", "failed") and time.time() < deadline:
+            time.sleep(0.05)
+        job = jobs.status(job["job_id"])
+        assert job["status"] == "failed" and job["files"][0]["error"]
+        assert cache.get("feed") is None and not stored
+
+        # Once the bytes are readable, the same hash is extracted rather than served empty
+        broken.write_bytes(make_pdf(seed=4))
+        job = jobs.submit([{"filename": "broken.pdf", "file_path": str(broken), "sha256": "feed"}])
+        while jobs.status(job["job_id"])["status"] not in ("completed", "failed") and time.time() < deadline:
+            time.sleep(0.05)
+        job = jobs.status(job["job_id"])
+        assert job["files"][0]["status"] == "processed" and job["files"][0]["sections_count"] > 0
+        assert cache.get("feed")
+    finally:
+        jobs.shutdown()
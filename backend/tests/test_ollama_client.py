@@ -0,0 +1,58 @@
+import asyncio
+
+import httpx
+import pytest
+
+import ollama_stub
+from ollama_client import OllamaClient, OllamaError
+
+MESSAGES = [{"role": "user", "content": "Which sections mention latency?"}]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(ollama_stub, "STUB_DELAY_MS", 0.0)
+    monkeypatch.setattr(ollama_stub, "STUB_FAIL_FIRST", 0)
+    monkeypatch.setattr(ollama_stub, "state", {"requests": 0, "cancelled": 0})
+    return ollama_stub
+
+
+def stub_client(retries=2, max_concurrency=2) -> OllamaClient:
+    """A client whose requests are served by the stub app in-process"""
+    client = OllamaClient(host="http://stub", retries=retries, max_concurrency=max_concurrency)
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=ollama_stub.app),
+                                       base_url=client.host)
+    client._slots = asyncio.Semaphore(client.max_concurrency)
+    return client
+
+
+async def collect(client, messages=MESSAGES):
+    try:
+        return [delta async for delta in client.stream_chat("llama3", messages)]
+    finally:
+        await client.aclose()
+
+
+def test_stream_yields_the_reply_word_by_word(stub):
+    client = stub_client()
+    deltas = asyncio.run(collect(client))
+    assert len(deltas) > 1
+    assert "".join(deltas) == stub.stub_reply(MESSAGES)
+    assert client.stats()["requests"] == 1 and client.stats()["in_flight"] == 0
+
+
+def test_retries_while_the_model_loads(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 1)
+    client = stub_client(retries=2)
+    assert "".join(asyncio.run(collect(client))) == stub.stub_reply(MESSAGES)
+    assert stub.state["requests"] == 2
+    assert client.stats()["retries"] == 1 and client.stats()["failed"] == 0
+
+
+def test_gives_up_after_the_last_retry(stub, monkeypatch):
+    monkeypatch.setattr(stub, "STUB_FAIL_FIRST", 10)
+    client = stub_client(retries=1)
+    with pytest.raises(OllamaError):
+        asyncio.run(collect(client))
+    assert stub.state["requests"] == 2
+    assert client.stats()["failed"] == 1
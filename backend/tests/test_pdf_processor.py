@@ -0,0 +1,30 @@
+import pytest
+
+from benchmarks.corpus import FONTS, make_pdf
+from pdf_processor import PDFProcessor
+
+
+@pytest.fixture(scope="module")
+def long_report(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pdf") / "long.pdf"
+    make_pdf(str(path), pages=60, headings_per_page=3, lines_per_heading=8, style="decimal",
+             fonts=FONTS[1], seed=6, max_sections=6000)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return PDFProcessor(load_model=False)
+
+
+@pytest.fixture(scope="module")
+def serial(processor, long_report):
+    sections = processor.extract_sections(long_report, page_workers=1)
+    assert len(sections) > 500
+    return sections
+
+
+@pytest.mark.parametrize("workers", [2, 3, 7])
+def test_page_parallel_extraction_matches_serial(processor, long_report, serial, workers):
+    assert processor.extract_sections(long_report, page_workers=workers) == serial
+
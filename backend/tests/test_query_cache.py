@@ -0,0 +1,65 @@
+import pytest
+
+from pdf_processor import PDFProcessor
+from query_cache import QueryResultCache, normalize_query
+
+
+def test_results_computed_before_an_invalidation_are_not_stored():
+    cache = QueryResultCache()
+    generation = cache.generation
+    cache.put(("q", 1), ["fresh"], generation)
+    assert cache.get(("q", 1)) == ["fresh"]
+
+    stale = cache.generation
+    cache.invalidate()
+    assert cache.get(("q", 1)) is None
+    cache.put(("q", 1), ["stale"], stale)
+    assert cache.get(("q", 1)) is None
+
+
+def test_entries_expire_and_are_bounded():
+    expired = QueryResultCache(ttl=-1)
+    expired.put("k", 1, expired.generation)
+    assert expired.get("k") is None and expired.stats()["expirations"] == 1
+
+    small = QueryResultCache(max_entries=2)
+    for key in "abc":
+        small.put(key, key, small.generation)
+    assert small.get("a") is None and small.get("c") == "c"
+    assert small.stats()["evictions"] == 1
+
+
+def test_queries_differing_in_whitespace_share_an_entry():
+    assert normalize_query("  neural\n networks  ") == normalize_query("neural networks")
+
+
+@pytest.fixture(scope="module")
+def report(tmp_path_factory):
+    """A report and a query close to one of its section titles (but not equal, which is excluded)"""
+    from benchmarks.corpus import FONTS, make_pdf
+
+    path = tmp_path_factory.mktemp("pdf") / "report.pdf"
+    make_pdf(str(path), pages=2, headings_per_page=2, lines_per_heading=1, style="chapter", fonts=FONTS[0], seed=15)
+    sections = PDFProcessor(load_model=False).extract_sections(str(path), page_workers=1)
+    return path.read_bytes(), sections[0]["title"] + " summary"
+
+
+def grounding_documents(client, query):
+    response = client.post("/insights", json={"selected_text": query, "top_k": 5})
+    assert response.status_code == 200
+    return {entry["source_document"] for entry in response.json()["grounding"]}
+
+
+def test_uploads_and_deletes_invalidate_cached_searches(client, app_main, wait_for_job, report):
+    data, query = report
+    assert grounding_documents(client, query) == set()
+    hits = app_main.query_cache.stats()["hits"]
+    assert grounding_documents(client, query) == set()
+    assert app_main.query_cache.stats()["hits"] == hits + 1
+
+    job = client.post("/upload", files=[("files", ("report.pdf", data, "application/pdf"))]).json()
+    assert wait_for_job(job["job_id"])["status"] == "completed"
+    assert grounding_documents(client, query) == {"report.pdf"}
+
+    assert client.delete("/documents/report.pdf").status_code == 200
+    assert grounding_documents(client, query) == set()
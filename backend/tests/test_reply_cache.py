@@ -0,0 +1,69 @@
+import numpy as np
+
+from llm_cache import LLMResponseCache
+from test_chat_stream import chat_payload, parse_sse
+
+
+def reply(content):
+    return {"provider": "fake", "model": "fake", "choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+def ask(question, system="Context: none"):
+    return [{"role": "system", "content": system}, {"role": "user", "content": question}]
+
+
+class FakeProcessor:
+    """Embeds a text by the letters it contains, enough to tell near and far apart"""
+    similarity_tag = "letters"
+
+    def embed_texts(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(26, dtype=np.float32)
+            for ch in text.lower():
+                if "a" <= ch <= "z":
+                    vector[ord(ch) - ord("a")] += 1
+            vectors.append(vector / (np.linalg.norm(vector) or 1.0))
+        return np.stack(vectors)
+
+
+def test_exact_hits_are_keyed_by_provider_model_and_messages(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.db"))
+    cache.put("fake", "fake", ask("What is covered?"), reply("Everything."))
+
+    assert cache.get("fake", "fake", ask("  What is covered?  ")) == (reply("Everything."), "exact")
+    assert cache.get("ollama", "llama3", ask("What is covered?")) is None
+    assert cache.get("fake", "fake", ask("What is covered?", system="Context: other")) is None
+    # Persistent: a new instance on the same file sees the entry
+    assert LLMResponseCache(str(tmp_path / "llm.db")).get("fake", "fake", ask("What is covered?")) is not None
+
+
+def test_expired_and_evicted_entries_miss(tmp_path):
+    expired = LLMResponseCache(str(tmp_path / "ttl.db"), ttl=-1)
+    expired.put("fake", "fake", ask("old"), reply("stale"))
+    assert expired.get("fake", "fake", ask("old")) is None
+
+    small = LLMResponseCache(str(tmp_path / "lru.db"), max_entries=2)
+    for question in ("one", "two", "three"):
+        small.put("fake", "fake", ask(question), reply(question))
+    assert small.get("fake", "fake", ask("one")) is None
+    assert small.get("fake", "fake", ask("three")) is not None
+    assert small.stats()["entries"] == 2
+
+
+def test_semantic_tier_needs_the_same_context(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.db"), processor=FakeProcessor(), semantic=True, threshold=0.95)
+    cache.put("fake", "fake", ask("Which sections discuss latency?"), reply("Sections 2 and 4."))
+
+    assert cache.get("fake", "fake", ask("which sections discuss the latency"))[1] == "semantic"
+    assert cache.get("fake", "fake", ask("which sections discuss the latency", system="Context: other")) is None
+    assert cache.get("fake", "fake", ask("Who wrote it?")) is None
+
+
+def test_repeated_chat_question_is_served_from_the_cache(client):
+    payload = chat_payload("Is this reply cached?")
+    first = parse_sse(client.post("/chat", json=payload).text)[-1][1]
+    second = parse_sse(client.post("/chat", json=payload).text)[-1][1]
+    assert first["cache"] is None
+    assert second["cache"] == "exact"
+    assert second["content"] == first["content"]
@@ -0,0 +1,163 @@
+import json
+
+import numpy as np
+import pytest
+
+import section_index
+from ann import BruteForceBackend, IVFBackend
+from section_index import SectionIndex
+
+DIM = 16
+
+
+def document(name, count, seed):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = [{"position": i, "title": f"{name} section {i}", "page": i, "snippet": ""} for i in range(count)]
+    return name, rows, vectors
+
+
+def expected_hits(corpus, query, k):
+    """Top-k (document, position) over the live documents, by brute force"""
+    scored = [(float(vector @ query), name, i) for name, (_, vectors) in corpus.items()
+              for i, vector in enumerate(vectors)]
+    return [(name, i) for _, name, i in sorted(scored, reverse=True)[:k]]
+
+
+def hits(index, query, k, **kwargs):
+    return [(row["document"], row["position"]) for row, _ in
+            index.search(query[None, :], k, min_score=-np.inf, **kwargs)[0]]
+
+
+def segment_dirs(index_dir):
+    return sorted(p.name for p in index_dir.iterdir() if p.name.startswith("seg-"))
+
+
+@pytest.fixture
+def corpus():
+    return {}
+
+
+def add(index, corpus, name, count, seed):
+    name, rows, vectors = document(name, count, seed)
+    index.add(name, rows, vectors)
+    corpus[name] = (rows, vectors)
+
+
+def test_inserts_append_segments_without_rewriting_earlier_ones(tmp_path, corpus):
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    add(index, corpus, "a.pdf", 30, 1)
+    first = segment_dirs(tmp_path)
+    embeddings = tmp_path / first[0] / "embeddings.npy"
+    written = embeddings.stat().st_mtime_ns
+
+    add(index, corpus, "b.pdf", 20, 2)
+    assert first[0] in segment_dirs(tmp_path)
+    assert len(segment_dirs(tmp_path)) == 2
+    assert embeddings.stat().st_mtime_ns == written
+    assert len(index) == 50 and index.documents() == {"a.pdf", "b.pdf"}
+
+    query = document("q", 1, 99)[2][0]
+    assert hits(index, query, 10) == expected_hits(corpus, query, 10)
+
+
+def test_deletes_and_replacements_are_tombstoned_until_compaction(tmp_path, corpus, monkeypatch):
+    monkeypatch.setattr(section_index, "INDEX_COMPACT_RATIO", 0.5)
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    for i, name in enumerate(["a.pdf", "b.pdf", "c.pdf", "d.pdf"]):
+        add(index, corpus, name, 25, i)
+    segments = segment_dirs(tmp_path)
+
+    assert index.remove("b.pdf") == 25
+    del corpus["b.pdf"]
+    # Only tombstones were written: the segments are untouched
+    assert segment_dirs(tmp_path) == segments and len(index) == 75
+    query = document("q", 1, 7)[2][0]
+    assert hits(index, query, 15) == expected_hits(corpus, query, 15)
+    assert "b.pdf" not in {row["document"] for row, _ in index.search(query[None, :], 100, min_score=-np.inf)[0]}
+
+    # Replacing a document tombstones its old rows and appends the new ones
+    add(index, corpus, "a.pdf", 10, 42)
+    assert len(index) == 60
+    assert hits(index, query, 15) == expected_hits(corpus, query, 15)
+
+    # Past half the rows dead, the live rows are compacted into one segment
+    index.remove_documents(["c.pdf"])
+    del corpus["c.pdf"]
+    assert len(segment_dirs(tmp_path)) == 1
+    assert len(index.rows) == len(index) == 35
+    assert hits(index, query, 15) == expected_hits(corpus, query, 15)
+
+    reloaded = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    assert len(reloaded) == 35 and reloaded.documents() == {"a.pdf", "d.pdf"}
+    assert hits(reloaded, query, 15) == expected_hits(corpus, query, 15)
+
+
+def test_many_small_inserts_are_merged_into_few_segments(tmp_path, corpus, monkeypatch):
+    monkeypatch.setattr(section_index, "INDEX_MAX_SEGMENTS", 4)
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    for i in range(20):
+        add(index, corpus, f"doc{i}.pdf", 5 + i % 3, i)
+        assert len(segment_dirs(tmp_path)) <= 4
+    index.remove("doc3.pdf")
+    del corpus["doc3.pdf"]
+
+    query = document("q", 1, 5)[2][0]
+    assert hits(index, query, 20) == expected_hits(corpus, query, 20)
+    reloaded = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    assert hits(reloaded, query, 20) == expected_hits(corpus, query, 20)
+    assert not any(p.is_dir() for p in tmp_path.iterdir()
+                   if p.name not in set(reloaded._segments) | {reloaded._generation})
+
+
+def test_ivf_buckets_follow_tombstones_and_merges(tmp_path, corpus, monkeypatch):
+    monkeypatch.setattr(section_index, "INDEX_COMPACT_RATIO", 0.3)
+    index = SectionIndex(str(tmp_path), "model", backend=IVFBackend(min_rows=50, default_probes=64))
+    for i in range(6):
+        add(index, corpus, f"doc{i}.pdf", 20, i)
+    assert index.backend.centroids is not None
+    index.remove_documents(["doc0.pdf", "doc1.pdf", "doc2.pdf"])
+    for name in ("doc0.pdf", "doc1.pdf", "doc2.pdf"):
+        del corpus[name]
+    assert len(index.backend.assign) == len(index.rows)
+
+    query = document("q", 1, 3)[2][0]
+    assert hits(index, query, 10) == expected_hits(corpus, query, 10)
+    reloaded = SectionIndex(str(tmp_path), "model", backend=IVFBackend(min_rows=50, default_probes=64))
+    assert len(reloaded.backend.assign) == len(reloaded.rows)
+    assert hits(reloaded, query, 10) == expected_hits(corpus, query, 10)
+
+
+def test_reverse_neighbors_skip_tombstoned_rows(tmp_path, corpus):
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    for i, name in enumerate(["a.pdf", "b.pdf", "c.pdf"]):
+        add(index, corpus, name, 10, i)
+    index.remove("b.pdf")
+    matches = index.reverse_neighbors("a.pdf", 3, min_score=-1.0)
+    assert {index.rows[i]["document"] for i in matches} == {"c.pdf"}
+    assert all(index.rows[j]["document"] == "a.pdf" for found in matches.values() for j, _ in found)
+
+
+def test_flat_layout_is_migrated_on_the_next_save(tmp_path, corpus):
+    name, rows, vectors = document("old.pdf", 12, 0)
+    np.save(tmp_path / "embeddings.npy", vectors)
+    (tmp_path / "rows.json").write_text(json.dumps(
+        {"model": "model", "rows": [dict(row, document=name) for row in rows]}))
+    corpus[name] = (rows, vectors)
+
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    assert index.documents() == {"old.pdf"}
+    add(index, corpus, "new.pdf", 8, 1)
+
+    assert not (tmp_path / "rows.json").exists() and not (tmp_path / "embeddings.npy").exists()
+    reloaded = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    query = document("q", 1, 2)[2][0]
+    assert reloaded.documents() == {"old.pdf", "new.pdf"}
+    assert hits(reloaded, query, 10) == expected_hits(corpus, query, 10)
+
+
+def test_index_from_another_model_is_discarded(tmp_path, corpus):
+    index = SectionIndex(str(tmp_path), "model", backend=BruteForceBackend())
+    add(index, corpus, "a.pdf", 5, 0)
+    assert len(SectionIndex(str(tmp_path), "other-model", backend=BruteForceBackend())) == 0
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import threading
+import time
+
+import pytest
+
+import tts
+from tts import AudioCache, AudioJobs
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setenv("TTS_PROVIDER", "fake")
+    monkeypatch.setattr(tts, "FAKE_TTS_MS_PER_CHAR", 0.0)
+
+
+def test_cache_key_is_stable(tmp_path):
+    first = AudioCache(str(tmp_path / "a"), voice="", fmt="audio-16khz-32kbitrate-mono-mp3")
+    second = AudioCache(str(tmp_path / "b"), voice="", fmt="audio-16khz-32kbitrate-mono-mp3")
+    text = "Section 2 compares the two approaches."
+    assert first.key(text) == second.key(text) == first.key(f"  {text}\n")
+    # Cached files are found by this name after a restart; changing the scheme orphans them
+    material = json.dumps(["fake", "", "audio-16khz-32kbitrate-mono-mp3", text])
+    assert first.key(text) == hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def test_cache_key_covers_provider_voice_and_format(tmp_path):
+    text = "Same words, different audio."
+    base = AudioCache(str(tmp_path), voice="", fmt="audio-16khz-32kbitrate-mono-mp3")
+    keys = {
+        base.key(text),
+        base.key(text, provider="azure"),
+        AudioCache(str(tmp_path), voice="en-US-AriaNeural").key(text),
+        AudioCache(str(tmp_path), fmt="audio-24khz-48kbitrate-mono-mp3").key(text),
+        base.key(text + "!"),
+    }
+    assert len(keys) == 5
+
+
+def test_concurrent_misses_synthesize_once(tmp_path, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def slow_fake(text, outfile_path, voice="", fmt=tts.TTS_FORMAT):
+        calls.append(text)
+        release.wait(5)
+        tts.synthesize_fake(text, outfile_path, voice, fmt)
+
+    monkeypatch.setitem(tts.SYNTHESIZERS, "fake", slow_fake)
+    cache = AudioCache(str(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.synthesize("One overview, many listeners.")))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5 and len(set(results)) == 1
+    assert results[0].exists() and results[0].stat().st_size > 0
+    assert cache.get(cache.key("One overview, many listeners.")) == results[0]
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def run_in_thread(fn):
+    threading.Thread(target=fn, daemon=True).start()
+
+
+def test_jobs_join_the_running_job():
+    jobs = AudioJobs()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+
+    first = jobs.submit("key", work, run_in_thread)
+    assert started.wait(5)
+    second = jobs.submit("key", work, run_in_thread)
+    other = jobs.submit("other-key", lambda: None, run_in_thread)
+
+    assert second["job_id"] == first["job_id"]
+    assert other["job_id"] != first["job_id"]
+    release.set()
+    deadline = time.time() + 5
+    while jobs.status(first["job_id"])["status"] != "completed" and time.time() < deadline:
+        time.sleep(0.01)
+    assert jobs.status(first["job_id"])["status"] == "completed"
+    assert calls == [1]
+
+    # Once finished, the same key starts a new job
+    again = jobs.submit("key", lambda: None, lambda fn: fn())
+    assert again["job_id"] != first["job_id"]
+    assert jobs.status(again["job_id"])["status"] == "completed"
+
+
+def test_jobs_record_failures_and_rejected_submits():
+    jobs = AudioJobs()
+
+    def fail():
+        raise RuntimeError("synthesis failed")
+
+    failed = jobs.submit("key", fail, lambda fn: fn())
+    status = jobs.status(failed["job_id"])
+    assert status["status"] == "failed" and "synthesis failed" in status["error"]
+
+    def saturated(fn):
+        raise RuntimeError("pool is full")
+
+    with pytest.raises(RuntimeError):
+        jobs.submit("busy", lambda: None, saturated)
+    # Nothing was recorded, so a retry starts a fresh job
+    retried = jobs.submit("busy", lambda: None, lambda fn: fn())
+    assert jobs.status(retried["job_id"])["status"] == "completed"
+
+
+def test_stream_admission_looks_at_chunks_not_the_whole_text(tmp_path, monkeypatch):
+    release = threading.Event()
+
+    def held_fake(text, outfile_path, voice="", fmt=tts.TTS_FORMAT):
+        if text.startswith("Holds the slot"):
+            release.wait(5)
+        tts.synthesize_fake(text, outfile_path, voice, fmt)
+
+    monkeypatch.setitem(tts.SYNTHESIZERS, "fake", held_fake)
+    cache = AudioCache(str(tmp_path))
+    streams = tts.AudioStreams(cache, workers=1, window=1, max_streams=1)
+    try:
+        streams.create("Holds the slot until released.")
+        text = " ".join(f"Sentence {i} of an overview long enough to be split." for i in range(8))
+        assert len(tts.split_for_speech(text)) > 1
+        cache.synthesize(text)  # the whole text is cached, its chunks are not
+        with pytest.raises(tts.PoolSaturated):
+            streams.create(text)
+
+        for chunk in tts.split_for_speech(text):
+            cache.synthesize(chunk)
+        stream = streams.create(text)
+        assert all(f.done() for f in stream.futures)
+        assert streams.stats()["rejected"] == 1
+    finally:
+        release.set()
+        streams.shutdown()
+
+
+def test_audio_stream_of_cached_text_starts_no_stream(client, app_main):
+    text = "Cached as a whole by the audio endpoint."
+    app_main.audio_cache.synthesize(text)
+    response = client.post("/audio-stream", json={"text": text})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["cached"] is True and "stream_id" not in body
+    assert client.get(body["audio_url"]).status_code == 200
+    assert app_main.audio_streams.stats()["active"] == 0
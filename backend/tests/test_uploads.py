@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from uploads import MalformedUpload, UploadTooLarge, receive_files
+
+BOUNDARY = "test-boundary"
+
+
+class StreamedRequest:
+    """Just enough of a Starlette request: headers and a body arriving in chunks"""
+
+    def __init__(self, body: bytes, chunk: int = 7, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+        self.headers = {"content-type": content_type}
+        self.body = body
+        self.chunk = chunk
+
+    async def stream(self):
+        for start in range(0, len(self.body), self.chunk):
+            await asyncio.sleep(0)
+            yield self.body[start:start + self.chunk]
+
+
+def multipart(*files, field="files", close=True) -> bytes:
+    body = b""
+    for name, data in files:
+        body += (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{name}\"\r\n"
+                 f"Content-Type: application/pdf\r\n\r\n").encode() + data + b"\r\n"
+    return body + (f"--{BOUNDARY}--\r\n".encode() if close else b"")
+
+
+def receive(body, tmp_path, **kwargs):
+    return asyncio.run(receive_files(StreamedRequest(body), "files", tmp_path,
+                                     accept=lambda name: name.endswith(".pdf"), **kwargs))
+
+
+def leftovers(tmp_path):
+    return list(tmp_path.glob(".incoming-*"))
+
+
+def test_files_are_written_hashed_and_sized_as_they_arrive(tmp_path):
+    first, second = b"%PDF-1.4 first" * 100, b"%PDF-1.4 second" * 50
+    files = receive(multipart(("a.pdf", first), ("notes.txt", b"skip me"), ("../../etc/b.pdf", second)), tmp_path)
+
+    assert [f["filename"] for f in files] == ["a.pdf", "notes.txt", "b.pdf"]
+    assert files[1]["temp_path"] is None
+    for f, data in ((files[0], first), (files[2], second)):
+        assert f["temp_path"].parent == tmp_path
+        assert f["temp_path"].read_bytes() == data
+        assert f["sha256"] == hashlib.sha256(data).hexdigest() and f["size"] == len(data)
+    assert len(leftovers(tmp_path)) == 2
+
+
+def test_a_file_over_the_limit_is_refused_and_nothing_is_left(tmp_path):
+    body = multipart(("small.pdf", b"x" * 100), ("big.pdf", b"y" * 5000))
+    with pytest.raises(UploadTooLarge) as error:
+        receive(body, tmp_path, max_bytes=1000)
+    assert error.value.filename == "big.pdf"
+    assert leftovers(tmp_path) == []
+
+
+def test_a_request_over_the_limit_is_refused_and_nothing_is_left(tmp_path):
+    body = multipart(*[(f"{i}.pdf", b"z" * 800) for i in range(5)])
+    with pytest.raises(UploadTooLarge):
+        receive(body, tmp_path, max_bytes=1000, max_request_bytes=2000)
+    assert leftovers(tmp_path) == []
+
+
+def test_a_truncated_body_is_malformed_and_nothing_is_left(tmp_path):
+    body = multipart(("a.pdf", b"%PDF-1.4 complete"), ("b.pdf", b"%PDF-1.4 cut short"), close=False)
+    with pytest.raises(MalformedUpload):
+        receive(body[:-20], tmp_path)
+    assert leftovers(tmp_path) == []
+
+
+def test_a_body_that_is_not_multipart_is_malformed(tmp_path):
+    request = StreamedRequest(b"{}", content_type="application/json")
+    with pytest.raises(MalformedUpload):
+        asyncio.run(receive_files(request, "files", tmp_path))
+
+
+def test_upload_errors_map_to_http_statuses(client):
+    assert client.post("/upload", content=b"{}", headers={"content-type": "application/json"}).status_code == 400
+    assert client.post("/upload", files=[("other", ("a.pdf", b"%PDF", "application/pdf"))]).status_code == 422
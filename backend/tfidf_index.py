@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import numpy as np
+import scipy.sparse as sp
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+from section_index import collect_reverse_matches
+
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+_stop_words = None
+
+
+def stop_words() -> frozenset:
+    """sklearn's English stop words, imported on first use (sklearn takes about a second to import)"""
+    global _stop_words
+    if _stop_words is None:
+        try:
+            from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS as words
+        except Exception:
+            words = frozenset()
+        _stop_words = words
+    return _stop_words
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased unigrams and bigrams without English stop words (TfidfVectorizer-compatible)"""
+    excluded = stop_words()
+    words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in excluded]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TfidfSectionIndex:
+    """Corpus-wide sparse TF-IDF index, the fallback when no embedding model loads.
+
+    Raw term counts are stored (``tf.npz``, one row per section) together with
+    the vocabulary, so adding a document only appends rows and columns; the
+    IDF weights and row norms are recomputed from the counts in O(nnz). A
+    query is answered with one sparse matrix product against all sections.
+
+    It exposes the same interface as ``SectionIndex`` except that documents
+    are added and searched with raw texts instead of embedding vectors.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = Path(index_dir)
+        self.tf_path = self.index_dir / "tf.npz"
+        self.rows_path = self.index_dir / "rows.json"
+        self.rows: List[Dict[str, Any]] = []
+        self.vocabulary: Dict[str, int] = {}
+        self.tf = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._titles = np.array([], dtype=object)
+        self._documents = np.array([], dtype=object)
+        self._df = np.empty(0, dtype=np.int64)
+        self._idf_sq = np.empty(0, dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._loaded_mtime = None
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def documents(self) -> set:
+        return {row['document'] for row in self.rows}
+
+    def load(self):
+        self.rows = []
+        self.vocabulary = {}
+        self.tf = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._loaded_mtime = None
+        if self.rows_path.exists() and self.tf_path.exists():
+            try:
+                with open(self.rows_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                tf = sp.load_npz(self.tf_path).tocsr()
+                tf.sum_duplicates()
+                if tf.shape[0] == len(data.get('rows', [])):
+                    self.rows = data['rows']
+                    self.vocabulary = data['vocabulary']
+                    self.tf = tf
+                    self._loaded_mtime = self.rows_path.stat().st_mtime
+                else:
+                    print("TF-IDF index rows and counts disagree, rebuilding")
+            except Exception as e:
+                print(f"Could not load TF-IDF index (rebuilding): {e}")
+                self.rows = []
+                self.vocabulary = {}
+                self.tf = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._refresh()
+
+    def reload_if_changed(self):
+        try:
+            mtime = self.rows_path.stat().st_mtime
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    def add(self, document: str, rows: List[Dict[str, Any]], texts: List[str]):
+        self.add_documents([(document, rows, texts)])
+
+    def add_documents(self, items: List[Tuple[str, List[Dict[str, Any]], List[str]]]):
+        """Replace the rows of several documents, extending the vocabulary as needed."""
+        replaced = {document for document, _, _ in items}
+        keep = [i for i, row in enumerate(self.rows) if row['document'] not in replaced]
+        new_rows, data, indices, indptr = [], [], [], [0]
+        for document, rows, texts in items:
+            for row, text in zip(rows, texts):
+                counts: Dict[int, int] = {}
+                for term in tokenize(text):
+                    col = self.vocabulary.setdefault(term, len(self.vocabulary))
+                    counts[col] = counts.get(col, 0) + 1
+                indices.extend(counts.keys())
+                data.extend(counts.values())
+                indptr.append(len(indices))
+                new_rows.append(dict(row, document=document))
+        n_terms = len(self.vocabulary)
+        added = sp.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+                               np.asarray(indptr, dtype=np.int64)), shape=(len(new_rows), n_terms))
+        kept = self.tf[keep] if keep else sp.csr_matrix((0, self.tf.shape[1]), dtype=np.float32)
+        kept = kept.tocsr()
+        kept.resize((kept.shape[0], n_terms))
+        self.rows = [self.rows[i] for i in keep] + new_rows
+        self._save(sp.vstack([kept, added], format='csr'))
+
+    def remove(self, document: str) -> int:
+        return self.remove_documents([document])
+
+    def remove_documents(self, documents: List[str]) -> int:
+        documents = set(documents)
+        keep = [i for i, row in enumerate(self.rows) if row['document'] not in documents]
+        removed = len(self.rows) - len(keep)
+        if removed:
+            tf = self.tf[keep] if keep else sp.csr_matrix((0, self.tf.shape[1]), dtype=np.float32)
+            self.rows = [self.rows[i] for i in keep]
+            self._save(tf.tocsr())
+        return removed
+
+    def search(self, queries: List[str], top_k: int, min_score: float = 0.0,
+               exclude_titles: Optional[List[str]] = None, probes: Optional[int] = None,
+               exact: bool = False, exclude_documents: Optional[List[str]] = None
+               ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Cosine-rank every section against each query text.
+
+        ``probes`` and ``exact`` are accepted for interface parity with
+        ``SectionIndex``; sparse scoring is always exact.
+        """
+        if not self.rows or not queries:
+            return [[] for _ in queries]
+
+        query_tf = self._query_matrix(queries)
+        weighted = query_tf.multiply(self._idf_sq[None, :]).T.tocsc()
+        query_norms = np.sqrt(np.asarray(query_tf.multiply(query_tf) @ self._idf_sq)).ravel()
+        scores = np.asarray((self.tf @ weighted).todense())
+
+        results = []
+        for qi in range(len(queries)):
+            denom = self._norms * query_norms[qi]
+            row_scores = np.divide(scores[:, qi], denom, out=np.zeros(len(self.rows), dtype=np.float64),
+                                   where=denom > 0)
+            if exclude_titles is not None:
+                row_scores = np.where(self._titles == exclude_titles[qi], -np.inf, row_scores)
+            if exclude_documents is not None:
+                row_scores = np.where(self._documents == exclude_documents[qi], -np.inf, row_scores)
+            k = min(top_k, len(row_scores))
+            top = np.argpartition(-row_scores, k - 1)[:k]
+            top = top[np.argsort(-row_scores[top])]
+            results.append([(self.rows[i], float(row_scores[i])) for i in top if row_scores[i] > min_score])
+        return results
+
+    def reverse_neighbors(self, document: str, top_k: int, min_score: float = 0.0,
+                          chunk: int = 8192) -> Dict[int, List[Tuple[int, float]]]:
+        """For every row outside ``document``, its ``top_k`` best rows inside it (see ``SectionIndex``)"""
+        inside = np.flatnonzero(self._documents == document)
+        out: Dict[int, List[Tuple[int, float]]] = {}
+        if not len(inside):
+            return out
+        targets = self.tf[inside].multiply(self._idf_sq[None, :]).T.tocsc()
+        for start in range(0, len(self.rows), chunk):
+            end = min(start + chunk, len(self.rows))
+            dots = np.asarray((self.tf[start:end] @ targets).todense())
+            denom = self._norms[start:end, None] * self._norms[inside][None, :]
+            scores = np.divide(dots, denom, out=np.zeros_like(dots, dtype=np.float64), where=denom > 0)
+            collect_reverse_matches(scores, start, self._titles[start:end], self._documents[start:end],
+                                    inside, self._titles, document, top_k, min_score, out)
+        return out
+
+    def _query_matrix(self, queries: List[str]) -> sp.csr_matrix:
+        data, indices, indptr = [], [], [0]
+        for text in queries:
+            counts: Dict[int, int] = {}
+            for term in tokenize(text):
+                col = self.vocabulary.get(term)
+                # Terms only seen in since-removed documents count as unknown
+                if col is not None and self._df[col]:
+                    counts[col] = counts.get(col, 0) + 1
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+                              np.asarray(indptr, dtype=np.int64)), shape=(len(queries), len(self.vocabulary)))
+
+    def _save(self, tf: sp.csr_matrix):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_tf = self.index_dir / "tf.tmp.npz"
+        tmp_rows = self.index_dir / "rows.tmp.json"
+        sp.save_npz(tmp_tf, tf)
+        with open(tmp_rows, 'w', encoding='utf-8') as f:
+            json.dump({'rows': self.rows, 'vocabulary': self.vocabulary}, f, ensure_ascii=False)
+        os.replace(tmp_tf, self.tf_path)
+        os.replace(tmp_rows, self.rows_path)
+        self.load()
+
+    def _refresh(self):
+        """Recompute smoothed IDF weights and per-row TF-IDF norms from the raw counts"""
+        self._titles = np.array([row['title'] for row in self.rows], dtype=object)
+        self._documents = np.array([row['document'] for row in self.rows], dtype=object)
+        n_docs = self.tf.shape[0]
+        df = np.bincount(self.tf.indices, minlength=self.tf.shape[1]) if self.tf.nnz else np.zeros(self.tf.shape[1])
+        self._df = df
+        idf = np.log((1 + n_docs) / (1 + df)) + 1
+        self._idf_sq = (idf ** 2).astype(np.float32)
+        self._norms = np.sqrt(np.asarray(self.tf.multiply(self.tf) @ self._idf_sq)).ravel()
@@ -0,0 +1,492 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+from workers import PoolSaturated
+
+TTS_PROVIDERS = {"azure", "fake"}
+# Empty means the provider's default voice
+TTS_VOICE = os.getenv("TTS_VOICE", "")
+TTS_FORMAT = os.getenv("TTS_FORMAT", "audio-16khz-32kbitrate-mono-mp3")
+# Simulated synthesis time of the fake provider per character of text
+FAKE_TTS_MS_PER_CHAR = float(os.getenv("FAKE_TTS_MS_PER_CHAR", "1"))
+# Streamed synthesis: chunk sizes (the first is short so playback starts quickly),
+# chunks synthesized at once per stream, and across all streams
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "600"))
+TTS_FIRST_CHUNK_CHARS = int(os.getenv("TTS_FIRST_CHUNK_CHARS", "160"))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "3"))
+TTS_CHUNK_WORKERS = int(os.getenv("TTS_CHUNK_WORKERS", "6"))
+# Streams still synthesizing at once; more are refused with 503 and Retry-After
+TTS_MAX_STREAMS = int(os.getenv("TTS_MAX_STREAMS", "8"))
+# A stream nobody is listening to or polling stops synthesizing after this many seconds
+TTS_STREAM_IDLE_SECONDS = float(os.getenv("TTS_STREAM_IDLE_SECONDS", "15"))
+
+# Output formats by Azure name: SDK enum member and file extension
+FORMATS = {
+    "audio-16khz-32kbitrate-mono-mp3": ("Audio16Khz32KBitRateMonoMp3", ".mp3"),
+    "audio-24khz-48kbitrate-mono-mp3": ("Audio24Khz48KBitRateMonoMp3", ".mp3"),
+    "audio-48khz-96kbitrate-mono-mp3": ("Audio48Khz96KBitRateMonoMp3", ".mp3"),
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,)])\s+")
+
+# One silent MPEG-1 Layer III frame (128 kbit/s, 44.1 kHz, about 26 ms)
+_SILENT_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+
+
+def tts_provider() -> str:
+    return os.getenv("TTS_PROVIDER", "").lower()
+
+
+def synthesize_azure(text: str, outfile_path: str, voice: str = "", fmt: str = TTS_FORMAT):
+    """Synthesize ``text`` into ``outfile_path`` with Azure Speech (blocks until done)"""
+    try:
+        import azure.cognitiveservices.speech as speechsdk
+    except Exception as e:
+        raise RuntimeError(f"Azure Speech SDK not available: {e}")
+
+    azure_key = os.getenv("AZURE_TTS_KEY", "").strip()
+    azure_endpoint = os.getenv("AZURE_TTS_ENDPOINT", "").strip()
+    if not azure_key or not azure_endpoint:
+        raise RuntimeError("AZURE_TTS_KEY or AZURE_TTS_ENDPOINT missing.")
+
+    speech_config = speechsdk.SpeechConfig(subscription=azure_key, endpoint=azure_endpoint)
+    speech_config.set_speech_synthesis_output_format(getattr(speechsdk.SpeechSynthesisOutputFormat, FORMATS[fmt][0]))
+    if voice:
+        speech_config.speech_synthesis_voice_name = voice
+    audio_config = speechsdk.audio.AudioOutputConfig(filename=outfile_path)
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
+
+    result = synthesizer.speak_text_async(text).get()
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        raise RuntimeError("Audio synthesis failed")
+
+
+def synthesize_fake(text: str, outfile_path: str, voice: str = "", fmt: str = TTS_FORMAT):
+    """Stand-in for Azure in tests: silent MP3 of roughly speaking length, after a simulated delay"""
+    time.sleep(len(text) * FAKE_TTS_MS_PER_CHAR / 1000.0)
+    # About 15 characters per second of speech, 38 frames per second
+    frames = max(1, int(len(text) / 15 * 38))
+    with open(outfile_path, "wb") as f:
+        f.write(_SILENT_FRAME * frames)
+
+
+SYNTHESIZERS: Dict[str, Callable[..., None]] = {"azure": synthesize_azure, "fake": synthesize_fake}
+
+
+def _split_long(sentence: str, limit: int) -> List[str]:
+    """Break a sentence longer than ``limit`` at clause boundaries, else between words"""
+    pieces, current = [], ""
+    for part in _CLAUSE_END.split(sentence):
+        while len(part) > limit:
+            cut = part.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            pieces.append(part[:cut].strip())
+            part = part[cut:].strip()
+        if current and len(current) + 1 + len(part) > limit:
+            pieces.append(current)
+            current = part
+        else:
+            current = f"{current} {part}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_for_speech(text: str, max_chars: Optional[int] = None,
+                     first_chars: Optional[int] = None) -> List[str]:
+    """Split text at sentence boundaries into chunks of at most ``max_chars``.
+
+    The first chunk is kept under ``first_chars`` so it is synthesized
+    quickly. The split depends only on the text, so the chunks of a text
+    (and their cached audio) are the same on every request.
+    """
+    max_chars = max_chars or TTS_CHUNK_CHARS
+    first_chars = min(first_chars or TTS_FIRST_CHUNK_CHARS, max_chars)
+    sentences = [s for s in _SENTENCE_END.split(re.sub(r"\s+", " ", text).strip()) if s]
+    chunks, current = [], ""
+    for sentence in sentences:
+        limit = first_chars if not chunks else max_chars
+        for piece in _split_long(sentence, limit) if len(sentence) > limit else [sentence]:
+            limit = first_chars if not chunks else max_chars
+            if current and len(current) + 1 + len(piece) > limit:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AudioCache:
+    """Synthesized audio on disk, named by a digest of provider, voice, format and text.
+
+    The name is stable across restarts and processes, so identical requests
+    are synthesized once. Files are written under a temporary name and
+    renamed, so a cached file is always complete; concurrent misses for the
+    same key in this process wait for a single synthesis.
+    """
+
+    def __init__(self, audio_dir: str, voice: Optional[str] = None, fmt: Optional[str] = None):
+        self.audio_dir = Path(audio_dir)
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        self.voice = TTS_VOICE if voice is None else voice
+        self.fmt = fmt or TTS_FORMAT
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unsupported TTS_FORMAT: {self.fmt}")
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str, provider: Optional[str] = None) -> str:
+        material = [provider or tts_provider(), self.voice, self.fmt, text.strip()]
+        return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def file_name(self, key: str) -> str:
+        return key + FORMATS[self.fmt][1]
+
+    def path(self, key: str) -> Path:
+        return self.audio_dir / self.file_name(key)
+
+    def get(self, key: str) -> Optional[Path]:
+        """Path of the cached audio for ``key``, if it was synthesized before"""
+        path = self.path(key)
+        with self._lock:
+            if path.exists():
+                self.hits += 1
+                return path
+            self.misses += 1
+            return None
+
+    def synthesize(self, text: str, key: Optional[str] = None) -> Path:
+        """Audio for ``text``, synthesized with the configured provider unless cached"""
+        provider = tts_provider()
+        if provider not in TTS_PROVIDERS:
+            raise RuntimeError("Unsupported TTS_PROVIDER. Set TTS_PROVIDER=azure for evaluation.")
+        key = key or self.key(text, provider)
+        path = self.path(key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if not path.exists():
+                temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+                try:
+                    with metrics.timed("tts_call", len(text)):
+                        SYNTHESIZERS[provider](text.strip(), str(temp_path), self.voice, self.fmt)
+                    os.replace(temp_path, path)
+                finally:
+                    temp_path.unlink(missing_ok=True)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "voice": self.voice, "format": self.fmt}
+
+
+class AudioJobs:
+    """Background synthesis jobs, pollable by id.
+
+    Requests for audio that is already being synthesized join the running
+    job instead of starting another one. Finished jobs are kept for
+    ``job_ttl`` seconds.
+    """
+
+    job_ttl = 3600
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._active: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[], Any], submit: Callable[..., Any]) -> Dict[str, Any]:
+        """Job for ``key``: the one in progress, or a new one running ``fn`` via ``submit``.
+
+        ``submit(callable)`` schedules the work (e.g. on a worker pool); if it
+        raises, no job is recorded and the error propagates.
+        """
+        self._prune()
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+            job = {"job_id": uuid.uuid4().hex, "key": key, "status": "queued", "created_at": time.time(),
+                   "finished_at": None, "error": None}
+            self._jobs[job["job_id"]] = job
+            self._active[key] = job["job_id"]
+        try:
+            submit(lambda: self._execute(job, fn))
+        except BaseException:
+            with self._lock:
+                del self._jobs[job["job_id"]]
+                del self._active[key]
+            raise
+        return dict(job)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _execute(self, job: Dict[str, Any], fn: Callable[[], Any]):
+        with self._lock:
+            job["status"] = "running"
+        try:
+            fn()
+            status, error = "completed", None
+        except Exception as e:
+            print(f"Audio job {job['job_id']} failed: {e}")
+            status, error = "failed", str(e)
+        with self._lock:
+            job.update(status=status, error=error, finished_at=time.time())
+            self._active.pop(job["key"], None)
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+
+class AudioStream:
+    """One text synthesized chunk by chunk, for playback while the rest is still being made.
+
+    At most ``window`` chunks of the stream are queued or synthesizing at a
+    time, in order, so a long text cannot crowd out the first chunks of
+    other streams on the shared executor. Chunks already in the cache are
+    ready immediately. Once every chunk exists they are joined into the
+    cached file for the whole text. Synthesis stops once nobody has listened
+    or polled (``touch``) for ``TTS_STREAM_IDLE_SECONDS``, counted from
+    creation too, so a stream that is never played does not run to the end;
+    reconnecting in time keeps it going (players often re-request media).
+    """
+
+    def __init__(self, cache: AudioCache, text: str, executor: ThreadPoolExecutor, window: int,
+                 on_chunk: Optional[Callable[[float], None]] = None):
+        self.stream_id = uuid.uuid4().hex
+        self.cache = cache
+        self.executor = executor
+        self.window = window
+        self.on_chunk = on_chunk
+        self.key = cache.key(text)
+        self.chunks = split_for_speech(text)
+        self.keys = [cache.key(chunk) for chunk in self.chunks]
+        self.futures: List[Future] = [Future() for _ in self.chunks]
+        self.created_at = time.time()
+        self.finished_at = None
+        self._next = 0
+        self._in_flight = 0
+        self._cancelled = False
+        self._readers = 0
+        self._last_seen = time.monotonic()
+        self._lock = threading.Lock()
+        self._schedule()
+        self._watch_idle(TTS_STREAM_IDLE_SECONDS)
+
+    def _schedule(self):
+        while True:
+            with self._lock:
+                if self._cancelled or self._next >= len(self.chunks) or self._in_flight >= self.window:
+                    return
+                index = self._next
+                self._next += 1
+                path = self.cache.get(self.keys[index])
+                if path is None:
+                    self._in_flight += 1
+            if path is not None:
+                self._done(index, path, None)
+            else:
+                self.executor.submit(self._synthesize, index)
+
+    def _synthesize(self, index: int):
+        start = time.perf_counter()
+        try:
+            path, error = self.cache.synthesize(self.chunks[index], self.keys[index]), None
+        except Exception as e:
+            path, error = None, e
+        if self.on_chunk is not None:
+            self.on_chunk(time.perf_counter() - start)
+        with self._lock:
+            self._in_flight -= 1
+        self._done(index, path, error)
+        self._schedule()
+
+    def _done(self, index: int, path: Optional[Path], error: Optional[Exception]):
+        try:
+            if error is not None:
+                print(f"Audio chunk {index} of stream {self.stream_id} failed: {error}")
+                self.futures[index].set_exception(error)
+            else:
+                self.futures[index].set_result(path)
+        except InvalidStateError:
+            return  # the stream was cancelled
+        if all(f.done() for f in self.futures):
+            self.finished_at = time.time()
+            if not any(f.cancelled() or f.exception() is not None for f in self.futures):
+                self._assemble()
+
+    def _assemble(self):
+        path = self.cache.path(self.key)
+        if path.exists():
+            return
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, "wb") as out:
+                for future in self.futures:
+                    with open(future.result(), "rb") as f:
+                        out.write(f.read())
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def attach(self):
+        with self._lock:
+            self._readers += 1
+            self._last_seen = time.monotonic()
+
+    def detach(self):
+        with self._lock:
+            self._readers -= 1
+            self._last_seen = time.monotonic()
+            idle = self._readers == 0
+        if idle:
+            self._watch_idle(TTS_STREAM_IDLE_SECONDS)
+
+    def touch(self):
+        """Note interest from a client that polls segments instead of playing the stream"""
+        with self._lock:
+            self._last_seen = time.monotonic()
+
+    def _watch_idle(self, delay: float):
+        if self.finished_at is None:
+            timer = threading.Timer(delay, self._cancel_if_idle)
+            timer.daemon = True
+            timer.start()
+
+    def _cancel_if_idle(self):
+        with self._lock:
+            if self._readers:
+                return  # the last reader to leave starts a new watch
+            remaining = TTS_STREAM_IDLE_SECONDS - (time.monotonic() - self._last_seen)
+        if remaining > 0:
+            self._watch_idle(remaining)
+        else:
+            self.cancel()
+
+    def cancel(self):
+        """Stop starting new chunks (those in progress still finish and are cached)"""
+        with self._lock:
+            self._cancelled = True
+        for future in self.futures:
+            future.cancel()
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        segments = []
+        for chunk, key, future in zip(self.chunks, self.keys, self.futures):
+            if future.cancelled():
+                state = "cancelled"
+            elif not future.done():
+                state = "pending"
+            else:
+                state = "failed" if future.exception() is not None else "ready"
+            segments.append({"chars": len(chunk), "status": state,
+                             "file": self.cache.file_name(key) if state == "ready" else None})
+        return {"stream_id": self.stream_id, "chunks": len(self.chunks),
+                "ready": sum(s["status"] == "ready" for s in segments), "segments": segments,
+                "complete": self.cache.path(self.key).exists()}
+
+
+class AudioStreams:
+    """Live ``AudioStream``s by id, sharing one executor (``TTS_CHUNK_WORKERS`` threads).
+
+    At most ``max_streams`` streams synthesize at once, so the executor's
+    queue stays within ``max_streams * window`` chunks; ``create`` refuses
+    more with ``PoolSaturated``, like the other worker pools.
+    """
+
+    stream_ttl = 3600
+
+    def __init__(self, cache: AudioCache, workers: Optional[int] = None, window: Optional[int] = None,
+                 max_streams: Optional[int] = None):
+        self.cache = cache
+        self.workers = workers or TTS_CHUNK_WORKERS
+        self.window = window or TTS_CHUNK_CONCURRENCY
+        self.max_streams = max_streams or TTS_MAX_STREAMS
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts-chunks")
+        self._streams: Dict[str, AudioStream] = {}
+        self._rejected = 0
+        self._avg_chunk_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, text: str) -> AudioStream:
+        """Start streaming ``text``; raises ``PoolSaturated`` while ``max_streams`` are synthesizing.
+
+        Text whose chunks are all cached needs no synthesis and is always
+        accepted. Streams look up chunks, not the whole text, so that is
+        what decides it.
+        """
+        if tts_provider() not in TTS_PROVIDERS:
+            raise RuntimeError("Unsupported TTS_PROVIDER. Set TTS_PROVIDER=azure for evaluation.")
+        self._prune()
+        uncached = any(self.cache.get(self.cache.key(chunk)) is None for chunk in split_for_speech(text))
+        with self._lock:
+            active = [s for s in self._streams.values() if s.finished_at is None]
+            if len(active) >= self.max_streams and uncached:
+                self._rejected += 1
+                raise PoolSaturated("tts-streams", self._retry_after(active))
+            stream = AudioStream(self.cache, text, self._executor, self.window, self._record_chunk)
+            self._streams[stream.stream_id] = stream
+        return stream
+
+    def _record_chunk(self, seconds: float):
+        with self._lock:
+            # Exponential moving average, as for the worker pools
+            self._avg_chunk_seconds = seconds if not self._avg_chunk_seconds else \
+                0.8 * self._avg_chunk_seconds + 0.2 * seconds
+
+    def _retry_after(self, active: List[AudioStream]) -> int:
+        """Seconds until the slot-holding streams' remaining chunks should be done"""
+        pending = sum(1 for stream in active for future in stream.futures if not future.done())
+        return max(1, int(round(pending / self.workers * (self._avg_chunk_seconds or 1.0))))
+
+    def get(self, stream_id: str) -> Optional[AudioStream]:
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def _prune(self):
+        cutoff = time.time() - self.stream_ttl
+        with self._lock:
+            for stream_id in [i for i, s in self._streams.items() if s.finished_at and s.finished_at < cutoff]:
+                del self._streams[stream_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"active": sum(s.finished_at is None for s in self._streams.values()),
+                    "max_streams": self.max_streams, "rejected": self._rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
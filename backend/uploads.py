@@ -0,0 +1,154 @@
+import os
+import uuid
+import hashlib
+import aiofiles
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable
+from multipart.multipart import MultipartParser, parse_options_header
+
+CHUNK_SIZE = 1024 * 1024
+# Per-file limit, and a limit on the whole request body, both checked as the body arrives
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+    def __init__(self, filename: str, limit: int):
+        super().__init__(f"{filename} exceeds the upload limit of {limit} bytes")
+        self.filename = filename
+        self.limit = limit
+
+
+class MalformedUpload(Exception):
+    """Raised when an upload request is not a multipart form that can be parsed"""
+
+
+class _Part:
+    __slots__ = ("field", "filename", "temp_path", "handle", "digest", "size", "pending", "done", "closed")
+
+    def __init__(self):
+        self.field = self.filename = self.temp_path = self.handle = None
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.pending = []
+        self.done = self.closed = False
+
+
+async def receive_files(request, field: str, dest_dir: Path, accept: Callable[[str], bool] = lambda name: True,
+                        max_bytes: Optional[int] = MAX_UPLOAD_BYTES,
+                        max_request_bytes: Optional[int] = MAX_UPLOAD_REQUEST_BYTES) -> List[Dict[str, Any]]:
+    """Parse a multipart upload from the request body straight into temp files in ``dest_dir``.
+
+    The body is read as it arrives (FastAPI's ``UploadFile`` would spool the
+    whole request before the handler runs); each file of ``field`` is hashed,
+    size-checked and written without blocking the event loop. Returns one
+    ``{filename, temp_path, sha256, size}`` per file in order, with
+    ``temp_path=None`` for files ``accept(filename)`` turned down, which are
+    not written. Raises ``UploadTooLarge`` past ``max_bytes`` for a file or
+    ``max_request_bytes`` for the body, and ``MalformedUpload`` for a body
+    that is not multipart; temp files are removed on any error.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise MalformedUpload("Expected a multipart/form-data body")
+    parts: List[_Part] = []
+    header = {"name": b"", "value": b"", "disposition": b""}
+
+    def on_part_begin():
+        parts.append(_Part())
+        header["disposition"] = b""
+
+    def on_header_field(data, start, end):
+        header["name"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        if header["name"].lower() == b"content-disposition":
+            header["disposition"] = header["value"]
+        header["name"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        part = parts[-1]
+        _, options = parse_options_header(header["disposition"])
+        part.field = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in options and part.field == field:
+            # Only the base name: browsers send one, but nothing else may pick the path
+            part.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace").replace("\\", "/"))
+            if accept(part.filename):
+                part.temp_path = dest_dir / f".incoming-{uuid.uuid4().hex}"
+
+    def on_part_data(data, start, end):
+        part = parts[-1]
+        if part.temp_path is not None:
+            part.size += end - start
+            part.pending.append(data[start:end])
+
+    def on_part_end():
+        parts[-1].done = True
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data, "on_part_end": on_part_end,
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if max_request_bytes is not None and received > max_request_bytes:
+                raise UploadTooLarge("The upload request", max_request_bytes)
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise MalformedUpload(f"Could not parse the upload: {e}")
+            # The parser's callbacks are synchronous; file writes happen here, awaited
+            for part in parts:
+                if part.temp_path is None or part.closed:
+                    continue
+                if max_bytes is not None and part.size > max_bytes:
+                    raise UploadTooLarge(part.filename, max_bytes)
+                if part.handle is None:
+                    part.handle = await aiofiles.open(part.temp_path, "wb")
+                for data in part.pending:
+                    part.digest.update(data)
+                    await part.handle.write(data)
+                part.pending.clear()
+                if part.done:
+                    await part.handle.close()
+                    part.closed = True
+        parser.finalize()
+        if not parts or not parts[-1].done:
+            raise MalformedUpload("The upload ended before its last part")
+    except BaseException:
+        for part in parts:
+            if part.handle is not None and not part.closed:
+                await part.handle.close()
+            if part.temp_path is not None:
+                part.temp_path.unlink(missing_ok=True)
+        raise
+    return [{"filename": part.filename, "temp_path": part.temp_path, "sha256": part.digest.hexdigest(),
+             "size": part.size} for part in parts if part.filename is not None]
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_addressed_name(filename: str, sha256: str, existing_sha256: Optional[str]) -> str:
+    """Name to store an upload under.
+
+    The original name is kept unless a different file already uses it, in
+    which case a short content hash is appended so both are kept.
+    """
+    if existing_sha256 is None or existing_sha256 == sha256:
+        return filename
+    stem, suffix = os.path.splitext(filename)
+    return f"{stem}-{sha256[:8]}{suffix}"
@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """Raised when a worker pool's queue is full; maps to an HTTP error with Retry-After"""
+
+    def __init__(self, pool: str, retry_after: int, status_code: int = 503):
+        super().__init__(f"The {pool} pool is busy, retry in {retry_after}s")
+        self.pool = pool
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class BoundedPool:
+    """Thread pool with a hard cap on queued work.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait; anything beyond that is rejected immediately with
+    ``PoolSaturated`` instead of piling up behind slow calls. The suggested
+    Retry-After comes from the average call duration and the current queue.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, status_code: int = 503):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.status_code = status_code
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._avg_seconds = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` on the pool without blocking the event loop"""
+        return await self.submit(fn, *args, **kwargs)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> "asyncio.Future":
+        """Admit ``fn`` to the pool or raise ``PoolSaturated`` right away; returns an awaitable.
+
+        Useful when the rejection must happen before a response starts, e.g.
+        for streaming responses whose work continues after the handler returns.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated(self.name, self._retry_after(), self.status_code)
+            self._pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args, kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _call(self, fn: Callable, args, kwargs) -> Any:
+        start = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                # Exponential moving average keeps Retry-After tracking recent load
+                self._avg_seconds = elapsed if self._completed == 1 else 0.8 * self._avg_seconds + 0.2 * elapsed
+
+    def _retry_after(self) -> int:
+        waves = self._pending / self.max_workers
+        return max(1, int(round(waves * self._avg_seconds)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_seconds": round(self._avg_seconds, 4),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def make_pool(name: str, default_workers: int, default_queue: int, status_code: int = 503) -> BoundedPool:
+    """Pool sized from ``<NAME>_WORKERS`` / ``<NAME>_QUEUE``"""
+    prefix = name.upper()
+    return BoundedPool(
+        name,
+        max_workers=int(os.getenv(f"{prefix}_WORKERS", str(default_workers))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(default_queue))),
+        status_code=status_code,
+    )
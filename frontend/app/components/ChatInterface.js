@@ -2,7 +2,7 @@
 
 import { useState, useRef, useEffect } from 'react'
 import { Send, MessageCircle, Bot, User, Lightbulb, Sparkles } from 'lucide-react'
-import { chatWithLLM } from '../lib/api'
+import { streamChatWithLLM } from '../lib/api'
 
 export default function ChatInterface({ selectedText, documentContext }) {
   const [messages, setMessages] = useState([])
@@ -11,6 +11,7 @@ export default function ChatInterface({ selectedText, documentContext }) {
   const [isOpen, setIsOpen] = useState(false)
   const messagesEndRef = useRef(null)
   const inputRef = useRef(null)
+  const abortRef = useRef(null)
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" })
@@ -20,6 +21,9 @@ export default function ChatInterface({ selectedText, documentContext }) {
     scrollToBottom()
   }, [messages])
 
+  // Stop a reply that is still streaming when the chat goes away
+  useEffect(() => () => abortRef.current?.abort(), [])
+
   const handleSendMessage = async () => {
     if (!inputMessage.trim() || isLoading) return
 
@@ -33,30 +37,43 @@ export default function ChatInterface({ selectedText, documentContext }) {
     setInputMessage('')
     setIsLoading(true)
 
+    // The reply fills in a placeholder message as tokens stream in
+    const controller = new AbortController()
+    abortRef.current = controller
+    const updateReply = (changes) => setMessages(prev => {
+      const next = [...prev]
+      next[next.length - 1] = { ...next[next.length - 1], ...changes }
+      return next
+    })
+    setMessages(prev => [...prev, {
+      role: 'assistant',
+      content: '',
+      timestamp: new Date().toLocaleTimeString(),
+      streaming: true
+    }])
+
     try {
-      const response = await chatWithLLM(
+      let content = ''
+      const result = await streamChatWithLLM(
         [...messages, userMessage],
         selectedText,
-        documentContext
+        documentContext,
+        (delta) => {
+          content += delta
+          updateReply({ content })
+        },
+        controller.signal
       )
-
-      const assistantMessage = {
-        role: 'assistant',
-        content: response.response.choices[0].message.content,
-        timestamp: new Date().toLocaleTimeString(),
-        provider: response.response.provider
-      }
-
-      setMessages(prev => [...prev, assistantMessage])
+      updateReply({ content: result.content, provider: result.provider, streaming: false })
     } catch (error) {
-      const errorMessage = {
-        role: 'assistant',
+      if (error.name === 'AbortError') return
+      updateReply({
         content: `Sorry, I encountered an error: ${error.message}`,
-        timestamp: new Date().toLocaleTimeString(),
-        isError: true
-      }
-      setMessages(prev => [...prev, errorMessage])
+        isError: true,
+        streaming: false
+      })
     } finally {
+      abortRef.current = null
       setIsLoading(false)
     }
   }
@@ -137,7 +154,7 @@ export default function ChatInterface({ selectedText, documentContext }) {
           </div>
         )}
 
-        {messages.map((message, index) => (
+        {messages.filter(message => message.content || !message.streaming).map((message, index) => (
           <div
             key={index}
             className={`flex ${message.role === 'user' ? 'justify-end' : 'justify-start'}`}
@@ -168,7 +185,7 @@ export default function ChatInterface({ selectedText, documentContext }) {
           </div>
         ))}
 
-        {isLoading && (
+        {isLoading && !messages[messages.length - 1]?.content && (
           <div className="flex justify-start">
             <div className="bg-gray-700 text-white p-3 rounded-2xl">
               <div className="flex items-center space-x-2">
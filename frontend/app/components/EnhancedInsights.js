@@ -2,7 +2,7 @@
 
 import { useState } from 'react'
 import { Lightbulb, Sparkles, Brain, Zap, Target, TrendingUp, BookOpen, MessageSquare } from 'lucide-react'
-import { getInsights, generateAudio } from '../lib/api'
+import { getInsights, streamAudio } from '../lib/api'
 
 export default function EnhancedInsights({ selectedText, onGenerateAudio }) {
   const [insights, setInsights] = useState([])
@@ -32,7 +32,7 @@ export default function EnhancedInsights({ selectedText, onGenerateAudio }) {
     try {
       const outline = insights.map(i => `- ${i.type}: ${i.text}`).join('\n')
       const prompt = `Overview based on selected text and related insights.\nSelected: ${selectedText}\n${outline}`
-      const result = await generateAudio(prompt)
+      const result = await streamAudio(prompt)
       setAudioUrl(result.audio_url)
       if (onGenerateAudio) onGenerateAudio(result.audio_url)
     } catch (error) {
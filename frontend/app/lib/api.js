@@ -73,6 +73,25 @@ export const uploadPDFsSimple = async (files) => {
   }
 }
 
+// Poll an ingestion job until it completes, fails or is cancelled
+export const getUploadJob = async (jobId) => {
+  const response = await api.get(`/upload/jobs/${jobId}`)
+  return response.data
+}
+
+const waitForUploadJob = async (jobId, intervalMs = 1000) => {
+  while (true) {
+    const job = await getUploadJob(jobId)
+    if (job.status === 'completed') {
+      return job
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(`Processing ${job.status}: ${job.files?.map(f => f.error).filter(Boolean).join('; ') || 'no details'}`)
+    }
+    await new Promise(resolve => setTimeout(resolve, intervalMs))
+  }
+}
+
 // Upload multiple PDFs
 export const uploadPDFs = async (files) => {
   try {
@@ -91,8 +110,11 @@ export const uploadPDFs = async (files) => {
       timeout: 300000, // 5 minutes for large files
     })
 
-    console.log('Upload successful:', response.data)
-    return response.data
+    // Sections are extracted in a background job; wait for it to finish
+    console.log('Upload accepted, job:', response.data.job_id)
+    const job = await waitForUploadJob(response.data.job_id)
+    console.log('Upload successful:', job)
+    return job
   } catch (error) {
     console.error('Upload API error:', error)
     
@@ -218,13 +240,79 @@ export const chatWithLLM = async (messages, selectedText = "", documentContext =
   }
 }
 
-// Audio generation
+// Streaming chat: calls onDelta with each piece of the reply as it arrives and
+// resolves with { provider, model, content } once the reply is complete.
+// Aborting `signal` closes the stream, which stops generation on the server.
+export const streamChatWithLLM = async (messages, selectedText = "", documentContext = "", onDelta = () => {}, signal) => {
+  const response = await fetch(`${api.defaults.baseURL}/chat`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify({
+      messages,
+      selected_text: selectedText,
+      document_context: documentContext,
+      stream: true
+    }),
+    signal
+  })
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}))
+    throw new Error(data.detail || 'Chat failed')
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = 'message'
+      let data = ''
+      block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      })
+      if (!data) continue
+      const payload = JSON.parse(data)
+      if (event === 'token') onDelta(payload.delta)
+      else if (event === 'done') return payload
+      else if (event === 'error') throw new Error(payload.detail || 'Chat failed')
+    }
+  }
+  throw new Error('Chat stream ended unexpectedly')
+}
+
+// Streamed audio overview: playback starts after the first sentences are synthesized.
+// Returns { audio_url } pointing at the finished file if cached, else at the progressive stream.
+export const streamAudio = async (text) => {
+  try {
+    const response = await api.post('/audio-stream', { text })
+    const result = response.data
+    return { ...result, audio_url: result.audio_url || result.stream_url }
+  } catch (error) {
+    console.error('Audio stream API error:', error)
+    throw new Error(error.response?.data?.detail || 'Failed to generate audio')
+  }
+}
+
+// Audio generation: cached audio comes back at once, otherwise poll the synthesis job
 export const generateAudio = async (text) => {
   try {
     const response = await api.post('/audio', { text })
-    return response.data
+    let result = response.data
+    while (result.job_id && !result.audio_url) {
+      if (result.status === 'failed') throw new Error(result.error || 'Failed to generate audio')
+      await new Promise(resolve => setTimeout(resolve, 500))
+      result = (await api.get(result.status_url)).data
+    }
+    return result
   } catch (error) {
     console.error('Audio API error:', error)
-    throw new Error(error.response?.data?.detail || 'Failed to generate audio')
+    throw new Error(error.response?.data?.detail || error.message || 'Failed to generate audio')
   }
 }
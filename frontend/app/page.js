@@ -9,7 +9,7 @@ import ChatInterface from './components/ChatInterface'
 import EnhancedInsights from './components/EnhancedInsights'
 import PDFSwitcher from './components/PDFSwitcher'
 import UnifiedSectionsBrowser from './components/UnifiedSectionsBrowser'
-import { uploadPDFs, uploadPDFsSimple, getDocumentSections, getRelatedSectionsForCurrent, getInsights, generateAudio } from './lib/api'
+import { uploadPDFs, uploadPDFsSimple, getDocumentSections, getRelatedSectionsForCurrent, getInsights, streamAudio } from './lib/api'
 
 export default function Home() {
   const [uploadedDocuments, setUploadedDocuments] = useState([])
@@ -92,8 +92,8 @@ export default function Home() {
       const uploadResult = await uploadPDFs([file])
       console.log('Upload result:', uploadResult)
       
-      // Get the filename from the uploaded file
-      const filename = file.name
+      // Use the name the backend stored it under (renamed if another file had this name)
+      const filename = uploadResult.files?.[0]?.filename || file.name
       // Preview using backend-served URL so the viewer can fetch it (after upload)
       setCurrentPDFUrl(`/files/${encodeURIComponent(filename)}`)
       
@@ -166,7 +166,7 @@ export default function Home() {
       if (!selectedText) return
       const outline = insights.map(i => `- ${i.type}: ${i.text}`).join('\n')
       const prompt = `Overview based on selected text and related insights.\nSelected: ${selectedText}\n${outline}`
-      const result = await generateAudio(prompt)
+      const result = await streamAudio(prompt)
       setAudioUrl(result.audio_url)
     } catch (e) {
       alert(e.message || 'Audio generation failed')
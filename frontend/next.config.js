@@ -14,6 +14,10 @@ const nextConfig = {
         source: '/audio/:path*',
         destination: 'http://localhost:8000/audio/:path*',
       },
+      {
+        source: '/audio-stream/:path*',
+        destination: 'http://localhost:8000/audio-stream/:path*',
+      },
     ]
   },
 }